@@ -8,8 +8,8 @@ exec(open(os.path.join(os.path.dirname(__file__), "src", "mekk", "xmind", "versi
 long_description = open("README.txt").read()
 
 classifiers = [
-    "Programming Language :: Python :: 2",
     "Programming Language :: Python :: 3",
+    "Programming Language :: Python :: 3 :: Only",
     "Intended Audience :: Developers",
     "Topic :: Software Development :: Libraries :: Python Modules",
     "License :: OSI Approved :: Mozilla Public License 1.1 (MPL 1.1)",
@@ -37,7 +37,17 @@ setup(name='mekk.xmind',
       test_suite = 'nose.collector',
       include_package_data = True,
       zip_safe=False,
+      # members are streamed with ZipFile.open(..., "w")
+      python_requires='>=3.6',
+      entry_points={
+          'console_scripts': [
+              'mekk-xmind = mekk.xmind.cli:main',
+          ],
+      },
       install_requires=[
           'lxml >= 2.1.1',
       ],
+      extras_require={
+          'numpy': ['numpy'],
+      },
 )
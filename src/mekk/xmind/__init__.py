@@ -2,7 +2,12 @@
 # (c) 2008-2010, Marcin Kasperski
 
 """
-mekk.xmind entry API. Provides XMindDocument class
+mekk.xmind entry API. Provides XMindDocument, StreamingXMindWriter
+and XMindStats classes, diff and merge functions
 """
 
 from .document import XMindDocument, ALL_MARKS as XMIND_MARKS
+from .writer import StreamingXMindWriter
+from .stats import XMindStats
+from .compare import diff
+from .merge import merge
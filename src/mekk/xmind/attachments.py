@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+# (c) 2008-2010, Marcin Kasperski
+
+"""
+Attachments storage. Attachments of parsed maps are read from the
+source archive only when they are actually needed.
+"""
+from __future__ import unicode_literals
+
+import io
+from .stats import phase
+try:
+    from collections.abc import MutableMapping
+except ImportError:        # python 2
+    from collections import MutableMapping
+
+ATTACHMENTS_DIR = "attachments/"
+
+class Attachments(MutableMapping):
+    """
+    Mapping of attachment name (without ``attachments/`` prefix)
+    to attachment data.
+
+    Names are answered from the ZIP central directory, the data
+    of attachments present in the source archive are read on first
+    access (and cached). Attachments created or replaced in memory
+    are kept as given.
+    """
+
+    def __init__(self, archive = None, stats = None):
+        """
+        Arguments
+        ---------
+
+        archive : zipfile.ZipFile (optional)
+            Source archive. Must stay open as long as the not-yet-read
+            attachments are needed.
+        stats : XMindStats (optional)
+            Collects attachment reading statistics.
+        """
+        self.archive = archive
+        self.stats = stats
+        self._members = {}
+        self._loaded = {}
+        if archive is not None:
+            for name in archive.namelist():
+                if name.startswith(ATTACHMENTS_DIR) \
+                        and len(name) > len(ATTACHMENTS_DIR):
+                    self._members[name[len(ATTACHMENTS_DIR):]] = name
+
+    def __getitem__(self, name):
+        data = self._loaded.get(name)
+        if data is None:
+            member = self._members[name]
+            with phase(self.stats, "attachments"):
+                data = self._loaded[name] = self.archive.read(member)
+            if self.stats is not None:
+                self.stats.count("bytes_inflated", len(data))
+        return data
+
+    def __setitem__(self, name, data):
+        self._members.pop(name, None)
+        self._loaded[name] = data
+
+    def __delitem__(self, name):
+        found = self._members.pop(name, None) is not None
+        found = (self._loaded.pop(name, None) is not None) or found
+        if not found:
+            raise KeyError(name)
+
+    def __iter__(self):
+        for name in self._members:
+            yield name
+        for name in self._loaded:
+            if name not in self._members:
+                yield name
+
+    def __len__(self):
+        return len(self._members) + sum(
+            1 for name in self._loaded if name not in self._members)
+
+    def __contains__(self, name):
+        return name in self._members or name in self._loaded
+
+    def source_member(self, name):
+        """
+        Returns name of source archive member holding (unchanged)
+        attachment of given name, or None if the attachment was
+        created or replaced after the map was opened.
+        """
+        return self._members.get(name)
+
+    def is_loaded(self, name):
+        """
+        Checks whether attachment data are already kept in memory.
+        """
+        return name in self._loaded
+
+    def open(self, name):
+        """
+        Returns file-like object (opened for binary reading) giving
+        attachment data. Attachments not yet loaded are streamed
+        from the source archive (and not cached).
+        """
+        data = self._loaded.get(name)
+        if data is None:
+            return self.archive.open(self._members[name])
+        return io.BytesIO(data)
+
+    def load_all(self):
+        """
+        Read all remaining attachments into memory (so source
+        archive is no longer needed).
+        """
+        for name in list(self._members):
+            self.__getitem__(name)
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+# (c) 2008-2010, Marcin Kasperski
+
+"""
+Processing many maps in parallel (using process pool).
+"""
+from __future__ import unicode_literals
+
+from collections import namedtuple, deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+import inspect
+import multiprocessing
+import traceback
+from .document import XMindDocument
+
+BatchResult = namedtuple("BatchResult", ["path", "value", "error"])
+BatchResult.__doc__ = """
+Result of processing single file by map_files or map_paths.
+
+path : string
+    Processed file
+value : any
+    Value returned by processing function (None on error)
+error : string
+    None on success, formatted traceback on failure
+"""
+
+class _OpenAndCall(object):
+    """
+    Picklable wrapper used by map_files: opens the map and calls
+    ``func(doc, path)``.
+    """
+    def __init__(self, func, open_options):
+        self.func = func
+        self.open_options = open_options
+
+    def __call__(self, path):
+        doc = XMindDocument.open(path, **self.open_options)
+        try:
+            return self.func(doc, path)
+        finally:
+            doc.close()
+
+def _process_path(func, path):
+    """
+    Call func on single path, capturing any error.
+    """
+    try:
+        return BatchResult(path, func(path), None)
+    except Exception:
+        return BatchResult(path, None, traceback.format_exc())
+
+def _process_chunk(func, paths):
+    """
+    Process group of files (single pool task).
+    """
+    return [_process_path(func, path) for path in paths]
+
+def _failed_chunk(paths, error):
+    """
+    Results for group of files whose task failed as a whole (worker
+    crashed, result could not be sent back etc).
+    """
+    message = "".join(traceback.format_exception(
+        type(error), error, error.__traceback__))
+    return [BatchResult(path, None, message) for path in paths]
+
+def _chunks(paths, chunksize):
+    chunk = []
+    for path in paths:
+        chunk.append(path)
+        if len(chunk) >= chunksize:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _check_open_options(open_options):
+    """
+    Raises TypeError if open_options contain keywords not accepted
+    by XMindDocument.open (better than failing on every file).
+    """
+    try:
+        accepted = set(inspect.signature(XMindDocument.open).parameters)
+    except AttributeError:      # python 2
+        accepted = set(inspect.getargspec(XMindDocument.open).args)
+    accepted.discard("filename")
+    unknown = sorted(set(open_options) - accepted)
+    if unknown:
+        raise TypeError("Unknown XMindDocument.open options: %s"
+                        % ", ".join(unknown))
+
+def map_files(func, paths, workers = None, chunksize = 1, ordered = True,
+              **open_options):
+    """
+    Open every map from paths and call ``func(doc, path)`` on it,
+    spreading the work over ``workers`` processes. Yields BatchResult
+    for every file. Errors (while opening or processing) don't stop
+    the batch, they are reported in results.
+
+    >>> def outline(doc, path):
+    ...     return doc.get_first_sheet().get_root_topic().get_title()
+    >>> for result in map_files(outline, file_names, workers = 8):
+    ...     print(result.path, result.value or result.error)
+
+    Arguments
+    ---------
+
+    func : callable
+        Processing function, called with opened XMindDocument and its
+        path. Must be picklable (defined at module level), as should be
+        its return value. It can save the document or anything else.
+    paths : iterable
+        Names of files to process
+    workers : int (optional)
+        Number of worker processes (by default number of CPUs). With
+        1 (or 0) files are processed in the calling process.
+    chunksize : int (default 1)
+        Number of files sent to the worker at once. Larger chunks reduce
+        inter-process traffic for many small files.
+    ordered : bool (default True)
+        Yield results in the order of paths. If False, results are
+        yielded as soon as they are ready.
+    open_options :
+        Keyword arguments passed to ``XMindDocument.open``
+        (for example ``read_only = True``)
+    """
+    _check_open_options(open_options)
+    return map_paths(_OpenAndCall(func, open_options), paths,
+                     workers, chunksize, ordered)
+
+def map_paths(func, paths, workers = None, chunksize = 1, ordered = True):
+    """
+    Call ``func(path)`` for every path, spreading the work over
+    ``workers`` processes. Works like map_files (and takes the same
+    arguments) but leaves opening files to func, so can be used for
+    any per-file processing (for example converting other formats
+    into maps).
+
+    At most two tasks per worker are queued at any time, so paths
+    can be long (or endless) iterable. Tasks not yet started are
+    cancelled if iteration is abandoned.
+
+    If the whole task fails (for example func result can't be pickled,
+    or worker process dies), every file of the task gets error result.
+    Crashed pool is replaced by new one, files queued in the old pool
+    are reported as failed.
+    """
+    if chunksize < 1:
+        raise ValueError("chunksize must be positive")
+    if workers is not None and workers <= 1:
+        for path in paths:
+            yield _process_path(func, path)
+        return
+
+    workers = workers or multiprocessing.cpu_count()
+    chunks = _chunks(paths, chunksize)
+    # (future, chunk, executor) of queued tasks
+    pending = deque()
+    executor = ProcessPoolExecutor(max_workers = workers)
+    try:
+        while True:
+            for chunk in chunks:
+                try:
+                    future = executor.submit(_process_chunk, func, chunk)
+                except BrokenProcessPool:
+                    executor.shutdown(wait = False)
+                    executor = ProcessPoolExecutor(max_workers = workers)
+                    future = executor.submit(_process_chunk, func, chunk)
+                pending.append((future, chunk, executor))
+                if len(pending) >= 2 * workers:
+                    break
+            if not pending:
+                break
+            if ordered:
+                done = [pending.popleft()]
+            else:
+                finished = wait([task[0] for task in pending],
+                                return_when = FIRST_COMPLETED)[0]
+                done = [task for task in pending if task[0] in finished]
+                for task in done:
+                    pending.remove(task)
+            for future, chunk, task_executor in done:
+                try:
+                    results = future.result()
+                except BrokenProcessPool as error:
+                    if task_executor is executor:
+                        executor.shutdown(wait = False)
+                        executor = ProcessPoolExecutor(max_workers = workers)
+                    results = _failed_chunk(chunk, error)
+                except Exception as error:
+                    results = _failed_chunk(chunk, error)
+                for result in results:
+                    yield result
+    finally:
+        for task in pending:
+            task[0].cancel()
+        executor.shutdown()
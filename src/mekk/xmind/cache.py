@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+# (c) 2008-2010, Marcin Kasperski
+
+"""
+On-disk cache of parsed topic records (see ``streaming.iter_topics``),
+so repeated scans of unchanged maps don't parse XML at all.
+"""
+from __future__ import unicode_literals
+
+import hashlib
+import os
+import tempfile
+import zipfile
+from six.moves import cPickle as pickle
+from . import streaming
+from .streaming import TopicRecord, CONTENT_MEMBER
+
+CACHE_FORMAT = 1
+DEFAULT_CACHE_SIZE = 256 * 1024 * 1024
+CACHE_SUFFIX = ".topics"
+
+_BATCH_SIZE = 1000
+_replace = getattr(os, "replace", os.rename)    # python 2
+
+class TopicCache(object):
+    """
+    Directory keeping topic records of parsed maps. Entries are keyed
+    by map path, size, modification time and content.xml CRC (read
+    from ZIP directory, so checking the key does not inflate anything),
+    modified maps are parsed again. Least recently used entries are
+    removed once the cache grows over max_size bytes.
+
+    Entries are written and read in batches, so - as with plain
+    ``iter_topics`` - memory usage does not depend on the map size.
+    Many processes can share the same cache directory.
+
+    >>> cache = TopicCache("/var/cache/xmind")
+    >>> for rec in cache.iter_topics("big.xmind"):
+    ...     print(rec.depth, rec.title)
+    """
+
+    def __init__(self, cache_dir, max_size = DEFAULT_CACHE_SIZE):
+        """
+        Arguments
+        ---------
+
+        cache_dir : string
+            Cache directory (created if missing)
+        max_size : int (optional)
+            Total size (in bytes) of cache entries
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def key(self, path):
+        """
+        Returns cache key of given map file (None if it has no content).
+        """
+        info = os.stat(path)
+        with zipfile.ZipFile(path, "r") as archive:
+            try:
+                crc = archive.getinfo(CONTENT_MEMBER).CRC
+            except KeyError:
+                return None
+        description = "%d|%s|%d|%r|%d" % (
+            CACHE_FORMAT, os.path.abspath(path), info.st_size,
+            info.st_mtime, crc)
+        return hashlib.sha1(description.encode("utf-8")).hexdigest()
+
+    def entry_path(self, key):
+        """
+        Name of file keeping entry of given key.
+        """
+        return os.path.join(self.cache_dir, key + CACHE_SUFFIX)
+
+    def iter_topics(self, path):
+        """
+        Yields TopicRecord for every topic of given map (see
+        ``streaming.iter_topics``), from cache if possible, otherwise
+        parsing the map (and saving records in the cache).
+        """
+        key = self.key(path)
+        if key is None:
+            return streaming.iter_topics(path)
+        entry = self.entry_path(key)
+        try:
+            stream = open(entry, "rb")
+        except (IOError, OSError):
+            return self._parse_and_store(path, entry)
+        return self._read(stream, entry)
+
+    def _read(self, stream, entry):
+        """
+        Yields records saved in cache entry.
+        """
+        with stream:
+            try:
+                os.utime(entry, None)     # mark as recently used
+            except OSError:
+                pass
+            while True:
+                try:
+                    batch = pickle.load(stream)
+                except EOFError:
+                    break
+                for item in batch:
+                    yield TopicRecord._make(item)
+
+    def _parse_and_store(self, path, entry):
+        """
+        Yields records parsed from the map, writing them to cache entry.
+        Entry is created only if all records were read.
+        """
+        handle, temp_name = tempfile.mkstemp(suffix = ".tmp",
+                                             dir = self.cache_dir)
+        stored = False
+        try:
+            with os.fdopen(handle, "wb") as output:
+                batch = []
+                for record in streaming.iter_topics(path):
+                    batch.append(tuple(record))
+                    if len(batch) >= _BATCH_SIZE:
+                        pickle.dump(batch, output, pickle.HIGHEST_PROTOCOL)
+                        batch = []
+                    yield record
+                if batch:
+                    pickle.dump(batch, output, pickle.HIGHEST_PROTOCOL)
+            _replace(temp_name, entry)
+            stored = True
+        finally:
+            if not stored:
+                try:
+                    os.remove(temp_name)
+                except OSError:
+                    pass
+        self.evict()
+
+    def evict(self):
+        """
+        Remove least recently used entries until the cache fits
+        in max_size.
+        """
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(CACHE_SUFFIX):
+                full_name = os.path.join(self.cache_dir, name)
+                try:
+                    info = os.stat(full_name)
+                except OSError:
+                    continue        # removed by other process
+                entries.append((info.st_mtime, info.st_size, full_name))
+        total = sum(size for mtime, size, name in entries)
+        for mtime, size, name in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(name)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        """
+        Remove all entries.
+        """
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(CACHE_SUFFIX):
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except OSError:
+                    pass
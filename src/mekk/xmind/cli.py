@@ -0,0 +1,380 @@
+# -*- coding: utf-8 -*-
+# (c) 2008-2010, Marcin Kasperski
+
+"""
+mekk-xmind command line tool: bulk export, import, statistics
+and timings of XMind maps.
+
+    mekk-xmind dump -f markdown -o outdir/ *.xmind
+    mekk-xmind build -f csv -o outdir/ *.csv
+    mekk-xmind stats -j 8 archive/*.xmind
+    mekk-xmind bench big.xmind
+"""
+from __future__ import print_function, unicode_literals
+
+import argparse
+import csv
+import io
+import itertools
+import json
+import os
+import sys
+import time
+import zipfile
+from functools import partial
+from lxml import etree
+from .attachments import ATTACHMENTS_DIR
+from .batch import map_files, map_paths
+from .document import XMindDocument
+from .writer import StreamingXMindWriter
+
+DUMP_EXTENSIONS = {
+    "json": ".json",
+    "opml": ".opml",
+    "markdown": ".md",
+}
+CSV_COLUMNS = ["depth", "title", "note", "label", "link", "markers"]
+
+########################################################################
+# Conversions
+########################################################################
+
+def _topic_node(topic, detached = False):
+    """
+    Describe single topic (without children) as dictionary
+    (in format accepted by Topic.add_subtree).
+    """
+    node = {"title": topic.get_title()}
+    for key, value in [("embedded_id", topic.get_embedded_id()),
+                       ("note", topic.get_note()),
+                       ("label", topic.get_label()),
+                       ("link", topic.get_link())]:
+        if value is not None:
+            node[key] = value
+    markers = list(topic.get_markers())
+    if markers:
+        node["markers"] = markers
+    if detached:
+        node["detached"] = True
+    return node
+
+def topic_to_data(topic):
+    """
+    Describe topic with all its descendants as nested dictionaries
+    (in format accepted by Topic.add_subtree).
+    """
+    root = _topic_node(topic)
+    stack = [(topic, root)]
+    while stack:
+        parent, node = stack.pop()
+        for detached in (False, True):
+            for subtopic in parent.get_subtopics(detached):
+                child = _topic_node(subtopic, detached)
+                node.setdefault("children", []).append(child)
+                stack.append((subtopic, child))
+    return root
+
+def document_to_data(doc):
+    """
+    Describe whole map as list of ``{"title": ..., "topic": ...}``
+    dictionaries (one per sheet).
+    """
+    return [{"title": sheet.get_title(),
+             "topic": topic_to_data(sheet.get_root_topic())}
+            for sheet in doc.get_all_sheets()]
+
+def _iter_nodes(node):
+    """
+    Yields (depth, node) pairs for node and its descendants in
+    document order.
+    """
+    stack = [(0, node)]
+    while stack:
+        depth, node = stack.pop()
+        yield depth, node
+        for child in reversed(node.get("children", [])):
+            stack.append((depth + 1, child))
+
+def data_to_markdown(sheets):
+    """
+    Render map description (see document_to_data) as Markdown
+    (nested lists, one section per sheet).
+    """
+    lines = []
+    for sheet in sheets:
+        lines.append("# %s" % (sheet["title"] or ""))
+        lines.append("")
+        for depth, node in _iter_nodes(sheet["topic"]):
+            indent = "  " * depth
+            text = node.get("title") or ""
+            if node.get("label"):
+                text += " [%s]" % node["label"]
+            if node.get("link"):
+                text = "[%s](%s)" % (text, node["link"])
+            lines.append("%s- %s" % (indent, text))
+            if node.get("note"):
+                for line in node["note"].split("\n"):
+                    lines.append("%s  > %s" % (indent, line))
+        lines.append("")
+    return "\n".join(lines)
+
+def data_to_opml(sheets):
+    """
+    Render map description (see document_to_data) as OPML 2.0
+    (sheet root topics are top-level outlines).
+    """
+    opml = etree.Element("opml", version = "2.0")
+    head = etree.SubElement(opml, "head")
+    etree.SubElement(head, "title").text = sheets and sheets[0]["title"] or ""
+    body = etree.SubElement(opml, "body")
+    for sheet in sheets:
+        parents = [body]
+        for depth, node in _iter_nodes(sheet["topic"]):
+            del parents[depth + 1:]
+            outline = etree.SubElement(parents[depth], "outline",
+                                       text = node.get("title") or "")
+            if node.get("note"):
+                outline.set("_note", node["note"])
+            if node.get("link"):
+                outline.set("url", node["link"])
+            parents.append(outline)
+    return etree.tostring(opml, encoding = "utf-8", xml_declaration = True,
+                          pretty_print = True).decode("utf-8")
+
+def _data_to_json(sheets):
+    return json.dumps(sheets, indent = 2, ensure_ascii = False)
+
+_DUMPERS = {
+    "json": _data_to_json,
+    "opml": data_to_opml,
+    "markdown": data_to_markdown,
+}
+
+def _csv_records(stream):
+    """
+    Read CSV file (see CSV_COLUMNS, header row is required) as
+    records accepted by StreamingXMindWriter.write_records.
+    """
+    for row in csv.DictReader(stream):
+        properties = {}
+        for key in ("note", "label", "link"):
+            if row.get(key):
+                properties[key] = row[key]
+        if row.get("markers"):
+            properties["markers"] = row["markers"].split(";")
+        yield int(row["depth"]), row["title"], properties
+
+########################################################################
+# Per-file actions (run in worker processes)
+########################################################################
+
+def _output_name(path, output_dir, extension):
+    base = os.path.splitext(os.path.basename(path))[0] + extension
+    return os.path.join(output_dir or os.path.dirname(path), base)
+
+def _output_clash(paths, output_dir, extension):
+    """
+    Returns error message if two of paths would be written to the same
+    output file (for example a/x.json and b/x.json with -o), None
+    otherwise.
+    """
+    seen = {}
+    for path in paths:
+        name = _output_name(path, output_dir, extension)
+        key = os.path.normcase(os.path.abspath(name))
+        if key in seen:
+            return "%s and %s would both be written to %s" % (
+                seen[key], path, name)
+        seen[key] = path
+    return None
+
+def _dump_file(doc, path, output_format, output_dir):
+    text = _DUMPERS[output_format](document_to_data(doc))
+    if output_dir is None:
+        return text
+    name = _output_name(path, output_dir, DUMP_EXTENSIONS[output_format])
+    with io.open(name, "w", encoding = "utf-8") as output:
+        output.write(text)
+    return name
+
+def _build_file(path, input_format, output_dir):
+    name = _output_name(path, output_dir, ".xmind")
+    if input_format == "json":
+        with io.open(path, "r", encoding = "utf-8") as source:
+            data = json.load(source)
+        if isinstance(data, dict):
+            data = [{"title": None, "topic": data}]
+        if not data:
+            raise ValueError("No sheets in %s" % path)
+        doc = XMindDocument.create()
+        for sheet in data:
+            doc.create_sheet_from(sheet["topic"], sheet.get("title"))
+        doc.save(name, compression = zipfile.ZIP_DEFLATED)
+    else:
+        with io.open(path, "r", encoding = "utf-8", newline = "") as source:
+            records = _csv_records(source)
+            first = next(records, None)
+            if first is None:
+                raise ValueError("No topics in %s" % path)
+            with StreamingXMindWriter(
+                    name, compression = zipfile.ZIP_DEFLATED) as writer:
+                writer.write_records(itertools.chain([first], records))
+    return name
+
+def _file_stats(path, cache_dir = None):
+    sheets = topics = max_depth = 0
+    for record in XMindDocument.iter_topics(path, cache_dir):
+        topics += 1
+        if record.depth == 0:
+            sheets += 1
+        max_depth = max(max_depth, record.depth)
+    with zipfile.ZipFile(path, "r") as archive:
+        attachments = sum(1 for name in archive.namelist()
+                          if name.startswith(ATTACHMENTS_DIR)
+                          and name != ATTACHMENTS_DIR)
+    return {"sheets": sheets, "topics": topics,
+            "attachments": attachments, "max_depth": max_depth}
+
+def _timed(func, *args):
+    start = time.time()
+    result = func(*args)
+    return result, (time.time() - start) * 1000.0
+
+def _count_topics(doc):
+    return sum(1 for sheet in doc.get_all_sheets()
+               for item in sheet.iter_all_topics())
+
+def _bench_file(path):
+    doc, open_ms = _timed(XMindDocument.open, path)
+    topics, traverse_ms = _timed(_count_topics, doc)
+    data, save_ms = _timed(doc.to_bytes)
+    doc.close()
+    _, stream_ms = _timed(lambda: sum(1 for _ in XMindDocument.iter_topics(path)))
+    return {"topics": topics, "bytes": len(data),
+            "open_ms": open_ms, "traverse_ms": traverse_ms,
+            "save_ms": save_ms, "stream_ms": stream_ms}
+
+########################################################################
+# Command line
+########################################################################
+
+def _report(results, show):
+    """
+    Print results (via show for successes, to stderr for errors).
+    Returns process exit code.
+    """
+    failed = False
+    for result in results:
+        if result.error is not None:
+            failed = True
+            print("%s: ERROR\n%s" % (result.path, result.error),
+                  file = sys.stderr)
+        else:
+            show(result)
+    return failed and 1 or 0
+
+def _check_outputs(args, extension):
+    """
+    Prints error and returns exit code if outputs of args.files clash,
+    returns None if they don't.
+    """
+    clash = _output_clash(args.files, args.output, extension)
+    if clash is not None:
+        print("mekk-xmind: error: %s" % clash, file = sys.stderr)
+        return 2
+    return None
+
+def _cmd_dump(args):
+    if args.output is not None:
+        failed = _check_outputs(args, DUMP_EXTENSIONS[args.format])
+        if failed is not None:
+            return failed
+
+    def show(result):
+        if args.output is None:
+            print(result.value)
+        else:
+            print("%s -> %s" % (result.path, result.value))
+    return _report(
+        map_files(partial(_dump_file, output_format = args.format,
+                          output_dir = args.output),
+                  args.files, workers = args.jobs, read_only = True),
+        show)
+
+def _cmd_build(args):
+    failed = _check_outputs(args, ".xmind")
+    if failed is not None:
+        return failed
+    return _report(
+        map_paths(partial(_build_file, input_format = args.format,
+                          output_dir = args.output),
+                  args.files, workers = args.jobs),
+        lambda result: print("%s -> %s" % (result.path, result.value)))
+
+def _cmd_stats(args):
+    return _report(
+        map_paths(partial(_file_stats, cache_dir = args.cache),
+                  args.files, workers = args.jobs),
+        lambda result: print(
+            "%(path)s: sheets=%(sheets)d topics=%(topics)d "
+            "attachments=%(attachments)d max_depth=%(max_depth)d"
+            % dict(result.value, path = result.path)))
+
+def _cmd_bench(args):
+    return _report(
+        map_paths(_bench_file, args.files, workers = args.jobs),
+        lambda result: print(
+            "%(path)s: topics=%(topics)d bytes=%(bytes)d "
+            "open=%(open_ms).1fms traverse=%(traverse_ms).1fms "
+            "save=%(save_ms).1fms stream=%(stream_ms).1fms"
+            % dict(result.value, path = result.path)))
+
+def _parser():
+    parser = argparse.ArgumentParser(
+        prog = "mekk-xmind",
+        description = "Bulk processing of XMind maps.")
+    subparsers = parser.add_subparsers(dest = "command")
+
+    def add_command(name, help_text, func):
+        command = subparsers.add_parser(name, help = help_text)
+        command.add_argument("files", nargs = "+", metavar = "FILE")
+        command.add_argument("-j", "--jobs", type = int, default = 1,
+                             help = "number of parallel processes")
+        command.set_defaults(func = func)
+        return command
+
+    dump = add_command("dump", "export maps to JSON, OPML or Markdown",
+                       _cmd_dump)
+    dump.add_argument("-f", "--format", choices = sorted(DUMP_EXTENSIONS),
+                      default = "json")
+    dump.add_argument("-o", "--output", metavar = "DIR",
+                      help = "output directory (default: print)")
+
+    build = add_command("build", "create maps from JSON or CSV files",
+                        _cmd_build)
+    build.add_argument("-f", "--format", choices = ["csv", "json"],
+                       default = "json")
+    build.add_argument("-o", "--output", metavar = "DIR",
+                       help = "output directory (default: next to input)")
+
+    stats = add_command("stats", "report topic, attachment and depth counts",
+                        _cmd_stats)
+    stats.add_argument("--cache", metavar = "DIR",
+                       help = "cache parsed topics in this directory")
+    add_command("bench", "report parse, traverse and save timings",
+                _cmd_bench)
+    return parser
+
+def main(argv = None):
+    """
+    Console script entry point.
+    """
+    parser = _parser()
+    args = parser.parse_args(argv)
+    if getattr(args, "func", None) is None:
+        parser.print_help()
+        return 2
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
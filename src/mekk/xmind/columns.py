@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+# (c) 2008-2010, Marcin Kasperski
+
+"""
+Columnar (array based) representation of topic trees, for analytics.
+"""
+from __future__ import unicode_literals
+
+from array import array
+from lxml import etree
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    array("Q")
+    BITMAP_TYPECODE = "Q"
+except ValueError:         # python 2
+    BITMAP_TYPECODE = "L"
+
+class _StringTable(object):
+    """
+    Interning helper: assigns consecutive numbers to distinct strings.
+    """
+    def __init__(self):
+        self.strings = []
+        self._numbers = {}
+
+    def number(self, text):
+        if text is None:
+            return -1
+        number = self._numbers.get(text)
+        if number is None:
+            number = self._numbers[text] = len(self.strings)
+            self.strings.append(text)
+        return number
+
+class TopicColumns(object):
+    """
+    Topics of a sheet as parallel columns, one entry per topic,
+    in document order (pre-order, so parents always precede their
+    children; index 0 is sheet root topic).
+
+    Attributes
+    ----------
+
+    ids : list
+        XMind topic identifiers
+    parent : array of int
+        Index of the parent topic (-1 for the root)
+    depth : array of int
+        Topic depth (0 for the root)
+    detached : array of int
+        1 for detached topics, 0 otherwise
+    title : array of int
+        Index in titles table (-1 if topic has no title)
+    titles : list
+        Distinct titles
+    label : array of int
+        Index in labels table (-1 if topic has no label)
+    labels : list
+        Distinct labels
+    markers : array of int
+        Marker bitmap: bit i is set if topic has marker
+        ``marker_names[i]``
+    marker_names : list
+        Marker identifiers of bitmap bits (``ALL_MARKS``)
+    other_markers : dict
+        Topic index to list of markers not present in marker_names
+    """
+
+    def __init__(self, marker_names):
+        self.marker_names = list(marker_names)
+        self.ids = []
+        self.parent = array("l")
+        self.depth = array("l")
+        self.detached = array("b")
+        self.title = array("l")
+        self.label = array("l")
+        self.markers = array(BITMAP_TYPECODE)
+        self.other_markers = {}
+        self._titles = _StringTable()
+        self._labels = _StringTable()
+
+    @property
+    def titles(self):
+        return self._titles.strings
+
+    @property
+    def labels(self):
+        return self._labels.strings
+
+    @classmethod
+    def from_topic(cls, doc, topic_tag, marker_names):
+        """
+        Build columns for given topic element and its descendants
+        (single pass over the XML tree).
+        """
+        columns = cls(marker_names)
+        bits = dict((name, 1 << i)
+                    for i, name in enumerate(columns.marker_names))
+        names = dict((name, doc.full_name(name)) for name in
+                     ["topic", "title", "labels", "label",
+                      "marker-refs", "marker-ref"])
+        ids = columns.ids
+        parent, depth, detached = \
+            columns.parent, columns.depth, columns.detached
+        title, label, markers = columns.title, columns.label, columns.markers
+        title_number = columns._titles.number
+        label_number = columns._labels.number
+
+        topic_name, title_name, label_name = \
+            names["topic"], names["title"], names["label"]
+        # Topic properties are filled when their elements are met
+        # (placeholders are appended when topic starts)
+        stack = []                      # (index, element) of open topics
+        skipped = None
+        walker = etree.iterwalk(
+            topic_tag, events = ("start", "end"),
+            tag = (topic_name, title_name, label_name, names["marker-ref"]))
+        for event, element in walker:
+            tag = element.tag
+            if event == "end":
+                if tag != topic_name:
+                    pass
+                elif element is skipped:
+                    skipped = None
+                else:
+                    stack.pop()
+                continue
+            if tag == topic_name:
+                kind = element.getparent().get("type") if stack else None
+                if kind not in (None, "attached", "detached"):
+                    walker.skip_subtree()   # not a subtopic (see Topic.walk)
+                    skipped = element
+                    continue
+                index = len(ids)
+                ids.append(element.get("id"))
+                parent.append(stack[-1][0] if stack else -1)
+                depth.append(len(stack))
+                detached.append(kind == "detached")
+                title.append(-1)
+                label.append(-1)
+                markers.append(0)
+                stack.append((index, element))
+                continue
+            if not stack:
+                continue
+            index, topic = stack[-1]
+            container = element.getparent()
+            if tag == title_name:
+                if container is topic and title[index] < 0:
+                    title[index] = title_number(element.text)
+            elif tag == label_name:
+                if container.getparent() is topic and label[index] < 0:
+                    label[index] = label_number(element.text)
+            elif container.getparent() is topic:      # marker-ref
+                marker = element.get("marker-id")
+                bit = bits.get(marker)
+                if bit is None:
+                    columns.other_markers.setdefault(index, []).append(marker)
+                else:
+                    markers[index] |= bit
+        return columns
+
+    def __len__(self):
+        return len(self.ids)
+
+    def has_marker(self, marker):
+        """
+        Returns list of 0/1 flags: whether topic has given marker.
+        """
+        if marker not in self.marker_names:
+            return [int(marker in self.other_markers.get(index, ()))
+                    for index in range(len(self.ids))]
+        bit = 1 << self.marker_names.index(marker)
+        return [int(bool(bitmap & bit)) for bitmap in self.markers]
+
+    def get_markers(self, index):
+        """
+        Returns list of markers of topic of given index (bitmap
+        markers first, in marker_names order).
+        """
+        bitmap = self.markers[index]
+        markers = [name for i, name in enumerate(self.marker_names)
+                   if bitmap >> i & 1]
+        return markers + self.other_markers.get(index, [])
+
+    def subtree_sizes(self):
+        """
+        Returns array of subtree sizes (topic itself and all its
+        descendants) of every topic.
+        """
+        if numpy is not None:
+            return array("l", self.to_numpy()["subtree_size"].tolist())
+        sizes = array("l", [1]) * len(self.ids)
+        parent = self.parent
+        for index in range(len(sizes) - 1, 0, -1):
+            sizes[parent[index]] += sizes[index]
+        return sizes
+
+    def to_numpy(self):
+        """
+        Returns dictionary of NumPy arrays: parent, depth, detached,
+        title, label, markers (see class attributes), title_length
+        and subtree_size. Requires numpy.
+        """
+        if numpy is None:
+            raise ImportError("to_numpy requires numpy")
+        parent = numpy.frombuffer(self.parent, dtype = self.parent.typecode)
+        depth = numpy.frombuffer(self.depth, dtype = self.depth.typecode)
+        title = numpy.frombuffer(self.title, dtype = self.title.typecode)
+        lengths = numpy.array([len(text) for text in self.titles] + [0],
+                              dtype = "l")
+
+        # children are summed into parents level by level, deepest first
+        sizes = numpy.ones(len(self.ids), dtype = "l")
+        if len(self.ids):
+            for level in range(int(depth.max()), 0, -1):
+                selected = depth == level
+                numpy.add.at(sizes, parent[selected], sizes[selected])
+
+        return {
+            "parent": parent,
+            "depth": depth,
+            "detached": numpy.frombuffer(self.detached, dtype = "b"),
+            "title": title,
+            "label": numpy.frombuffer(self.label, dtype = self.label.typecode),
+            "markers": numpy.frombuffer(self.markers,
+                                        dtype = self.markers.typecode),
+            "title_length": lengths[title],
+            "subtree_size": sizes,
+        }
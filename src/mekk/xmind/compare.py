@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+# (c) 2008-2010, Marcin Kasperski
+
+"""
+Structural comparison of two maps (topics are matched on their
+correlation ids, see Topic.get_correlation_id).
+"""
+from __future__ import unicode_literals
+
+from collections import namedtuple
+from .id_gen import unique_id
+
+ADDED = "added"
+REMOVED = "removed"
+MOVED = "moved"
+RETITLED = "retitled"
+REMARKED = "remarked"
+
+TopicChange = namedtuple(
+    "TopicChange", ["kind", "key", "topic_id", "old", "new"])
+TopicChange.__doc__ = """
+Single difference between two maps, as yielded by diff.
+
+kind : string
+    One of ADDED, REMOVED, MOVED, RETITLED, REMARKED
+key : string
+    Topic correlation id (see Topic.get_correlation_id)
+topic_id : string
+    XMind identifier of the topic (in the second map, in the first
+    one for removed topics)
+old, new :
+    Compared values: title (ADDED, REMOVED - one of them is None),
+    ``(parent key, detached)`` pair (MOVED, parent key of sheet root
+    topic is None), title (RETITLED), tuple of markers (REMARKED)
+"""
+
+class _Snapshot(object):
+    """
+    Topics of a map, as columns (see TopicColumns) of every sheet
+    plus dictionary correlation id -> (sheet columns, index).
+    """
+
+    def __init__(self, doc):
+        self.order = []                 # (sheet columns, keys)
+        self.positions = {}
+        for sheet in doc.get_all_sheets():
+            columns = doc.to_arrays(sheet)
+            keys = [unique_id(topic_id) for topic_id in columns.ids]
+            self.order.append((columns, keys))
+            self.positions.update(
+                (key, (columns, keys, index))
+                for index, key in enumerate(keys))
+
+def _parent(columns, keys, index):
+    """
+    Parent (parent key, detached) of topic of given index.
+    """
+    parent_index = columns.parent[index]
+    return (keys[parent_index] if parent_index >= 0 else None,
+            bool(columns.detached[index]))
+
+def _title(columns, index):
+    title = columns.title[index]
+    return columns.titles[title] if title >= 0 else None
+
+def _markers(columns, index):
+    """
+    Comparable representation of topic markers (bitmap, set of markers
+    outside the bitmap).
+    """
+    return (columns.markers[index],
+            frozenset(columns.other_markers.get(index, ())))
+
+def diff(doc_a, doc_b):
+    """
+    Compare two maps (for example older and newer version of the
+    same map), yields TopicChange records: first changes of topics
+    present in doc_b (ADDED, MOVED, RETITLED, REMARKED, in doc_b
+    order), then REMOVED topics (in doc_a order).
+
+    Topics are matched on correlation ids with dictionary lookups,
+    so the cost grows linearly with map size. Topics are moved if
+    their parent changed (or they became detached/attached), changed
+    order among siblings is not reported. Markers are compared as sets.
+
+    >>> for change in diff(old_doc, new_doc):
+    ...     print(change.kind, change.key, change.old, change.new)
+    """
+    snapshot_a = _Snapshot(doc_a)
+    snapshot_b = _Snapshot(doc_b)
+    positions_a = snapshot_a.positions
+    for columns, keys in snapshot_b.order:
+        ids = columns.ids
+        for index, key in enumerate(keys):
+            found = positions_a.get(key)
+            if found is None:
+                yield TopicChange(ADDED, key, ids[index], None,
+                                  _title(columns, index))
+                continue
+            old_columns, old_keys, old_index = found
+            old, new = _parent(old_columns, old_keys, old_index), \
+                _parent(columns, keys, index)
+            if old != new:
+                yield TopicChange(MOVED, key, ids[index], old, new)
+            old, new = _title(old_columns, old_index), _title(columns, index)
+            if old != new:
+                yield TopicChange(RETITLED, key, ids[index], old, new)
+            if columns.markers[index] != old_columns.markers[old_index] \
+                    or index in columns.other_markers \
+                    or old_index in old_columns.other_markers:
+                if _markers(old_columns, old_index) \
+                        != _markers(columns, index):
+                    yield TopicChange(
+                        REMARKED, key, ids[index],
+                        tuple(old_columns.get_markers(old_index)),
+                        tuple(columns.get_markers(index)))
+    positions_b = snapshot_b.positions
+    for columns, keys in snapshot_a.order:
+        for index, key in enumerate(keys):
+            if key not in positions_b:
+                yield TopicChange(REMOVED, key, columns.ids[index],
+                                  _title(columns, index), None)
@@ -7,30 +7,53 @@ Create and parse XMind maps.
 from __future__ import print_function, unicode_literals
 
 from lxml import etree
+from xml.sax.saxutils import quoteattr
 import zipfile
-from .id_gen import IdGen, qualify_id, unique_id
+from .id_gen import IdGen, PFX_OTHER, qualify_id, unique_id, \
+    unique_prefix
 from .xmlutil import XmlHelper, ns_name, \
-    CONTENT_NSMAP, STYLES_NSMAP, find_xpath
+    CONTENT_NSMAP, STYLES_NSMAP
+from .attachments import Attachments, ATTACHMENTS_DIR
+from .stats import phase
+from .search import SearchIndex, SEARCH_INDEX_MEMBER
+from .lazy import LazyContent
+from .columns import TopicColumns
+from . import cache, streaming
+import collections
+import copy
+import io
 import logging
+import mimetypes
+import os
+import re
+import shutil
 import six
+import struct
+import weakref
 
 log = logging.getLogger(__name__)
 
 DUMP_PARSED_DATA = False
 
-ATTACHMENTS_DIR = "attachments/"
+CONTENT_MEMBER = "content.xml"
+STYLES_MEMBER = "styles.xml"
+META_MEMBER = "meta.xml"
+MANIFEST_MEMBER = "META-INF/manifest.xml"
+MARKERS_DIR = "markers/"
 
 META_FILE_BODY = '<?xml version="1.0" encoding="UTF-8" standalone="no"?>' + \
     '<meta xmlns="urn:xmind:xmap:xmlns:meta:2.0" version="2.0"/>'
-MANIFEST_FILE_BODY = '''<?xml version="1.0" encoding="UTF-8" standalone="no"?>
-<manifest xmlns="urn:xmind:xmap:xmlns:manifest:1.0">
-  <file-entry full-path="content.xml" media-type="text/xml"/>
-  <file-entry full-path="META-INF/" media-type=""/>
-  <file-entry full-path="META-INF/manifest.xml" media-type="text/xml"/>
-  <file-entry full-path="styles.xml" media-type=""/>
-  <file-entry full-path="Thumbnails/" media-type=""/>
-  <file-entry full-path="Thumbnails/thumbnail.jpg" media-type="image/jpeg"/>
-</manifest>'''
+MANIFEST_HEADER = '<?xml version="1.0" encoding="UTF-8" standalone="no"?>\n' + \
+    '<manifest xmlns="urn:xmind:xmap:xmlns:manifest:1.0">\n'
+MANIFEST_FOOTER = '</manifest>'
+MANIFEST_STANDARD_ENTRIES = [
+    ("content.xml", "text/xml"),
+    ("META-INF/", ""),
+    ("META-INF/manifest.xml", "text/xml"),
+    ("styles.xml", ""),
+    ("Thumbnails/", ""),
+    ("Thumbnails/thumbnail.jpg", "image/jpeg"),
+]
 
 # See org.xmind.ui.resources/markers/markerSheet.xml
 ALL_MARKS = [
@@ -51,17 +74,155 @@ SHAPE_RECTANGLE = "org.xmind.topicShape.rectangle"
 SHAPE_ROUND_RECTANGLE = "org.xmind.topicShape.roundedRect"
 SHAPE_ELLIPSIS = "org.xmind.topicShape.ellipse"
 
-_id_gen = IdGen(26)
+RAW_COPY_CHUNK = 1024 * 1024
+
+def _seekable_source(source):
+    """
+    Returns source in form acceptable for zipfile.ZipFile reading:
+    file names and seekable files are returned as-is, non-seekable
+    streams are read into memory.
+    """
+    if isinstance(source, six.string_types):
+        return source
+    seekable = getattr(source, "seekable", None)
+    if seekable is not None and seekable():
+        return source
+    return io.BytesIO(source.read())
+
+# Raw copying relies on zipfile internals, which are not part of its
+# public API. It is used only when all of them are present.
+RAW_COPY_SUPPORTED = all(
+    hasattr(zipfile, name)
+    for name in ("structFileHeader", "sizeFileHeader", "_FH_FILENAME_LENGTH",
+                 "_FH_EXTRA_FIELD_LENGTH", "_strip_extra"))
+
+def _can_copy_raw(source, target):
+    return RAW_COPY_SUPPORTED \
+        and all(hasattr(source, name) for name in ("fp", "_lock")) \
+        and all(hasattr(target, name)
+                for name in ("fp", "_lock", "start_dir", "_didModify")) \
+        and not getattr(target, "_writing", False)
+
+def _copy_member(source, target, zinfo):
+    """
+    Copy member described by zinfo from zipfile source to zipfile
+    target through public zipfile API, preserving its compression.
+    """
+    copied = zipfile.ZipInfo(zinfo.filename, zinfo.date_time)
+    copied.compress_type = zinfo.compress_type
+    copied.external_attr = zinfo.external_attr
+    copied.file_size = zinfo.file_size
+    with source.open(zinfo) as member:
+        with target.open(copied, "w") as output:
+            shutil.copyfileobj(member, output, RAW_COPY_CHUNK)
+
+def _copy_raw_member(source, target, zinfo):
+    """
+    Copy member described by zinfo from zipfile source to zipfile
+    target without decompressing and recompressing it. Falls back
+    to _copy_member if zipfile internals are not available.
+    """
+    if not _can_copy_raw(source, target):
+        return _copy_member(source, target, zinfo)
+
+    with source._lock, target._lock:
+        source.fp.seek(zinfo.header_offset)
+        header = struct.unpack(zipfile.structFileHeader,
+                               source.fp.read(zipfile.sizeFileHeader))
+        source.fp.seek(header[zipfile._FH_FILENAME_LENGTH]
+                       + header[zipfile._FH_EXTRA_FIELD_LENGTH], 1)
+
+        copied = copy.copy(zinfo)
+        copied.flag_bits &= ~0x08    # sizes are known, no data descriptor
+        copied.extra = zipfile._strip_extra(zinfo.extra, (1,))   # zip64
+        if hasattr(copied, "_end_offset"):
+            copied._end_offset = None
+        copied.header_offset = target.fp.tell()
+        target.fp.write(copied.FileHeader())
+        remaining = zinfo.compress_size
+        while remaining > 0:
+            chunk = source.fp.read(min(remaining, RAW_COPY_CHUNK))
+            if not chunk:
+                raise zipfile.BadZipfile(
+                    "Truncated member %s" % zinfo.filename)
+            target.fp.write(chunk)
+            remaining -= len(chunk)
+
+        target.filelist.append(copied)
+        target.NameToInfo[copied.filename] = copied
+        target.start_dir = target.fp.tell()
+        target._didModify = True
+
+def _parse_member(archive, name, stats):
+    """
+    Read and parse XML member of given name of zipfile archive.
+    """
+    with phase(stats, "inflate"):
+        data = archive.read(name)
+    with phase(stats, "parse"):
+        tag = etree.XML(data)
+    if stats is not None:
+        stats.count("bytes_inflated", len(data))
+        if stats.count_elements:
+            stats.count("elements_parsed", sum(1 for element in tag.iter()))
+    return tag
+
+def _count_written(zipf, stats):
+    """
+    Note size of members written to zipfile zipf.
+    """
+    if stats is not None:
+        stats.count("bytes_written",
+                    sum(zinfo.compress_size for zinfo in zipf.infolist()))
+
+_USED_IDS = etree.XPath("//@id[starts-with(., $prefix)]")
+
+def manifest_body(paths):
+    """
+    Generate META-INF/manifest.xml text describing standard map
+    members and given extra paths (attachments, markers etc). Media
+    types of extra members are guessed from file extensions.
+    """
+    lines = [MANIFEST_HEADER]
+    for path, media_type in MANIFEST_STANDARD_ENTRIES:
+        lines.append('  <file-entry full-path=%s media-type=%s/>\n' % (
+            quoteattr(path), quoteattr(media_type)))
+    for path in paths:
+        if path.endswith("/"):
+            media_type = ""
+        else:
+            media_type = mimetypes.guess_type(path)[0] or ""
+        lines.append('  <file-entry full-path=%s media-type=%s/>\n' % (
+            quoteattr(path), quoteattr(media_type)))
+    lines.append(MANIFEST_FOOTER)
+    return "".join(lines)
 
 class DocumentPart(object):
     """
     Base class for all mindmap related objects (sheets, topics, legends etc).
-    Provides .doc attribute
+    Provides .doc attribute.
+
+    Parts are light wrappers of XML elements (name of the attribute
+    keeping the element is given by _tag_attr). Two wrappers of the
+    same element are equal (and have equal hashes), even if they are
+    different objects.
     """
+    __slots__ = ("doc", "__weakref__")
+    _tag_attr = None
 
     def __init__(self, doc):
         self.doc = doc
 
+    def __eq__(self, other):
+        return type(self) is type(other) \
+            and getattr(self, self._tag_attr) is getattr(other, other._tag_attr)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(getattr(self, self._tag_attr))
+
 class Legend(DocumentPart):
     """
     Map legend handling.
@@ -80,6 +241,9 @@ class Legend(DocumentPart):
     >>> legend.add_marker(
     ...     "task-start", u"Task being worked on")
     """
+    __slots__ = ("legend_tag",)
+    _tag_attr = "legend_tag"
+
     @classmethod
     def create(cls, doc, sheet_tag):
         """
@@ -96,7 +260,7 @@ class Legend(DocumentPart):
         """
         legend_tag = doc.create_child(
             sheet_tag, "legend", visibility = "visible")
-        return Legend(doc, legend_tag)
+        return doc.wrap(Legend, legend_tag)
 
     def __init__(self, doc, legend_tag):
         DocumentPart.__init__(self, doc)
@@ -116,6 +280,7 @@ class Legend(DocumentPart):
         y_pos : int
             Vertical position (in pixels, 0 means top border)
         """
+        self.doc.ensure_writable()
         pos = self.doc.find_or_create_child(self.legend_tag, "position")
         pos.set(ns_name("svg", "x"), x_pos)
         pos.set(ns_name("svg", "y"), y_pos)
@@ -149,6 +314,9 @@ class Sheet(DocumentPart):
     Represents single sheet (diagram) on the mind-map
     (note that XMind handles many sheet per diagram).
     """
+    __slots__ = ("sheet_tag",)
+    _tag_attr = "sheet_tag"
+
     @classmethod
     def create(cls, doc, sheet_name, root_topic_name):
         """
@@ -156,12 +324,13 @@ class Sheet(DocumentPart):
         use ``XMindDocument.create_sheet`` instead.
         """
         sheet_tag = doc.create_child(doc.doc_tag, "sheet",
-                                     id = six.advance_iterator(_id_gen))
-        sheet = Sheet(doc, sheet_tag)
+                                     id = six.advance_iterator(doc.id_gen))
+        sheet = doc.wrap(Sheet, sheet_tag)
         sheet.set_title(sheet_name)
         topic_tag = doc.create_child(sheet_tag, "topic",
-                                     id = six.advance_iterator(_id_gen))
+                                     id = six.advance_iterator(doc.id_gen))
         doc.create_child(topic_tag, "title").text = root_topic_name
+        doc._index_topic(topic_tag)
         return sheet
 
     def __init__(self, doc, sheet_tag):
@@ -172,6 +341,7 @@ class Sheet(DocumentPart):
         """
         Change sheet title (label displayed on sheet tab).
         """
+        self.doc.ensure_writable()
         self.doc.find_or_create_child(self.sheet_tag, "title").text = title
 
     def get_title(self):
@@ -184,9 +354,17 @@ class Sheet(DocumentPart):
         """
         Get the root topic of the sheet (this topic always exists)
         """
-        return Topic(self.doc, self.doc.find_only_child(
+        return self.doc.wrap(Topic, self.doc.find_only_child(
                 self.sheet_tag, "topic"))
 
+    def iter_all_topics(self, order = "pre", include_detached = True,
+                        max_depth = None):
+        """
+        Yields ``(topic, depth, parent)`` for every topic of the sheet,
+        starting from the root topic (see ``Topic.walk``).
+        """
+        return self.get_root_topic().walk(order, include_detached, max_depth)
+
     def get_legend(self):
         """
         Get the legend object for the sheet, create it if it does
@@ -195,7 +373,7 @@ class Sheet(DocumentPart):
         legend_tag = self.doc.find_only_child(
             self.sheet_tag, "legend", required = False)
         if legend_tag is not None:
-            return Legend(self.doc, legend_tag)
+            return self.doc.wrap(Legend, legend_tag)
         else:
             return Legend.create(self.doc, self.sheet_tag)
 
@@ -203,6 +381,9 @@ class Topic(DocumentPart):
     """
     Representation of single topic (item) on the map.
     """
+    __slots__ = ("topic_tag",)
+    _tag_attr = "topic_tag"
+
     def __init__(self, doc, topic_tag):
         DocumentPart.__init__(self, doc)
         self.topic_tag = topic_tag
@@ -237,20 +418,28 @@ class Topic(DocumentPart):
         """
         return unique_id(self.topic_tag.get("id"))
 
+    def _find_subtopics_tag(self, detached = False):
+        """
+        Internal helper. Returns XML tag for subtopics block, or None
+        if there is no such block (never modifies the map).
+        """
+        children_tag = self.doc.find_only_child(
+            self.topic_tag, "children", required = False)
+        if children_tag is None:
+            return None
+        return self.doc.find_child_with_attribute(
+            children_tag, "topics", "type",
+            detached and "detached" or "attached")
+
     def _subtopics_tag(self, detached = False):
         """
         Internal helper. Returns XML tag for subtopics block
+        (creating it if necessary).
         """
         children_tag = self.doc.find_or_create_child(self.topic_tag, "children")
         mode = detached and "detached" or "attached"
-        #topics_tag = children_tag.xpath("topics[@type='%s']" % mode)
-        #topics_tag[0]
-        topics_tag = find_xpath(
-            children_tag,
-            "%s[@%s='%s']" % (self.doc.xpath_name("topics"),
-                              "type", #self.doc.xpath_name("type"),
-                              mode),
-            single = True, required = False)
+        topics_tag = self.doc.find_child_with_attribute(
+            children_tag, "topics", "type", mode)
         if topics_tag is None:
             topics_tag = self.doc.create_child(
                 children_tag, "topics", type = mode)
@@ -275,9 +464,22 @@ class Topic(DocumentPart):
         """
         topics_tag = self._subtopics_tag(detached)
         subtopic_tag = self.doc.create_child(topics_tag, "topic",
-                                             id = _id_gen.next(subtopic_emb_id))
+                                             id = self.doc.id_gen.next(subtopic_emb_id))
         self.doc.create_child(subtopic_tag, "title").text = subtopic_title
-        return Topic(self.doc, subtopic_tag)
+        self.doc._index_topic(subtopic_tag)
+        return self.doc.wrap(Topic, subtopic_tag)
+
+    def remove(self):
+        """
+        Remove this topic (together with all its subtopics) from the map.
+        Sheet root topic can't be removed.
+        """
+        self.doc.ensure_writable()
+        topics_tag = self.topic_tag.getparent()
+        if topics_tag is None or topics_tag.tag != self.doc.full_name("topics"):
+            raise ValueError("Only subtopics can be removed")
+        self.doc._unindex_subtree(self.topic_tag)
+        topics_tag.remove(self.topic_tag)
 
     def get_subtopics(self, detached = False):
         """
@@ -285,21 +487,116 @@ class Topic(DocumentPart):
         connected children are returned, if `detached` param
         is set, disconnected (detached) chilren are returned.
         """
-        topics_tag = self._subtopics_tag(detached)
+        topics_tag = self._find_subtopics_tag(detached)
+        if topics_tag is None:
+            return
         for element in self.doc.find_children(topics_tag, "topic"):
-            yield Topic(self.doc, element)
+            yield self.doc.wrap(Topic, element)
+
+    def walk(self, order = "pre", include_detached = True, max_depth = None):
+        """
+        Yields ``(topic, depth, parent)`` for this topic (depth 0,
+        parent None) and all its descendants. The whole walk is
+        a single pass over the XML tree (no per-level lookups).
+
+        >>> for topic, depth, parent in root.walk():
+        ...     print("  " * depth + topic.get_title())
+
+        Arguments
+        ---------
+
+        order : string (default "pre")
+            ``"pre"`` (parents before children, document order),
+            ``"post"`` (children before parents) or ``"bfs"``
+            (level by level)
+        include_detached : bool (default True)
+            Visit also detached subtopics (and their descendants)
+        max_depth : int (optional)
+            Don't descend below given depth
+        """
+        kinds = include_detached and ("attached", "detached") \
+            or ("attached",)
+        if order == "bfs":
+            return self._walk_bfs(kinds, max_depth)
+        elif order in ("pre", "post"):
+            return self._walk_dfs(order == "pre", kinds, max_depth)
+        else:
+            raise ValueError("Unknown walk order: %s" % order)
+
+    def _walk_dfs(self, preorder, kinds, max_depth):
+        """
+        Depth-first walk helper (see walk).
+        """
+        doc = self.doc
+        stack = []                      # (topic, depth) of open topics
+        walker = etree.iterwalk(self.topic_tag, events = ("start", "end"),
+                                tag = doc.full_name("topic"))
+        skipped = None
+        for event, element in walker:
+            if event == "end":
+                if element is skipped:
+                    skipped = None
+                    continue
+                topic, depth = stack.pop()
+                if not preorder:
+                    yield topic, depth, stack and stack[-1][0] or None
+                continue
+            if stack and element.getparent().get("type") not in kinds:
+                walker.skip_subtree()
+                skipped = element
+                continue
+            depth = len(stack)
+            topic = stack and doc.wrap(Topic, element) or self
+            if preorder:
+                yield topic, depth, stack and stack[-1][0] or None
+            if max_depth is not None and depth >= max_depth:
+                walker.skip_subtree()
+            stack.append((topic, depth))
+
+    def _walk_bfs(self, kinds, max_depth):
+        """
+        Breadth-first walk helper (see walk).
+        """
+        doc = self.doc
+        children_name = doc.full_name("children")
+        topics_name = doc.full_name("topics")
+        topic_name = doc.full_name("topic")
+        queue = collections.deque([(self, 0, None)])
+        while queue:
+            topic, depth, parent = queue.popleft()
+            yield topic, depth, parent
+            if max_depth is not None and depth >= max_depth:
+                continue
+            for children in topic.topic_tag.iterchildren(tag = children_name):
+                for topics in children.iterchildren(tag = topics_name):
+                    if topics.get("type") not in kinds:
+                        continue
+                    for element in topics.iterchildren(tag = topic_name):
+                        queue.append(
+                            (doc.wrap(Topic, element), depth + 1, topic))
+
+    def iter_descendants(self, include_detached = True):
+        """
+        Yields all descendants of this topic (without the topic itself),
+        in document order. See ``walk`` for more options.
+        """
+        walk = self.walk(include_detached = include_detached)
+        six.advance_iterator(walk)
+        for topic, depth, parent in walk:
+            yield topic
 
     def set_title(self, title):
         """
         Change topic title
         """
+        self.doc.ensure_writable()
         self.doc.find_or_create_child(self.topic_tag, "title").text = title
 
     def get_title(self):
         """
-        Returns topic title
+        Returns topic title (or None if missing)
         """
-        return self.doc.find_or_create_child(self.topic_tag, "title").text
+        return self._child_text("title")
 
     def add_marker(self, marker):
         """
@@ -351,6 +648,7 @@ class Topic(DocumentPart):
         url : string
             Page address (for example "http://slashdot.org")
         """
+        self.doc.ensure_writable()
         self.topic_tag.set("{http://www.w3.org/1999/xlink}href", url)
 
     def get_link(self):
@@ -376,7 +674,7 @@ class Topic(DocumentPart):
              file extension (used to signal the data format, for example
              ``.txt``, ``.html``, ``.zip``, ``.json``)
         """
-        att_name = six.advance_iterator(_id_gen) + extension
+        att_name = six.advance_iterator(self.doc.id_gen) + extension
         self.doc._create_attachment(att_name, data)
         self.topic_tag.set("{http://www.w3.org/1999/xlink}href",
                            "xap:attachments/" + att_name)
@@ -388,6 +686,7 @@ class Topic(DocumentPart):
         Line breaks are preserved (to mark paragraphs), apart from that
         no formatting is handled.
         """
+        self.doc.ensure_writable()
         notes_tag = self.doc.find_or_create_child(self.topic_tag, "notes")
         self.doc.find_or_create_child(notes_tag, "plain").text = note_text
         html_tag = self.doc.find_or_create_child(notes_tag, "html")
@@ -399,25 +698,24 @@ class Topic(DocumentPart):
 
     def get_note(self):
         """
-        Returns note (topic description) text, or empty string
+        Returns note (topic description) text, or None
         if it is not present
         """
-        notes_tag = self.doc.find_or_create_child(self.topic_tag, "notes")
-        return self.doc.find_or_create_child(notes_tag, "plain").text
+        return self._child_text("notes", "plain")
 
     def set_label(self, label_text):
         """
         Sets/replaces topic label (short tag-like annotation)
         """
+        self.doc.ensure_writable()
         labels_tag = self.doc.find_or_create_child(self.topic_tag, "labels")
         self.doc.find_or_create_child(labels_tag, "label").text = label_text
 
     def get_label(self):
         """
-        Gets topic label (or empty text if missing)
+        Gets topic label (or None if missing)
         """
-        labels_tag = self.doc.find_or_create_child(self.topic_tag, "labels")
-        return self.doc.find_or_create_child(labels_tag, "label").text
+        return self._child_text("labels", "label")
 
     def set_style(self, style):
         """
@@ -430,8 +728,185 @@ class Topic(DocumentPart):
             Object defining visual characteristics of the topic
             (usually created via XMindDocument.create_topic_style)
         """
+        self.doc.ensure_writable()
         self.topic_tag.set("style-id", style.get_id())
 
+    def _child_text(self, *path):
+        """
+        Internal helper. Returns text of the element found by following
+        given tag names down from the topic, None if any is missing.
+        Lookup only, never modifies the map.
+        """
+        element = self.topic_tag
+        for tag_name in path:
+            element = self.doc.find_only_child(
+                element, tag_name, required = False)
+            if element is None:
+                return None
+        return element.text
+
+    def add_subtree(self, data, detached = False):
+        """
+        Create whole subtree (new child of this topic together with its
+        descendants) in one call. Much faster than successive
+        ``add_subtopic`` calls when many topics are created, as elements
+        are built directly, without per-topic lookups.
+
+        >>> topic.add_subtree({
+        ...     "title": u"Project",
+        ...     "note": u"Long description",
+        ...     "markers": ["task-start"],
+        ...     "children": [
+        ...          u"Plain title",
+        ...          (u"Title", [u"Child 1", u"Child 2"]),
+        ...          {"title": u"Detached", "detached": True},
+        ...     ]})
+
+        Arguments
+        ---------
+
+        data : dict, tuple or string
+            Description of the subtree root. Dictionary can contain
+            ``title``, ``embedded_id``, ``note``, ``label``, ``markers``
+            (list), ``link``, ``style`` (TopicStyle), ``detached``
+            (bool) and ``children`` (iterable of similar items).
+            Tuple means ``(title, children)`` (children are optional),
+            string means just title.
+        detached : bool (default False)
+            Make subtree root detached (see ``add_subtopic``).
+
+        Returns the Topic created for the subtree root.
+        """
+        self.doc.ensure_writable()
+        builder = _SubtreeBuilder(self.doc)
+        node = builder.normalize(data)
+        topics_tag = self._subtopics_tag(node.get("detached", detached))
+        element = builder.build(topics_tag, node)
+        return self.doc.wrap(Topic, element)
+
+_END = object()       # end of iteration marker
+
+class _SubtreeBuilder(object):
+    """
+    Internal helper. Creates topic elements described by nested data
+    (see Topic.add_subtree).
+    """
+    def __init__(self, doc):
+        self.doc = doc
+        self.tags = dict(
+            (name, doc.full_name(name))
+            for name in ["topic", "title", "children", "topics",
+                         "notes", "plain", "html", "xhtml:p",
+                         "labels", "label", "marker-refs", "marker-ref"])
+
+    def normalize(self, data):
+        """
+        Convert any accepted node description into dictionary.
+        """
+        if isinstance(data, dict):
+            return data
+        if isinstance(data, six.string_types):
+            return {"title": data}
+        if isinstance(data, (tuple, list)):
+            if len(data) == 1:
+                return {"title": data[0]}
+            elif len(data) == 2:
+                return {"title": data[0], "children": data[1]}
+        raise ValueError("Unsupported topic description: %r" % (data,))
+
+    def build(self, topics_tag, node):
+        """
+        Create topic described by node (with all descendants) inside
+        topics_tag. Returns created element.
+        """
+        element = self.create_topic(topics_tag, node)
+        self.fill(element, node)
+        return element
+
+    def create_topic(self, topics_tag, node):
+        """
+        Create single topic element (without descendants).
+        """
+        element = etree.SubElement(
+            topics_tag, self.tags["topic"],
+            id = self.doc.id_gen.next(node.get("embedded_id")))
+        etree.SubElement(element, self.tags["title"]).text = node.get("title")
+        self.set_properties(element, node)
+        self.doc._index_topic(element)
+        stats = self.doc.stats
+        if stats is not None:
+            # created directly, bypassing create_child
+            stats.count("create_child", sum(1 for item in element.iter()))
+        return element
+
+    def count_created(self):
+        """
+        Count container element created by fill in document stats.
+        """
+        if self.doc.stats is not None:
+            self.doc.stats.count("create_child")
+
+    def set_properties(self, element, node):
+        """
+        Apply all properties (except title and children) of node
+        to the topic element.
+        """
+        tags = self.tags
+        note = node.get("note")
+        if note is not None:
+            notes_tag = etree.SubElement(element, tags["notes"])
+            etree.SubElement(notes_tag, tags["plain"]).text = note
+            html_tag = etree.SubElement(notes_tag, tags["html"])
+            for line in note.split("\n"):
+                etree.SubElement(html_tag, tags["xhtml:p"]).text = line
+        label = node.get("label")
+        if label is not None:
+            labels_tag = etree.SubElement(element, tags["labels"])
+            etree.SubElement(labels_tag, tags["label"]).text = label
+        markers = node.get("markers")
+        if markers:
+            refs_tag = etree.SubElement(element, tags["marker-refs"])
+            for marker in markers:
+                etree.SubElement(refs_tag, tags["marker-ref"],
+                                 attrib = {"marker-id": marker})
+        link = node.get("link")
+        if link is not None:
+            element.set(ns_name("xlink", "href"), link)
+        style = node.get("style")
+        if style is not None:
+            element.set("style-id", style.get_id())
+
+    def fill(self, element, node):
+        """
+        Create all descendants of node under (already created)
+        topic element. Works iteratively, so very deep trees
+        are handled too.
+        """
+        tags = self.tags
+        stack = [(element, {}, iter(node.get("children") or ()))]
+        while stack:
+            parent, containers, children = stack[-1]
+            child = next(children, _END)
+            if child is _END:
+                stack.pop()
+                continue
+            child = self.normalize(child)    # rejects None as well
+            mode = child.get("detached") and "detached" or "attached"
+            topics_tag = containers.get(mode)
+            if topics_tag is None:
+                children_tag = containers.get(None)
+                if children_tag is None:
+                    children_tag = containers[None] = etree.SubElement(
+                        parent, tags["children"])
+                    self.count_created()
+                topics_tag = containers[mode] = etree.SubElement(
+                    children_tag, tags["topics"], type = mode)
+                self.count_created()
+            child_element = self.create_topic(topics_tag, child)
+            grandchildren = child.get("children")
+            if grandchildren:
+                stack.append((child_element, {}, iter(grandchildren)))
+
 class TopicStyle(object):
     """
     Topic visual presentation style. To be used as Topic.set_style
@@ -439,6 +914,7 @@ class TopicStyle(object):
 
     Single TopicStyle can be used for many topics.
     """
+    __slots__ = ("style_tag", "__weakref__")
 
     @classmethod
     def create(cls, doc,
@@ -468,7 +944,7 @@ class TopicStyle(object):
         """
         styles = doc.find_or_create_child(doc.styles_tag, "styles")
         style_tag = doc.create_child(styles, "style",
-                                     id = six.advance_iterator(_id_gen), type="topic")
+                                     id = six.advance_iterator(doc.id_gen), type="topic")
         doc.create_child(style_tag, "topic-properties",
                          attrib = {
                              "line-color" : line_color,
@@ -477,8 +953,36 @@ class TopicStyle(object):
                              ns_name("svg", "fill") : fill,
                           })
         return TopicStyle(style_tag)
+    @classmethod
+    def key(cls, style_tag):
+        """
+        Returns (fill, shape, line_color, line_width) tuple describing
+        style element as created by ``create``, or None if the element
+        is not such style (has other properties, other type etc).
+        """
+        if style_tag.get("type") != "topic" or len(style_tag) != 1:
+            return None
+        properties = style_tag[0]
+        if len(properties) or not isinstance(properties.tag, six.string_types) \
+                or etree.QName(properties).localname != "topic-properties":
+            return None
+        attrib = dict(properties.attrib)
+        key = (attrib.pop(ns_name("svg", "fill"), None),
+               attrib.pop("shape-class", None),
+               attrib.pop("line-color", None),
+               attrib.pop("line-width", None))
+        if attrib or None in key:
+            return None
+        return key
     def __init__(self, style_tag):
         self.style_tag = style_tag
+    def __eq__(self, other):
+        return isinstance(other, TopicStyle) \
+            and self.style_tag is other.style_tag
+    def __ne__(self, other):
+        return not self.__eq__(other)
+    def __hash__(self):
+        return hash(self.style_tag)
     def get_id(self):
         """
         Returns internal object identifier (unique within map)
@@ -491,45 +995,95 @@ class XMindDocument(XmlHelper):
     """
 
     @classmethod
-    def create(cls, first_sheet_name, root_topic_name):
+    def create(cls, first_sheet_name = None, root_topic_name = None,
+               id_prefix = "", stats = None, cache_wrappers = False):
         """
         Create new, almost empty document, with just one
         sheet and it's root topic. Document can be manipulated
         using library API (usually via sheets), then saved using ``save``.
+
+        If first_sheet_name is not given, the document is created
+        without any sheet (add them with ``create_sheet`` or
+        ``create_sheet_from`` before saving, XMind requires at least
+        one).
+
+        id_prefix (alphanumeric) is included in all identifiers generated
+        for the document. Use ``id_gen.unique_prefix()`` when maps
+        built in parallel must not share identifiers.
+
+        stats (XMindStats) collects processing statistics.
+        cache_wrappers enables wrapper cache (see ``wrap``).
         """
         doc_tag = etree.Element(
             "xmap-content", nsmap = CONTENT_NSMAP, version = "2.0")
         styles_tag = etree.Element(
             "xmap-styles", nsmap = STYLES_NSMAP, version = "2.0")
-        obj = XMindDocument(True, doc_tag, styles_tag)
-        obj.create_sheet(first_sheet_name, root_topic_name)
+        obj = XMindDocument(True, doc_tag, styles_tag, id_prefix = id_prefix,
+                            stats = stats, cache_wrappers = cache_wrappers)
+        if first_sheet_name is not None:
+            obj.create_sheet(first_sheet_name, root_topic_name)
         return obj
 
     @classmethod
-    def open(cls, filename):
-        """
-        Open and parse existing mind-map.
-        """
-        archive = zipfile.ZipFile(filename, "r")
+    def open(cls, filename, read_only = False, id_prefix = None,
+             stats = None, cache_wrappers = False, lazy_sheets = False):
+        """
+        Open and parse existing mind-map. filename can be either file
+        name or binary file-like object (non-seekable streams, like
+        pipes, are read into memory first).
+
+        If read_only is set, any attempt to modify the map raises
+        ReadOnlyMapException. id_prefix is used for identifiers
+        of newly added items (see ``create``), by default
+        ``id_gen.unique_prefix()`` is used, so items added to
+        separately opened copies of the map (later merged, see
+        ``merge``) don't share identifiers. stats (XMindStats)
+        collects processing statistics (of opening and later work).
+        cache_wrappers enables wrapper cache (see ``wrap``).
+
+        If lazy_sheets is set, only sheet boundaries (and titles)
+        are found while opening, every sheet is parsed when first
+        accessed via ``get_sheet``, ``get_first_sheet`` or
+        ``get_all_sheets`` (anything else - like topic lookups,
+        search or saving - parses remaining sheets). Useful to read
+        single sheet of a large workbook.
+
+        Attachments are not read here, their bodies are loaded from
+        the file when first needed (so the file is kept open, see
+        ``close``).
+        """
+        if id_prefix is None:
+            id_prefix = unique_prefix()
+        archive = zipfile.ZipFile(_seekable_source(filename), "r")
         doc_tag = None
         styles_tag = None
-        attachments = {}
+        lazy_content = None
         for name in archive.namelist():
-            if name == "content.xml":
+            if name == CONTENT_MEMBER and lazy_sheets:
+                log.debug("scanning content.xml")
+                with phase(stats, "inflate"):
+                    data = archive.read(name)
+                if stats is not None:
+                    stats.count("bytes_inflated", len(data))
+                lazy_content = LazyContent.scan(data, stats)
+                if lazy_content is not None:
+                    doc_tag = lazy_content.root
+                else:
+                    with phase(stats, "parse"):
+                        doc_tag = etree.XML(data)
+            elif name == CONTENT_MEMBER:
                 #doc_tag = etree.parse(archive.open(name), "r")  # python 2.6
                 log.debug("parsing content.xml")
-                doc_tag = etree.XML(archive.read(name))
-            elif name == "styles.xml":
+                doc_tag = _parse_member(archive, name, stats)
+            elif name == STYLES_MEMBER:
                 log.debug("parsing styles.xml")
-                styles_tag = etree.XML(archive.read(name))
+                styles_tag = _parse_member(archive, name, stats)
             elif name in ['meta.xml', 'META-INF/manifest.xml',
-                          'Thumbnails/thumbnail.jpg' ]:
+                          'Thumbnails/thumbnail.jpg', SEARCH_INDEX_MEMBER]:
                 pass
             elif name.startswith(ATTACHMENTS_DIR):
-                short = name[len(ATTACHMENTS_DIR):]
-                log.debug("Found attachment %s" % short)
-                attachments[short] = archive.read(name)
-            elif name.startswith("markers/"):
+                pass
+            elif name.startswith(MARKERS_DIR):
                 pass
             else:
                 log.warn("Unknown xmind file member: %s" % name)
@@ -542,24 +1096,184 @@ class XMindDocument(XmlHelper):
             styles_tag = etree.Element(
                 "xmap-styles", nsmap = STYLES_NSMAP, version = "2.0")
 
-        if DUMP_PARSED_DATA:
+        if DUMP_PARSED_DATA and lazy_content is None:
             logging.debug("Parsed document:\n%s",
                           etree.tostring(doc_tag, pretty_print = True))
             logging.debug("Parsed styles:\n%s",
                           etree.tostring(styles_tag, pretty_print = True))
 
-        return XMindDocument(False, doc_tag, styles_tag, attachments)
+        return XMindDocument(False, doc_tag, styles_tag,
+                             Attachments(archive), read_only = read_only,
+                             id_prefix = id_prefix, stats = stats,
+                             cache_wrappers = cache_wrappers,
+                             lazy_content = lazy_content)
 
-    def __init__(self, is_creating, doc_tag, styles_tag, attachments = None):
+    @classmethod
+    def from_bytes(cls, data, **kwargs):
+        """
+        Parse mind-map given as bytes (content of .xmind file).
+        Accepts the same keyword arguments as ``open``.
+        """
+        return cls.open(io.BytesIO(data), **kwargs)
+
+    @classmethod
+    def iter_topics(cls, filename, cache_dir = None,
+                    cache_size = cache.DEFAULT_CACHE_SIZE):
+        """
+        Stream topics of existing mind-map without building the whole
+        document in memory. Yields ``TopicRecord`` tuples (id, title,
+        depth, parent_id, markers, link, label), children before
+        their parents. See ``streaming.iter_topics`` for details.
+
+        >>> for rec in XMindDocument.iter_topics("big.xmind"):
+        ...     print(rec.depth, rec.title)
+
+        If cache_dir is given, records are cached there (see
+        ``cache.TopicCache``, cache_size is its size limit in bytes),
+        and scans of unchanged files don't parse XML.
+        """
+        if cache_dir is not None:
+            return cache.TopicCache(cache_dir, cache_size).iter_topics(
+                filename)
+        return streaming.iter_topics(filename)
+
+    def __init__(self, is_creating, doc_tag, styles_tag, attachments = None,
+                 read_only = False, id_prefix = "", stats = None,
+                 cache_wrappers = False, lazy_content = None):
         """
         Constructor. Don't use directly, use
         XMindDocument.create or XMindDocument.open
         """
-        XmlHelper.__init__(self, is_creating, "xm")
-        self.doc_tag = doc_tag
+        if attachments is None:
+            attachments = Attachments()
+        self.attachments = attachments
+        XmlHelper.__init__(self, is_creating, "xm", read_only)
+        self.stats = stats
+        self._doc_tag = doc_tag
+        self._lazy_content = lazy_content
         self.styles_tag = styles_tag
-        self.attachments = (attachments or {})
         self.embed_xmp = None
+        self.dirty_parts = set()
+        self._id_gen = IdGen(26, id_prefix)
+        if not is_creating:
+            self._id_gen.reserve_later(self._used_ids)
+        self._topics_by_id = None
+        self._topics_by_embedded_id = None
+        self._wrappers = None
+        if cache_wrappers:
+            self._wrappers = weakref.WeakValueDictionary()
+        self._search_index = None
+        self._topic_styles = None
+
+    @property
+    def doc_tag(self):
+        """
+        Top-level element of content.xml (for maps opened with
+        lazy_sheets, accessing it parses all remaining sheets).
+        """
+        if self._lazy_content is not None:
+            self._lazy_content.load_all()
+            self._lazy_content = None
+        return self._doc_tag
+
+    @property
+    def id_gen(self):
+        """
+        Generator of identifiers of new items. For parsed maps it
+        continues after the identifiers present in the map (found
+        when the first identifier is generated), so new items never
+        reuse them.
+        """
+        return self._id_gen
+
+    def _used_ids(self):
+        """
+        Yields identifiers (of the id_gen form) used in parsed map:
+        element ids and attachment names.
+        """
+        prefix = PFX_OTHER + self._id_gen.prefix
+        stats = self.stats
+        lazy_content = self._lazy_content
+        if lazy_content is not None and lazy_content.data is not None:
+            pattern = re.compile(
+                b"[\"']" + re.escape(prefix.encode("ascii")) + b"[0-9]+")
+            for found in pattern.findall(lazy_content.data):
+                yield found[1:].decode("ascii")
+        else:
+            if stats is not None:
+                stats.count("xpath")
+            for value in _USED_IDS(self._doc_tag, prefix = prefix):
+                yield value
+        if stats is not None:
+            stats.count("xpath")
+        for value in _USED_IDS(self.styles_tag, prefix = prefix):
+            yield value
+        for name in self.attachments:
+            yield name[:self._id_gen.length]
+
+    @property
+    def stats(self):
+        """
+        XMindStats collecting processing statistics, or None
+        (default, nothing is collected).
+        """
+        return self._stats
+
+    @stats.setter
+    def stats(self, stats):
+        self._stats = stats
+        self.attachments.stats = stats
+
+    def wrap(self, part_class, element):
+        """
+        Returns part_class (Topic, Sheet or Legend) object representing
+        given element.
+
+        By default every call creates new wrapper. If the document was
+        created or opened with ``cache_wrappers``, wrappers are kept
+        in weak cache (as long as they are used anywhere), so repeated
+        traversals return the same objects (``is`` works).
+        """
+        wrappers = self._wrappers
+        if wrappers is None:
+            return part_class(self, element)
+        wrapper = wrappers.get(element)
+        if wrapper is None:
+            wrapper = wrappers[element] = part_class(self, element)
+        return wrapper
+
+    def ensure_writable(self, action = "modification", element = None,
+                        part = None):
+        """
+        Raises ReadOnlyMapException if the map is read-only. Otherwise
+        notes that given part (if specified), or the map part
+        containing given element (content if not specified) is modified.
+        """
+        XmlHelper.ensure_writable(self, action)
+        if part is not None:
+            self.dirty_parts.add(part)
+        elif element is not None \
+                and element.getroottree().getroot() is self.styles_tag:
+            self.dirty_parts.add(STYLES_MEMBER)
+        else:
+            self.dirty_parts.add(CONTENT_MEMBER)
+            self._search_index = None
+
+    def is_dirty(self, part = None):
+        """
+        Checks whether given part (``content.xml``, ``styles.xml``,
+        ``markers/`` or attachment name) - or, by default, anything -
+        was modified since the map was opened.
+        """
+        if part is None:
+            return bool(self.dirty_parts) or any(
+                self.attachments.source_member(name) is None
+                for name in self.attachments)
+        if part in self.dirty_parts:
+            return True
+        if part in self.attachments:
+            return self.attachments.source_member(part) is None
+        return False
 
     def create_sheet(self, sheet_name, root_topic_name):
         """
@@ -569,32 +1283,265 @@ class XMindDocument(XmlHelper):
                              sheet_name, root_topic_name)
         return sheet
 
-    def create_topic_style(self, *args, **kwargs):
+    def create_sheet_from(self, data, sheet_name = None):
+        """
+        Add new sheet with whole topic tree described by data (root
+        topic description in format accepted by ``Topic.add_subtree``)
+        and return it. By default sheet name is the same as root topic
+        title.
+        """
+        builder = _SubtreeBuilder(self)
+        node = builder.normalize(data)
+        title = node.get("title")
+        sheet = Sheet.create(self, sheet_name or title, title)
+        root_tag = sheet.get_root_topic().topic_tag
+        if node.get("embedded_id") is not None:
+            self._unindex_subtree(root_tag)
+            root_tag.set("id", self.id_gen.next(node["embedded_id"]))
+            self._index_topic(root_tag)
+        builder.set_properties(root_tag, node)
+        builder.fill(root_tag, node)
+        return sheet
+
+    def create_topic_style(self, fill, shape = SHAPE_ROUND_RECTANGLE,
+                           line_color = "#CACACA", line_width = "1pt"):
         """
         Create visual topic style (which can be attached
         to one or more topics with topic.set_style(style).
 
         The parameters are identical as in TopicStyle.create
         (except doc).
+
+        Styles are interned: if the map already contains topic style
+        of the same properties (created earlier, or present in parsed
+        map), it is returned instead of adding the new one.
         """
-        return TopicStyle.create(self, *args, **kwargs)
+        styles = self._topic_styles
+        if styles is None:
+            styles = self._topic_styles = self._find_topic_styles()
+        key = (fill, shape, line_color, line_width)
+        style = styles.get(key)
+        if style is None:
+            style = styles[key] = TopicStyle.create(
+                self, fill, shape, line_color, line_width)
+        return style
+
+    def _find_topic_styles(self):
+        """
+        Returns dictionary of internable topic styles present
+        in the map, keyed by TopicStyle.key.
+        """
+        styles = {}
+        for style_tag in self.styles_tag.iter("style", ns_name("st", "style")):
+            key = TopicStyle.key(style_tag)
+            if key is not None and key not in styles:
+                styles[key] = TopicStyle(style_tag)
+        return styles
 
     def get_first_sheet(self):
         """
         Return first sheet of the map.
         """
+        if self._lazy_content is not None:
+            return self.wrap(Sheet, self._lazy_content.sheet(0))
         sheet_tags = self.find_children(
             self.doc_tag, "sheet", require_non_empty = True)
-        return Sheet(self, sheet_tags[0])
+        return self.wrap(Sheet, sheet_tags[0])
 
     def get_all_sheets(self):
         """
         Yields all sheets of the map.
         """
+        lazy = self._lazy_content
+        if lazy is not None:
+            for index in range(len(lazy)):
+                yield self.wrap(Sheet, lazy.sheet(index))
+            return
         sheet_tags = self.find_children(
             self.doc_tag, "sheet", require_non_empty = True)
         for sheet_tag in sheet_tags:
-            yield Sheet(self, sheet_tag)
+            yield self.wrap(Sheet, sheet_tag)
+
+    def get_sheet(self, title = None, index = None):
+        """
+        Return sheet of given title (first one, if there are many
+        of them) or given index (0 for the first sheet, negative
+        values count from the end). Returns None if there is no
+        such sheet.
+
+        >>> doc.get_sheet(title = u"Plans")
+        >>> doc.get_sheet(index = -1)
+        """
+        if (title is None) == (index is None):
+            raise ValueError("Exactly one of title and index must be given")
+        lazy = self._lazy_content
+        if lazy is not None:
+            if title is not None:
+                for index in range(len(lazy)):
+                    if lazy.title(index) == title:
+                        break
+                else:
+                    return None
+            if not -len(lazy) <= index < len(lazy):
+                return None
+            return self.wrap(Sheet, lazy.sheet(index % len(lazy)))
+        sheet_tags = self.find_children(self.doc_tag, "sheet")
+        if title is not None:
+            for sheet_tag in sheet_tags:
+                title_tag = self.find_only_child(sheet_tag, "title", False)
+                if title_tag is not None and title_tag.text == title:
+                    return self.wrap(Sheet, sheet_tag)
+            return None
+        if not -len(sheet_tags) <= index < len(sheet_tags):
+            return None
+        return self.wrap(Sheet, sheet_tags[index])
+
+    def get_topic_by_id(self, topic_id):
+        """
+        Return topic of given (XMind) identifier, or None if there
+        is no such topic on the map.
+
+        Lookups use topic index, built on first call (and kept up to
+        date while topics are added or removed with library API).
+        """
+        self._ensure_topic_index()
+        element = self._topics_by_id.get(topic_id)
+        if element is None:
+            return None
+        return self.wrap(Topic, element)
+
+    def get_topic_by_embedded_id(self, embedded_id):
+        """
+        Return topic with given embedded id (see Topic.get_embedded_id),
+        or None if there is no such topic on the map. See
+        ``get_topic_by_id`` for notes about indexing.
+        """
+        self._ensure_topic_index()
+        element = self._topics_by_embedded_id.get(embedded_id)
+        if element is None:
+            return None
+        return self.wrap(Topic, element)
+
+    def to_arrays(self, sheet = None):
+        """
+        Returns TopicColumns - all topics of given sheet (by default
+        the first one) as columns of arrays: parent index, depth,
+        interned titles and labels, marker bitmap (bits correspond
+        to ALL_MARKS) etc. Built in single pass over the tree.
+
+        >>> columns = doc.to_arrays()
+        >>> sizes = columns.subtree_sizes()
+        >>> arrays = columns.to_numpy()    # if numpy is installed
+        """
+        if sheet is None:
+            sheet = self.get_first_sheet()
+        return TopicColumns.from_topic(
+            self, sheet.get_root_topic().topic_tag, ALL_MARKS)
+
+    def build_search_index(self):
+        """
+        (Re)build full-text index of topic titles, plain notes and
+        labels (see ``search``). Built index is saved inside the map
+        file (as extra ``mekk/search-index.json`` member), so maps
+        opened later can be searched without rebuilding it - until
+        they are modified (any map modification drops the index).
+        """
+        self._search_index = SearchIndex.build(self)
+        return self._search_index
+
+    def search(self, query):
+        """
+        Returns list of topics (in document order) whose title, note
+        or label contains all words of the query. Word ending with
+        ``*`` is treated as prefix.
+
+        >>> doc.search(u"budget 2010")
+        >>> doc.search(u"proj* plan")
+
+        Uses index saved in the map file if it is up to date, otherwise
+        builds new index (see ``build_search_index``).
+        """
+        index = self._search_index
+        if index is None:
+            index = self._search_index = self._load_search_index()
+        if index is None:
+            index = self.build_search_index()
+        self._ensure_topic_index()
+        return [self.wrap(Topic, self._topics_by_id[topic_id])
+                for topic_id in index.search(query)
+                if topic_id in self._topics_by_id]
+
+    def _load_search_index(self):
+        """
+        Returns search index saved in the source file, or None if there
+        is none or it does not match current content.
+        """
+        archive = self.attachments.archive
+        if archive is None or CONTENT_MEMBER in self.dirty_parts:
+            return None
+        try:
+            data = archive.read(SEARCH_INDEX_MEMBER)
+        except KeyError:
+            return None
+        index = SearchIndex.from_json(data.decode("utf-8"))
+        if index is None \
+                or index.content_crc != archive.getinfo(CONTENT_MEMBER).CRC:
+            return None
+        return index
+
+    def _write_search_index(self, zipf):
+        """
+        Write search index (if built or still valid in the source
+        file) into zipfile zipf (after content.xml was written).
+        """
+        index = self._search_index
+        if index is None:
+            index = self._search_index = self._load_search_index()
+        if index is None:
+            return
+        index.content_crc = zipf.getinfo(CONTENT_MEMBER).CRC
+        self._add_to_zip(zipf, SEARCH_INDEX_MEMBER, index.to_json())
+
+    def _ensure_topic_index(self):
+        """
+        Build topic index (if not yet built).
+        """
+        if self._topics_by_id is not None:
+            return
+        self._topics_by_id = {}
+        self._topics_by_embedded_id = {}
+        for element in self.doc_tag.iter(self.full_name("topic")):
+            self._index_topic(element)
+
+    def _index_topic(self, element):
+        """
+        Add topic element to the index (if the index is built).
+        """
+        if self._topics_by_id is None:
+            return
+        topic_id = element.get("id")
+        if topic_id is None:
+            return
+        self._topics_by_id[topic_id] = element
+        embedded_id = qualify_id(topic_id)
+        if embedded_id is not None:
+            self._topics_by_embedded_id[embedded_id] = element
+
+    def _unindex_subtree(self, element):
+        """
+        Remove topic element and all its subtopics from the index
+        (if the index is built).
+        """
+        if self._topics_by_id is None:
+            return
+        for topic_tag in element.iter(self.full_name("topic")):
+            topic_id = topic_tag.get("id")
+            if topic_id is None:
+                continue
+            self._topics_by_id.pop(topic_id, None)
+            embedded_id = qualify_id(topic_id)
+            if embedded_id is not None:
+                self._topics_by_embedded_id.pop(embedded_id, None)
 
     def embed_markers(self, xmp_file_name):
         """
@@ -616,43 +1563,213 @@ class XMindDocument(XmlHelper):
         Note: the file is not immediately accessed, it's content
         is copied during ``save``.
         """
+        self.ensure_writable("embedding markers", part = MARKERS_DIR)
         self.embed_xmp = xmp_file_name
 
-    def save(self, output_file_name):
+    def save(self, output_file_name, compression = zipfile.ZIP_STORED,
+             compresslevel = None, pretty_print = True):
         """
         Save mindmap to given file.
-        """
-        zipf = zipfile.ZipFile(output_file_name, "w")
-        self._add_to_zip(zipf, "content.xml",
-           self._serialize_xml(self.doc_tag))
-        self._add_to_zip(zipf, "styles.xml",
-           self._serialize_xml(self.styles_tag))
-        self._add_to_zip(zipf, "meta.xml", META_FILE_BODY)
-        manifest_content = MANIFEST_FILE_BODY
-        for name, data in six.iteritems(self.attachments):
-            path = ATTACHMENTS_DIR + name
-            self._add_to_zip(zipf, path, data)
-            manifest_content = manifest_content.replace(
-                "</manifest>",
-                ('<file-entry full-path="%s" media-type=""/>' % path)
-                + "\n</manifest>")
+
+        XML parts are serialized straight into the archive, without
+        building their text in memory.
+
+        Arguments
+        ---------
+
+        output_file_name : string or file-like object
+            Name of the file to write, or binary file-like object
+            (can be non-seekable, like pipe or socket file).
+        compression : int (optional)
+            ZIP compression method, ``zipfile.ZIP_STORED`` (default,
+            fastest) or ``zipfile.ZIP_DEFLATED`` (smaller files)
+        compresslevel : int (optional)
+            Compression level (see ``zipfile.ZipFile``)
+        pretty_print : bool (default True)
+            Indent generated XML. Disable to get smaller files
+            and faster save.
+        """
+        source = self.attachments.archive
+        overwriting = source is not None \
+            and isinstance(source.filename, six.string_types) \
+            and isinstance(output_file_name, six.string_types) \
+            and os.path.abspath(source.filename) \
+                == os.path.abspath(output_file_name)
+        if overwriting:
+            # Overwriting the file we read attachments from
+            self.attachments.load_all()
+            if self._search_index is None:
+                self._search_index = self._load_search_index()
+        zip_options = {}
+        if compresslevel is not None:
+            zip_options["compresslevel"] = compresslevel
+        with phase(self.stats, "save"):
+            zipf = zipfile.ZipFile(output_file_name, "w", compression,
+                                   **zip_options)
+            try:
+                self._write_zip_members(zipf, pretty_print)
+            finally:
+                zipf.close()
+        _count_written(zipf, self.stats)
+        if overwriting:
+            # old archive object describes the file as it was before,
+            # the document is now the same as the new source file
+            source.close()
+            self.attachments = Attachments(
+                zipfile.ZipFile(output_file_name, "r"), self.stats)
+            self.dirty_parts.clear()
+
+    def _write_zip_members(self, zipf, pretty_print):
+        """
+        Write all map members into zipfile zipf (save helper).
+        """
+        self._write_xml_to_zip(zipf, CONTENT_MEMBER, self.doc_tag,
+                               pretty_print)
+        self._write_xml_to_zip(zipf, STYLES_MEMBER, self.styles_tag,
+                               pretty_print)
+        self._write_search_index(zipf)
+        self._add_to_zip(zipf, META_MEMBER, META_FILE_BODY)
+        manifest_paths = []
+        for name in self.attachments:
+            self._write_attachment(zipf, name)
+            manifest_paths.append(ATTACHMENTS_DIR + name)
         if self.embed_xmp:
-            xmpf = zipfile.ZipFile(self.embed_xmp, "r")
-            manifest_content = manifest_content.replace(
-                "</manifest>",
-                '<file-entry full-path="markers/" media-type=""/>'
-                + "\n</manifest>")
+            self._write_embedded_markers(zipf, manifest_paths)
+
+        self._add_to_zip(zipf, MANIFEST_MEMBER,
+                         manifest_body(manifest_paths))
+
+    def save_incremental(self, output_file_name,
+                         compression = zipfile.ZIP_STORED,
+                         compresslevel = None, pretty_print = True):
+        """
+        Save mindmap to given file, reusing the file the map was
+        opened from. Members which were not modified (content.xml,
+        styles.xml, attachments, markers, thumbnail etc) are copied
+        from the source file as raw compressed bytes, only modified
+        parts are serialized (and compressed) again.
+
+        Parameters are the same as in ``save`` (compression
+        settings apply only to rewritten members). Output can't
+        be the source file itself. For maps not opened from file,
+        works exactly like ``save``.
+        """
+        source = self.attachments.archive
+        if source is None:
+            return self.save(output_file_name, compression,
+                             compresslevel, pretty_print)
+        if isinstance(source.filename, six.string_types) \
+                and isinstance(output_file_name, six.string_types) \
+                and os.path.abspath(source.filename) \
+                    == os.path.abspath(output_file_name):
+            raise ValueError("save_incremental can't overwrite source file")
+
+        zip_options = {}
+        if compresslevel is not None:
+            zip_options["compresslevel"] = compresslevel
+        with phase(self.stats, "save"):
+            zipf = zipfile.ZipFile(output_file_name, "w", compression,
+                                   **zip_options)
+            try:
+                self._write_zip_members_incremental(zipf, source, pretty_print)
+            finally:
+                zipf.close()
+        _count_written(zipf, self.stats)
+
+    def _write_zip_members_incremental(self, zipf, source, pretty_print):
+        """
+        Write all map members into zipfile zipf, copying unchanged
+        ones from zipfile source (save_incremental helper).
+        """
+        manifest_paths = []
+        xml_parts = {           # attribute names (doc_tag may need parsing)
+            CONTENT_MEMBER: "doc_tag",
+            STYLES_MEMBER: "styles_tag",
+        }
+        keep_markers = MARKERS_DIR not in self.dirty_parts
+        search_index_zinfo = None
+        for zinfo in source.infolist():
+            name = zinfo.filename
+            if name in xml_parts:
+                if name in self.dirty_parts:
+                    self._write_xml_to_zip(zipf, name,
+                                           getattr(self, xml_parts[name]),
+                                           pretty_print)
+                else:
+                    _copy_raw_member(source, zipf, zinfo)
+                del xml_parts[name]
+            elif name == MANIFEST_MEMBER:
+                pass    # generated below
+            elif name == SEARCH_INDEX_MEMBER:
+                search_index_zinfo = zinfo
+            elif name.startswith(ATTACHMENTS_DIR):
+                short = name[len(ATTACHMENTS_DIR):]
+                if short in self.attachments \
+                        and self.attachments.source_member(short) == name:
+                    _copy_raw_member(source, zipf, zinfo)
+                    manifest_paths.append(name)
+            elif name.startswith(MARKERS_DIR):
+                if keep_markers:
+                    _copy_raw_member(source, zipf, zinfo)
+                    manifest_paths.append(name)
+            else:
+                _copy_raw_member(source, zipf, zinfo)
+
+        for name, attr_name in sorted(xml_parts.items()):
+            self._write_xml_to_zip(zipf, name, getattr(self, attr_name),
+                                   pretty_print)
+        if self._search_index is not None:
+            self._write_search_index(zipf)
+        elif search_index_zinfo is not None \
+                and CONTENT_MEMBER not in self.dirty_parts:
+            _copy_raw_member(source, zipf, search_index_zinfo)
+        for name in self.attachments:
+            if self.attachments.source_member(name) is None:
+                self._write_attachment(zipf, name)
+                manifest_paths.append(ATTACHMENTS_DIR + name)
+        if keep_markers:
+            if any(path.startswith(MARKERS_DIR) for path in manifest_paths):
+                manifest_paths.append(MARKERS_DIR)
+        elif self.embed_xmp:
+            self._write_embedded_markers(zipf, manifest_paths)
+
+        self._add_to_zip(zipf, MANIFEST_MEMBER, manifest_body(manifest_paths))
+
+    def _write_attachment(self, zipf, name):
+        """
+        Write attachment of given name into zipfile zipf.
+        """
+        path = ATTACHMENTS_DIR + name
+        if self.attachments.is_loaded(name):
+            self._add_to_zip(zipf, path, self.attachments[name])
+        else:
+            member = self.attachments.archive.getinfo(
+                self.attachments.source_member(name))
+            self._copy_to_zip(zipf, path, self.attachments.open(name),
+                              member.file_size)
+
+    def _write_embedded_markers(self, zipf, manifest_paths):
+        """
+        Write content of embedded markers file into zipfile zipf,
+        appending written paths to manifest_paths.
+        """
+        with zipfile.ZipFile(self.embed_xmp, "r") as xmpf:
+            manifest_paths.append(MARKERS_DIR)
             for name in xmpf.namelist():
-                path = "markers/" + name
+                path = MARKERS_DIR + name
                 self._add_to_zip(
                     zipf, path,
                     xmpf.read(name))
-                manifest_content = manifest_content.replace(
-                    "</manifest>",
-                    ('<file-entry full-path="%s" media-type=""/>' % path)
-                    + "\n</manifest>")
+                manifest_paths.append(path)
 
-        self._add_to_zip(zipf, "META-INF/manifest.xml", manifest_content)
+    def to_bytes(self, **kwargs):
+        """
+        Return mindmap as bytes (content of .xmind file). Accepts
+        the same keyword arguments as ``save``.
+        """
+        output = io.BytesIO()
+        self.save(output, **kwargs)
+        return output.getvalue()
 
     def pretty_print(self):
         """
@@ -666,7 +1783,7 @@ class XMindDocument(XmlHelper):
         Return names of all attachments present inside the map
         (independent to which topic they are attached).
         """
-        return self.attachments.keys()
+        return list(self.attachments.keys())
 
     def attachment_body(self, name):
         """
@@ -674,21 +1791,65 @@ class XMindDocument(XmlHelper):
         """
         return self.attachments[name]
 
+    def open_attachment(self, name):
+        """
+        Returns file-like object giving body of attachment of given
+        name. For parsed maps the data are streamed from the map file,
+        without keeping them in memory.
+        """
+        return self.attachments.open(name)
+
+    def close(self):
+        """
+        Release the file the map was opened from. Attachments not
+        read yet are no longer available after the call (save the
+        document or call ``attachment_body`` before if needed).
+        """
+        if self.attachments.archive is not None:
+            self.attachments.archive.close()
+
     def _create_attachment(self, internal_name, data):
         """
         Private attachment-creation helper.
         Use Topic.set_attachment instead!
         """
+        self.ensure_writable()
+        if internal_name in self.attachments:
+            raise ValueError("Attachment %s already exists" % internal_name)
         self.attachments[internal_name] = data
 
     def _add_to_zip(self, zipf, name, content):
         """
         Add member of name name and content content to zipfile zipf.
         """
-        if type(content) == unicode:
+        if type(content) == six.text_type:
             content = content.encode("utf-8")
         zipf.writestr(name, content)
 
+    def _copy_to_zip(self, zipf, name, source, size):
+        """
+        Add member of name name to zipfile zipf, copying its content
+        from file-like object source. As the (uncompressed) size is
+        known, ZIP64 extensions are used only if the member needs them.
+        """
+        needs_zip64 = size * 1.05 > zipfile.ZIP64_LIMIT
+        with source:
+            with zipf.open(name, "w", force_zip64 = needs_zip64) as target:
+                shutil.copyfileobj(source, target)
+
+    def _write_xml_to_zip(self, zipf, name, tag, pretty_print = True):
+        """
+        Serialize given tag directly into member name of zipfile zipf.
+        The serialized size is not known upfront, so ZIP64 extensions
+        are always used (otherwise big maps could not be written).
+        """
+        with phase(self.stats, "serialize"):
+            with zipf.open(name, "w", force_zip64 = True) as target:
+                etree.ElementTree(tag).write(
+                    target,
+                    encoding = "utf-8", method="xml",
+                    xml_declaration=True, pretty_print=pretty_print)
+
     def _serialize_xml(self, tag):
         """
         Serialize given tag to text using proper settings.
@@ -5,6 +5,9 @@
 Embedded-id trick handling. See Topic.get_embedded_id for description
 """
 from __future__ import print_function
+import itertools
+import os
+import threading
 import six
 
 PFX_EMBEDDED = "afaf"
@@ -33,23 +36,110 @@ def unique_id(id_text):
     else:
         return id_text.lstrip("0")
 
+_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+_prefix_counter = itertools.count(1)
+
+def _base36(number, width = 0):
+    digits = []
+    while number:
+        number, rest = divmod(number, 36)
+        digits.append(_DIGITS[rest])
+    return "".join(reversed(digits)).rjust(width, "0")
+
+def unique_prefix():
+    """
+    Return identifier prefix unique within the host: made of process
+    id and process-wide sequence number, so every call (in any thread
+    or process) gives different value. Use as IdGen prefix to make
+    maps built in parallel never share identifiers.
+    """
+    return _base36(os.getpid(), 5) + _base36(six.advance_iterator(_prefix_counter))
+
 class IdGen(object):
     """
     Generate unique identifiers for topics. Used internally.
+
+    Generator is thread-safe. Every XMindDocument has its own
+    generator, prefix (if given) is put after the standard PFX_OTHER
+    prefix of non-embedded identifiers.
     """
     def __init__(self,
-                 length = 26):
+                 length = 26, prefix = ""):
+        if not (prefix == "" or prefix.isalnum()):
+            raise ValueError("IdGen prefix must be alphanumeric (%s)" % prefix)
+        if len(prefix) >= length - PFX_LEN:
+            raise ValueError("IdGen prefix too long (%s)" % prefix)
         self.counter = 0
         self.length = length
-        
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._pending_reserve = None
+
+    def counter_of(self, identifier):
+        """
+        Returns counter value of identifier generated (without
+        embedded id) by generator of the same prefix and length,
+        None for any other identifier.
+        """
+        head = PFX_OTHER + self.prefix
+        if len(identifier) != self.length or not identifier.startswith(head):
+            return None
+        digits = identifier[len(head):]
+        if not digits.isdigit():
+            return None
+        return int(digits)
+
+    def reserve(self, identifiers):
+        """
+        Note identifiers already in use (for example present in parsed
+        map), so counter continues after the largest of them and they
+        are never generated again.
+        """
+        largest = self._largest_counter(identifiers)
+        with self._lock:
+            if largest > self.counter:
+                self.counter = largest
+
+    def reserve_later(self, identifiers_source):
+        """
+        Like reserve, but identifiers are obtained (by calling
+        identifiers_source) only when the first identifier is
+        generated. Done under the generator lock, so no thread can
+        get an identifier before reservation is complete.
+        """
+        with self._lock:
+            self._pending_reserve = identifiers_source
+
+    def _largest_counter(self, identifiers):
+        largest = 0
+        for identifier in identifiers:
+            counter = self.counter_of(identifier)
+            if counter is not None and counter > largest:
+                largest = counter
+        return largest
+
+    def _next_counter(self):
+        """
+        Increment counter (atomically) and return its value.
+        """
+        with self._lock:
+            if self._pending_reserve is not None:
+                largest = self._largest_counter(self._pending_reserve())
+                self._pending_reserve = None
+                if largest > self.counter:
+                    self.counter = largest
+            self.counter += 1
+            return self.counter
+
     def next(self, embedded = None):
         """
         Give next unique id. If embedded is specified, embeds it inside.
         """
-        self.counter += 1
+        counter = self._next_counter()
         if embedded is None:
-            suffix_len = self.length - PFX_LEN
-            identifier = "%s%0*d" % (PFX_OTHER, suffix_len, self.counter)
+            suffix_len = self.length - PFX_LEN - len(self.prefix)
+            identifier = "%s%s%0*d" % (PFX_OTHER, self.prefix,
+                                       suffix_len, counter)
             if len(identifier) > self.length:
                 raise Exception("IdGen overflow")
             return identifier
@@ -63,7 +153,7 @@ class IdGen(object):
             # - 4 chars - counter (yeah, rotated if it overflows 10000)
             # - rest -  embedded id
             identifier = "%s%02d%04d" % (PFX_EMBEDDED, lensemb,
-                                         self.counter % 10000)
+                                         counter % 10000)
             rest = self.length - PFX_LEN - 6
             if lensemb <= rest:
                 identifier += "0" * (rest-lensemb)
@@ -76,6 +166,11 @@ class IdGen(object):
 
             return identifier
 
+    __next__ = next
+
+    def __iter__(self):
+        return self
+
 if __name__ == "__main__":
     gen = IdGen()
     for x in range(1, 5):
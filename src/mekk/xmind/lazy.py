@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+# (c) 2008-2010, Marcin Kasperski
+
+"""
+Lazy parsing of content.xml: sheets are parsed one by one, when
+first needed.
+"""
+from __future__ import unicode_literals
+
+import re
+from lxml import etree
+import six
+from .stats import phase
+
+_ROOT_START = re.compile(br"<([\w.-]+:)?xmap-content[\s>]")
+_NAME_END = b" \t\r\n>/"
+
+def _find_tag(data, tag, start, end = None):
+    """
+    Position of the first tag (``<name`` or ``</name`` given as bytes,
+    followed by whitespace, ``>`` or ``/``) in data[start:end],
+    or -1. Uses plain find, much faster than regular expressions
+    on large documents.
+    """
+    if end is None:
+        end = len(data)
+    while True:
+        position = data.find(tag, start, end)
+        if position < 0:
+            return -1
+        following = data[position + len(tag):position + len(tag) + 1]
+        if following and following in _NAME_END:
+            return position
+        start = position + 1
+
+def _rfind_tag(data, tag, start, end):
+    """
+    Like _find_tag, but returns position of the last tag.
+    """
+    while True:
+        position = data.rfind(tag, start, end)
+        if position < 0:
+            return -1
+        following = data[position + len(tag):position + len(tag) + 1]
+        if following and following in _NAME_END:
+            return position
+        end = position
+
+def _sheet_title(sheet):
+    """
+    Text of title child of sheet element (None if missing).
+    """
+    for child in sheet:
+        if isinstance(child.tag, six.string_types) \
+                and etree.QName(child).localname == "title":
+            return child.text
+    return None
+
+class LazyContent(object):
+    """
+    Parsed-on-demand content.xml.
+
+    Sheet boundaries are found by scanning the raw data for sheet
+    tags (which can't appear inside text or attribute values, as
+    ``<`` is always escaped there). Data containing comments, CDATA
+    sections or processing instructions (which could hide tags),
+    or anything but sheets inside top-level element, are not split
+    (see ``scan``). Sheet titles are read by parsing
+    sheet fragments without their topics. Every sheet is parsed when
+    first requested and grafted (in document order) into ``root`` -
+    the copy of top-level ``<xmap-content>`` element.
+
+    Use ``scan`` to create.
+    """
+
+    def __init__(self, data, prolog, root_start, prefix, root_end, spans,
+                 stats):
+        self.data = data
+        self.prolog = prolog
+        self.root_start = root_start
+        self.prefix = prefix
+        self.root_end = root_end
+        self.spans = spans
+        self.stats = stats
+        self.root = self._parse(b"")
+        self.sheets = [None] * len(spans)
+        self.titles = [self._scan_title(start, end) for start, end in spans]
+
+    @classmethod
+    def scan(cls, data, stats = None):
+        """
+        Locate sheets in content.xml data. Returns LazyContent, or
+        None if data can't be split into sheets reliably (they should
+        be parsed as a whole then).
+        """
+        match = _ROOT_START.search(data)
+        if match is None:
+            return None
+        root_close = data.find(b">", match.end() - 1)
+        if root_close < 0 or data[root_close - 1:root_close] == b"/":
+            return None
+        for marker in (b"<!--", b"<![CDATA[", b"<?"):
+            if data.find(marker, root_close) >= 0:
+                return None     # markup which could hide or fake tags
+        prefix = match.group(1) or b""
+        root_end = b"</" + prefix + b"xmap-content>"
+        sheet_start = b"<" + prefix + b"sheet"
+        sheet_end = b"</" + prefix + b"sheet"
+
+        spans = []
+        position = root_close + 1
+        while True:
+            start = _find_tag(data, sheet_start, position)
+            if start < 0:
+                break
+            end = _find_tag(data, sheet_end, start + 1)
+            if end < 0 or _find_tag(data, sheet_start, start + 1, end) >= 0:
+                return None
+            end = data.find(b">", end) + 1
+            spans.append((start, end))
+            position = end
+        if not spans:
+            return None
+        # anything but sheets inside top-level element would be lost
+        closing = _rfind_tag(data, root_end[:-1], spans[-1][1], len(data))
+        if closing < 0:
+            return None
+        gaps = [(root_close + 1, spans[0][0]), (spans[-1][1], closing)]
+        gaps.extend((spans[i - 1][1], spans[i][0])
+                    for i in range(1, len(spans)))
+        if any(data[start:end].strip() for start, end in gaps):
+            return None
+        return cls(data, data[:match.start()],
+                   data[match.start():root_close + 1], prefix, root_end,
+                   spans, stats)
+
+    def _parse(self, fragment):
+        """
+        Parse fragment (as child of top-level element), returns
+        top-level element.
+        """
+        with phase(self.stats, "parse"):
+            return etree.XML(self.prolog + self.root_start + fragment
+                             + self.root_end)
+
+    def _scan_title(self, start, end):
+        """
+        Title of sheet occupying data[start:end] (parsed without
+        its topics).
+        """
+        data = self.data
+        topic_start = _find_tag(data, b"<" + self.prefix + b"topic",
+                                start, end)
+        topic_end = _rfind_tag(data, b"</" + self.prefix + b"topic",
+                               start, end)
+        if topic_start < 0 or topic_end < topic_start:
+            fragment = data[start:end]
+        else:
+            fragment = data[start:topic_start] \
+                + data[data.find(b">", topic_end) + 1:end]
+        return _sheet_title(self._parse(fragment)[0])
+
+    def __len__(self):
+        return len(self.spans)
+
+    def title(self, index):
+        """
+        Title of sheet of given index (current one if already loaded).
+        """
+        sheet = self.sheets[index]
+        if sheet is None:
+            return self.titles[index]
+        return _sheet_title(sheet)
+
+    def sheet(self, index):
+        """
+        Returns sheet element of given index (parsing it if necessary).
+        """
+        sheet = self.sheets[index]
+        if sheet is None:
+            start, end = self.spans[index]
+            sheet = self._parse(self.data[start:end])[0]
+            if self.stats is not None and self.stats.count_elements:
+                self.stats.count("elements_parsed",
+                                 sum(1 for element in sheet.iter()))
+            position = sum(1 for loaded in self.sheets[:index]
+                           if loaded is not None)
+            self.root.insert(position, sheet)
+            self.sheets[index] = sheet
+        return sheet
+
+    def load_all(self):
+        """
+        Parse all remaining sheets, returns complete top-level element.
+        """
+        for index in range(len(self.spans)):
+            self.sheet(index)
+        self.data = None
+        return self.root
@@ -0,0 +1,392 @@
+# -*- coding: utf-8 -*-
+# (c) 2008-2010, Marcin Kasperski
+
+"""
+Three-way merge of maps: reconciles changes made to the same map
+in two places (typically: regenerated by mekk.xmind and edited
+inside XMind). Topics are matched on their correlation ids, so
+embedded ids (see Topic.get_embedded_id) are what makes generated
+topics recognizable after XMind edits.
+"""
+from __future__ import unicode_literals
+
+from collections import namedtuple
+import copy
+import os
+from lxml import etree
+import six
+from .id_gen import unique_id
+from .xmlutil import ns_name
+
+TITLE = "title"
+NOTE = "note"
+MARKERS = "markers"
+LINK = "link"
+PARENT = "parent"
+REMOVED = "removed"
+
+_FIELDS = (TITLE, NOTE, MARKERS, LINK)
+_FIELD_INDEX = dict((field, i) for i, field in enumerate(_FIELDS))
+_HREF = ns_name("xlink", "href")
+_ATTACHMENT_PREFIX = "xap:attachments/"
+
+MergeConflict = namedtuple(
+    "MergeConflict", ["key", "field", "base", "ours", "theirs"])
+MergeConflict.__doc__ = """
+Change which could not be merged automatically (merged map keeps
+our version).
+
+key : string
+    Topic correlation id (see Topic.get_correlation_id)
+field : string
+    TITLE, NOTE, MARKERS, LINK (both sides changed it differently),
+    PARENT (both sides moved the topic, or the topic can't be placed
+    where theirs put it) or REMOVED (one side removed the topic,
+    the other changed it)
+base, ours, theirs :
+    Values of the field in every map (None if missing there), for
+    PARENT ``(parent key, topics type)`` pairs. For REMOVED the
+    side which kept the topic gets: changed fields (if theirs kept
+    it) or keys of changed, moved and added topics of the subtree
+    (if ours kept it), other values are None
+"""
+
+class _TopicState(namedtuple("_TopicState",
+                               ["topic_id", "parent", "values"])):
+    """
+    Mergeable properties of single topic: parent (``(parent key,
+    topics type)``, None for sheet root topic) and values of _FIELDS
+    (markers as sorted tuple). Made of tuples and strings only, so
+    garbage collector does not track snapshots of big maps.
+    """
+    __slots__ = ()
+
+    def get(self, field):
+        if field == PARENT:
+            return self.parent
+        return self.values[_FIELD_INDEX[field]]
+
+_MISSING = _TopicState(None, None, (None, None, (), None))
+
+class _Snapshot(object):
+    """
+    All topics of a map: dictionary correlation id -> _TopicState,
+    and keys in document order (parents before their children).
+    Built in single pass over the tree.
+    """
+
+    def __init__(self, doc):
+        names = dict((name, doc.full_name(name)) for name in
+                     ["topic", "topics", "title", "notes", "plain",
+                      "marker-refs", "marker-ref", "children"])
+        self.names = names
+        self.order = []
+        self.states = {}
+        topic_name, topics_name, title_name = \
+            names["topic"], names["topics"], names["title"]
+        # open topics: [element, key, topic id, parent, title, note,
+        # markers, link], filled as elements are met. Elements are
+        # not kept (keeping lxml proxies of all topics is expensive)
+        stack = []
+        for event, element in etree.iterwalk(
+                doc.doc_tag, events = ("start", "end"),
+                tag = (topic_name, title_name, names["plain"],
+                       names["marker-ref"])):
+            tag = element.tag
+            if event == "end":
+                if tag == topic_name:
+                    element, key, topic_id, parent, title, note, \
+                        markers, link = stack.pop()
+                    self.states[key] = _TopicState(
+                        topic_id, parent,
+                        (title, note, tuple(sorted(set(markers))), link))
+                continue
+            container = element.getparent()
+            if tag == topic_name:
+                topic_id = element.get("id")
+                key = unique_id(topic_id)
+                parent = None
+                if stack and container.tag == topics_name:
+                    parent = (stack[-1][1], container.get("type"))
+                stack.append([element, key, topic_id, parent, None, None,
+                              [], element.get(_HREF)])
+                self.order.append(key)
+            elif not stack:
+                continue
+            elif tag == title_name:
+                if container == stack[-1][0]:
+                    stack[-1][4] = element.text
+            elif container.getparent() == stack[-1][0]:
+                if tag == names["plain"]:
+                    if container.tag == names["notes"]:
+                        stack[-1][5] = element.text
+                elif container.tag == names["marker-refs"]:
+                    stack[-1][6].append(element.get("marker-id"))
+
+    def get(self, key):
+        return self.states.get(key)
+
+def _normalized(doc):
+    """
+    Parsed equivalent of doc (created maps use non-namespaced tags,
+    elements can't be moved between them and parsed maps).
+    """
+    if doc.is_creating:
+        return type(doc).from_bytes(doc.to_bytes())
+    return doc
+
+def _changed_fields(base, state):
+    """
+    Names of fields (and PARENT) of state differing from base.
+    """
+    if state.values == base.values and state.parent == base.parent:
+        return []
+    return [field for field in _FIELDS + (PARENT,)
+            if state.get(field) != base.get(field)]
+
+class _Merger(object):
+    """
+    Applies theirs changes to merged (copy of ours) map.
+    """
+
+    def __init__(self, base, ours, theirs):
+        self.base = _Snapshot(base)
+        self.ours = _Snapshot(ours)
+        self.theirs = _Snapshot(theirs)
+        self.theirs_doc = theirs
+        self.merged = type(ours).from_bytes(ours.to_bytes())
+        self.names = self.base.names
+        self.conflicts = []
+        self._elements = None
+
+    @property
+    def elements(self):
+        """
+        Dictionary key -> merged map topic element (built when first
+        needed, merged is a copy of ours).
+        """
+        if self._elements is None:
+            merged_topics = self.merged.doc_tag.iter(self.names["topic"])
+            self._elements = dict(
+                (key, element) for key, element
+                in zip(self.ours.order, merged_topics))
+        return self._elements
+
+    def source(self, state):
+        """
+        Theirs topic element of given state.
+        """
+        return self.theirs_doc.get_topic_by_id(state.topic_id).topic_tag
+
+    def conflict(self, key, field, base, ours, theirs):
+        self.conflicts.append(MergeConflict(key, field, base, ours, theirs))
+
+    def run(self):
+        """
+        Merge, returns ``(merged, conflicts)``. Moves are applied
+        after all additions (so new parents are present), removals
+        at the end.
+        """
+        moves = []
+        for key in self.theirs.order:
+            theirs = self.theirs.get(key)
+            base = self.base.get(key)
+            ours = self.ours.get(key)
+            if ours is None:
+                if base is None:
+                    self.add(key, theirs)
+                    continue
+                changed = _changed_fields(base, theirs)
+                if changed:             # removed by ours
+                    self.conflict(key, REMOVED, None, None, tuple(changed))
+                continue
+            if base is None:
+                base = _MISSING         # added on both sides
+            if theirs.values != base.values:
+                for field in _FIELDS:
+                    self.merge_field(key, field, base, ours, theirs)
+            if theirs.parent != base.parent:
+                if ours.parent == base.parent:
+                    moves.append((key, theirs.parent))
+                elif ours.parent != theirs.parent:
+                    self.conflict(key, PARENT, base.parent, ours.parent,
+                                  theirs.parent)
+        for key, parent in moves:
+            self.move(key, parent)
+        self.remove_deleted()
+        return self.merged, self.conflicts
+
+    def merge_field(self, key, field, base, ours, theirs):
+        base_value, ours_value, theirs_value = \
+            base.get(field), ours.get(field), theirs.get(field)
+        if theirs_value == base_value or theirs_value == ours_value:
+            return
+        if ours_value != base_value:
+            self.conflict(key, field, base_value, ours_value, theirs_value)
+            return
+        getattr(self, "set_" + field)(self.elements[key], self.source(theirs))
+
+    def _replace_child(self, element, source, tag_name):
+        """
+        Replaces child of given name of merged topic element with copy
+        of the one of theirs source element (or removes it).
+        """
+        name = self.names[tag_name]
+        new = None
+        for child in source.iterchildren(tag = name):
+            new = copy.deepcopy(child)
+            break
+        for child in element.iterchildren(tag = name):
+            if new is None:
+                element.remove(child)
+            else:
+                element.replace(child, new)
+            return
+        if new is not None:
+            element.append(new)
+
+    def set_title(self, element, source):
+        self._replace_child(element, source, "title")
+
+    def set_note(self, element, source):
+        self._replace_child(element, source, "notes")
+
+    def set_markers(self, element, source):
+        self._replace_child(element, source, "marker-refs")
+
+    def set_link(self, element, source):
+        link = source.get(_HREF)
+        if link is None:
+            element.attrib.pop(_HREF, None)
+            return
+        if link.startswith(_ATTACHMENT_PREFIX):
+            name = link[len(_ATTACHMENT_PREFIX):]
+            data = self.theirs_doc.attachment_body(name)
+            merged = self.merged
+            if name in merged.attachments \
+                    and merged.attachment_body(name) != data:
+                # different attachment of the same name added by ours
+                name = six.advance_iterator(merged.id_gen) \
+                    + os.path.splitext(name)[1]
+                link = _ATTACHMENT_PREFIX + name
+            if name not in merged.attachments:
+                merged._create_attachment(name, data)
+        element.set(_HREF, link)
+
+    def _topics_tag(self, parent):
+        """
+        Merged topics block for given ``(parent key, type)``
+        (created if necessary), None if the parent is missing.
+        """
+        if parent is None:
+            return None
+        parent_key, topics_type = parent
+        parent_element = self.elements.get(parent_key)
+        if parent_element is None:
+            return None
+        children_tag = self.merged.find_or_create_child(
+            parent_element, "children")
+        topics_tag = self.merged.find_child_with_attribute(
+            children_tag, "topics", "type", topics_type)
+        if topics_tag is None:
+            topics_tag = self.merged.create_child(
+                children_tag, "topics", type = topics_type)
+        return topics_tag
+
+    def add(self, key, theirs):
+        """
+        Copy topic added by theirs (without subtopics - they are
+        added separately) to merged map.
+        """
+        topics_tag = self._topics_tag(theirs.parent)
+        if topics_tag is None:
+            self.conflict(key, PARENT, None, None, theirs.parent)
+            return
+        source = self.source(theirs)
+        element = copy.deepcopy(source)
+        for child in element.iterchildren(tag = self.names["children"]):
+            element.remove(child)
+            break
+        topics_tag.append(element)
+        self.elements[key] = element
+        if theirs.get(LINK) is not None:
+            self.set_link(element, source)
+
+    def move(self, key, parent):
+        """
+        Move merged topic under new parent (unless the parent is
+        missing, or is the topic descendant).
+        """
+        element = self.elements[key]
+        topics_tag = self._topics_tag(parent)
+        ancestor = topics_tag
+        while ancestor is not None and ancestor is not element:
+            ancestor = ancestor.getparent()
+        if topics_tag is None or ancestor is element:
+            self.conflict(key, PARENT, self.base.get(key).parent,
+                          self.ours.get(key).parent, parent)
+            return
+        topics_tag.append(element)
+
+    def remove_deleted(self):
+        """
+        Remove from merged map topics removed by theirs (unless
+        changed by ours, or having subtopics added by ours).
+        """
+        handled = set()                 # subtrees removed or kept
+        topic_name = self.names["topic"]
+        for key in self.base.order:
+            if key in handled or key in self.theirs.states \
+                    or key not in self.ours.states:
+                continue
+            element = self.elements[key]
+            subtree = [(unique_id(topic_tag.get("id")), topic_tag)
+                       for topic_tag in element.iter(topic_name)]
+            handled.update(sub_key for sub_key, topic_tag in subtree)
+            changed = set()
+            for sub_key, topic_tag in subtree:
+                base = self.base.get(sub_key)
+                if base is None:
+                    changed.add(sub_key)
+                    continue
+                ours = self.ours.get(sub_key)
+                if _changed_fields(base, ours):
+                    changed.add(sub_key)
+            if changed:
+                self.conflict(key, REMOVED, None,
+                              tuple(sorted(changed)), None)
+                continue
+            topics_tag = element.getparent()
+            if topics_tag is None or topics_tag.tag != self.names["topics"]:
+                continue                # sheet root topic
+            topics_tag.remove(element)
+            for sub_key, topic_tag in subtree:
+                self.elements.pop(sub_key, None)
+
+def merge(base, ours, theirs):
+    """
+    Three-way merge: combines changes made in ours and theirs
+    (versions of base map). Returns ``(merged, conflicts)`` - new
+    XMindDocument (based on ours) and list of MergeConflict.
+
+    Topics are matched on correlation ids. Titles, notes, markers
+    and links changed only by theirs are copied, topics added by
+    theirs are added, moved by theirs are moved and removed by theirs
+    are removed. Where both sides changed the same field differently,
+    or one side removed topic the other changed, our version is kept
+    and conflict is reported. Every map is processed in single pass
+    with dictionary lookups, so the cost grows linearly with map size.
+
+    Sheets added by theirs are not merged (their topics are reported
+    as conflicts), styles of topics added by theirs are not copied.
+
+    >>> merged, conflicts = merge(generated_before, generated_now, edited)
+    >>> merged.save("result.xmind")
+    """
+    base, ours, theirs = [_normalized(doc) for doc in (base, ours, theirs)]
+    merger = _Merger(base, ours, theirs)
+    result = merger.run()
+    merger.merged.ensure_writable()
+    merger.merged._topics_by_id = None
+    merger.merged._topics_by_embedded_id = None
+    return result
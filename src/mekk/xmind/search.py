@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+# (c) 2008-2010, Marcin Kasperski
+
+"""
+Full-text search index over topic titles, plain notes and labels.
+"""
+from __future__ import unicode_literals
+
+import bisect
+import json
+import re
+
+SEARCH_INDEX_MEMBER = "mekk/search-index.json"
+SEARCH_INDEX_VERSION = 1
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+def tokenize(text):
+    """
+    Split text into (lowercased) words.
+
+    >>> tokenize(u"Some Text, some-more")
+    [u'some', u'text', u'some', u'more']
+    """
+    return _TOKEN.findall(text.lower())
+
+class SearchIndex(object):
+    """
+    Inverted index: token -> topics containing it. Topics are kept
+    as positions in topic_ids list (topic identifiers in document
+    order), so results are easily returned in document order.
+
+    Usually used via ``XMindDocument.search``.
+    """
+
+    def __init__(self, topic_ids, postings, content_crc = None):
+        """
+        Arguments
+        ---------
+
+        topic_ids : list
+            Identifiers of all indexed topics, in document order
+        postings : dict
+            Token to sorted list of positions (in topic_ids)
+        content_crc : int (optional)
+            CRC of ``content.xml`` the index was built for (used to
+            detect stale indexes saved in map files)
+        """
+        self.topic_ids = topic_ids
+        self.postings = postings
+        self.content_crc = content_crc
+        self._tokens = sorted(postings)
+
+    @classmethod
+    def build(cls, doc):
+        """
+        Index all topics of given XMindDocument.
+        """
+        names = dict((name, doc.full_name(name)) for name in
+                     ["topic", "title", "notes", "plain", "labels", "label"])
+        topic_ids = []
+        postings = {}
+        for element in doc.doc_tag.iter(names["topic"]):
+            texts = []
+            for title in element.iterchildren(tag = names["title"]):
+                texts.append(title.text)
+            for notes in element.iterchildren(tag = names["notes"]):
+                for plain in notes.iterchildren(tag = names["plain"]):
+                    texts.append(plain.text)
+            for labels in element.iterchildren(tag = names["labels"]):
+                for label in labels.iterchildren(tag = names["label"]):
+                    texts.append(label.text)
+            position = len(topic_ids)
+            topic_ids.append(element.get("id"))
+            for text in texts:
+                if not text:
+                    continue
+                for token in tokenize(text):
+                    positions = postings.setdefault(token, [])
+                    if not positions or positions[-1] != position:
+                        positions.append(position)
+        return cls(topic_ids, postings)
+
+    def search(self, query):
+        """
+        Returns identifiers (in document order) of topics matching
+        all words of the query. Word ending with ``*`` matches any
+        word it is prefix of.
+
+        >>> index.search(u"project plan*")
+        """
+        terms = query.split()
+        if not terms:
+            return []
+        found = None
+        for term in terms:
+            if term.endswith("*"):
+                positions = self._prefix_positions(term[:-1].lower())
+            else:
+                positions = None
+                for token in tokenize(term):
+                    word = set(self.postings.get(token, ()))
+                    positions = word if positions is None \
+                        else positions & word
+                positions = positions or set()
+            found = positions if found is None else found & positions
+            if not found:
+                return []
+        return [self.topic_ids[position] for position in sorted(found)]
+
+    def _prefix_positions(self, prefix):
+        """
+        Positions of topics having any word starting with prefix.
+        """
+        positions = set()
+        tokens = self._tokens
+        for i in range(bisect.bisect_left(tokens, prefix), len(tokens)):
+            if not tokens[i].startswith(prefix):
+                break
+            positions.update(self.postings[tokens[i]])
+        return positions
+
+    def to_json(self):
+        """
+        Serialize the index (to be saved as SEARCH_INDEX_MEMBER).
+        """
+        return json.dumps({"version": SEARCH_INDEX_VERSION,
+                           "content_crc": self.content_crc,
+                           "topic_ids": self.topic_ids,
+                           "postings": self.postings},
+                          separators = (",", ":"), sort_keys = True)
+
+    @classmethod
+    def from_json(cls, text):
+        """
+        Load index serialized with to_json. Returns None if the data
+        are in unknown format.
+        """
+        data = json.loads(text)
+        if data.get("version") != SEARCH_INDEX_VERSION:
+            return None
+        return cls(data["topic_ids"], data["postings"], data["content_crc"])
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+# (c) 2008-2010, Marcin Kasperski
+
+"""
+Streaming access to XMind maps. Handles maps too large to be
+comfortably kept in memory as lxml trees.
+"""
+from __future__ import unicode_literals
+
+from collections import namedtuple
+import zipfile
+from lxml import etree
+from .xmlutil import ns_name
+
+CONTENT_MEMBER = "content.xml"
+
+TopicRecord = namedtuple(
+    "TopicRecord",
+    ["id", "title", "depth", "parent_id", "markers", "link", "label"])
+TopicRecord.__doc__ = """
+Lightweight description of single topic, as yielded by iter_topics.
+
+id : string
+    XMind topic identifier
+title : unicode
+    Topic title (None if missing)
+depth : int
+    Topic depth (0 for sheet root topic)
+parent_id : string
+    Identifier of the parent topic (None for sheet root topic)
+markers : list
+    Marker identifiers, in map order
+link : string
+    Link (or ``xap:attachments/...`` reference), None if missing
+label : unicode
+    First topic label, None if missing
+"""
+
+_TOPIC = ns_name("xm", "topic")
+_TITLE = ns_name("xm", "title")
+_LABEL = ns_name("xm", "label")
+_LABELS = ns_name("xm", "labels")
+_MARKER_REF = ns_name("xm", "marker-ref")
+_SHEET = ns_name("xm", "sheet")
+_HREF = ns_name("xlink", "href")
+
+class _PendingTopic(object):
+    """
+    Topic being parsed (opened, but not yet closed) by iter_topics.
+    """
+    __slots__ = ("id", "title", "depth", "parent_id", "markers",
+                 "link", "label")
+
+    def __init__(self, element, depth, parent_id):
+        self.id = element.get("id")
+        self.link = element.get(_HREF)
+        self.depth = depth
+        self.parent_id = parent_id
+        self.title = None
+        self.label = None
+        self.markers = []
+
+    def record(self):
+        return TopicRecord(self.id, self.title, self.depth, self.parent_id,
+                           self.markers, self.link, self.label)
+
+def _release(element):
+    """
+    Drop already processed element (and its processed preceding
+    siblings) so the partially built tree does not grow.
+    """
+    element.clear()
+    parent = element.getparent()
+    if parent is not None:
+        while element.getprevious() is not None:
+            del parent[0]
+
+def iter_topics(source):
+    """
+    Parse content.xml of given map incrementally, yielding TopicRecord
+    for every topic (of every sheet). Processed elements are released
+    as soon as they are parsed, so memory usage depends on map depth,
+    not on map size.
+
+    Records are yielded when topic element is closed, so children are
+    reported before their parents (use depth and parent_id to restore
+    the structure).
+
+    Arguments
+    ---------
+
+    source : string (file name) or file-like object
+        XMind map to read
+    """
+    archive = zipfile.ZipFile(source, "r")
+    try:
+        try:
+            stream = archive.open(CONTENT_MEMBER)
+        except KeyError:
+            raise Exception(
+                "Invalid xmind file: %s (missing content block)" % source)
+        stack = []
+        for event, element in etree.iterparse(
+                stream, events = ("start", "end"),
+                tag = (_TOPIC, _TITLE, _LABEL, _MARKER_REF, _SHEET)):
+            tag = element.tag
+            if event == "start":
+                if tag == _TOPIC:
+                    parent_id = stack[-1].id if stack else None
+                    stack.append(_PendingTopic(element, len(stack), parent_id))
+                continue
+            if tag == _TOPIC:
+                yield stack.pop().record()
+                _release(element)
+            elif tag == _SHEET:
+                _release(element)
+            elif not stack:
+                pass    # sheet title
+            elif tag == _TITLE:
+                if element.getparent().tag == _TOPIC:
+                    stack[-1].title = element.text
+            elif tag == _LABEL:
+                if stack[-1].label is None \
+                        and element.getparent().tag == _LABELS:
+                    stack[-1].label = element.text
+            elif tag == _MARKER_REF:
+                stack[-1].markers.append(element.get("marker-id"))
+        stream.close()
+    finally:
+        archive.close()
@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+# (c) 2008-2010, Marcin Kasperski
+
+"""
+Streaming generation of XMind maps. Writes content.xml directly
+into the archive, so maps larger than memory can be generated.
+"""
+from __future__ import unicode_literals
+
+import os
+import zipfile
+from lxml import etree
+import six
+from .id_gen import IdGen
+from .xmlutil import XmlHelper, ns_name, CONTENT_NSMAP, STYLES_NSMAP
+from .document import TopicStyle, manifest_body, META_FILE_BODY, \
+    SHAPE_ROUND_RECTANGLE, CONTENT_MEMBER, STYLES_MEMBER, META_MEMBER, \
+    MANIFEST_MEMBER
+
+_TAGS = dict(
+    (name, ns_name("xm", name))
+    for name in ["xmap-content", "sheet", "topic", "title", "children",
+                 "topics", "notes", "plain", "html", "labels", "label",
+                 "marker-refs", "marker-ref"])
+_XHTML_P = ns_name("xhtml", "p")
+_HREF = ns_name("xlink", "href")
+
+class _OpenTopic(object):
+    """
+    Topic element being written (started, but not yet ended).
+    """
+    __slots__ = ("element", "children", "topics", "mode")
+
+    def __init__(self, element):
+        self.element = element
+        self.children = None
+        self.topics = None
+        self.mode = None
+
+class StreamingXMindWriter(XmlHelper):
+    """
+    Writes XMind map incrementally. Only currently open topics (path
+    from the root to the topic being written) are kept in memory, so
+    memory usage depends on map depth, not on map size. Produced
+    files have the same structure as saved by ``XMindDocument.save``.
+
+    Topics are written in document order, all topic properties must be
+    given when topic is started:
+
+    >>> with StreamingXMindWriter("big.xmind") as writer:
+    ...     writer.start_sheet(u"Sheet")
+    ...     writer.start_topic(u"Root")
+    ...     for i in range(1000000):
+    ...         writer.start_topic(u"Item %d" % i, note = u"Some note")
+    ...         writer.end_topic()
+    ...     writer.end_topic()
+    ...     writer.end_sheet()
+
+    or, from records:
+
+    >>> with StreamingXMindWriter("big.xmind") as writer:
+    ...     writer.write_records([(0, u"Root"), (1, u"Child"),
+    ...                           (2, u"Grandchild", {"label": u"x"})])
+
+    Attachments are not supported (use ``XMindDocument`` for them).
+    """
+
+    def __init__(self, output_file_name, compression = zipfile.ZIP_STORED,
+                 compresslevel = None, id_prefix = ""):
+        """
+        Arguments
+        ---------
+
+        output_file_name : string or file-like object
+            Where the map is written.
+        compression, compresslevel : (optional)
+            ZIP compression settings (see ``XMindDocument.save``)
+        id_prefix : string (optional)
+            Prefix of generated identifiers (see ``XMindDocument.create``)
+        """
+        XmlHelper.__init__(self, True)
+        self.id_gen = IdGen(26, id_prefix)
+        self.styles_tag = etree.Element(
+            "xmap-styles", nsmap = STYLES_NSMAP, version = "2.0")
+        zip_options = {}
+        if compresslevel is not None:
+            zip_options["compresslevel"] = compresslevel
+        self._zipf = zipfile.ZipFile(output_file_name, "w", compression,
+                                     **zip_options)
+        if isinstance(output_file_name, six.string_types):
+            self._output_path = output_file_name
+        else:
+            self._output_path = None
+        self._stream = self._zipf.open(CONTENT_MEMBER, "w",
+                                       force_zip64 = True)
+        self._xmlfile = etree.xmlfile(self._stream, encoding = "utf-8")
+        self._xf = self._xmlfile.__enter__()
+        self._xf.write_declaration()
+        self._root = self._xf.element(
+            _TAGS["xmap-content"], nsmap = CONTENT_NSMAP, version = "2.0")
+        self._root.__enter__()
+        self._topic_styles = {}
+        self._sheet = None
+        self._sheet_has_root = False
+        self._topics = []
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def create_topic_style(self, fill, shape = SHAPE_ROUND_RECTANGLE,
+                           line_color = "#CACACA", line_width = "1pt"):
+        """
+        Create visual topic style, parameters are the same as in
+        ``XMindDocument.create_topic_style`` (styles are interned
+        in the same way).
+        """
+        key = (fill, shape, line_color, line_width)
+        style = self._topic_styles.get(key)
+        if style is None:
+            style = self._topic_styles[key] = TopicStyle.create(
+                self, fill, shape, line_color, line_width)
+        return style
+
+    def start_sheet(self, title):
+        """
+        Start new sheet. Any sheet being written is ended.
+        """
+        if self._sheet is not None:
+            self.end_sheet()
+        self._sheet = self._xf.element(
+            _TAGS["sheet"], id = six.advance_iterator(self.id_gen))
+        self._sheet.__enter__()
+        self._write_text(_TAGS["title"], title)
+        self._sheet_has_root = False
+
+    def end_sheet(self):
+        """
+        End the sheet being written (ending all its open topics).
+        """
+        if self._sheet is None:
+            raise ValueError("No sheet is being written")
+        while self._topics:
+            self.end_topic()
+        self._sheet.__exit__(None, None, None)
+        self._sheet = None
+
+    def start_topic(self, title, embedded_id = None, note = None,
+                    label = None, markers = None, link = None,
+                    style = None, detached = False):
+        """
+        Start new topic: sheet root topic if there are no open topics,
+        otherwise the child of the most recently started (and not yet
+        ended) topic. Subtopics are written until ``end_topic``.
+
+        Arguments have the same meaning as in ``Topic.add_subtree``.
+        Detached subtopics must follow attached ones.
+        """
+        if self._sheet is None:
+            raise ValueError("start_sheet must be called before start_topic")
+        if self._topics:
+            self._open_subtopics(
+                self._topics[-1], detached and "detached" or "attached")
+        elif self._sheet_has_root:
+            raise ValueError("Sheet can have only one root topic")
+        else:
+            self._sheet_has_root = True
+
+        attrib = {"id": self.id_gen.next(embedded_id)}
+        if link is not None:
+            attrib[_HREF] = link
+        if style is not None:
+            attrib["style-id"] = style.get_id()
+        element = self._xf.element(_TAGS["topic"], attrib)
+        element.__enter__()
+        self._topics.append(_OpenTopic(element))
+
+        self._write_text(_TAGS["title"], title)
+        if note is not None:
+            with self._xf.element(_TAGS["notes"]):
+                self._write_text(_TAGS["plain"], note)
+                with self._xf.element(_TAGS["html"]):
+                    for line in note.split("\n"):
+                        self._write_text(_XHTML_P, line)
+        if label is not None:
+            with self._xf.element(_TAGS["labels"]):
+                self._write_text(_TAGS["label"], label)
+        if markers:
+            with self._xf.element(_TAGS["marker-refs"]):
+                for marker in markers:
+                    with self._xf.element(_TAGS["marker-ref"],
+                                          {"marker-id": marker}):
+                        pass
+
+    def end_topic(self):
+        """
+        End the most recently started topic.
+        """
+        if not self._topics:
+            raise ValueError("No topic is being written")
+        topic = self._topics.pop()
+        if topic.topics is not None:
+            topic.topics.__exit__(None, None, None)
+            topic.children.__exit__(None, None, None)
+        topic.element.__exit__(None, None, None)
+
+    def write_records(self, records, sheet_title = None):
+        """
+        Write topics given as records in document (pre-)order. Every
+        record is ``(depth, title)`` or ``(depth, title, properties)``
+        tuple, where depth 0 means sheet root and properties is a dict
+        of ``start_topic`` keyword arguments.
+
+        Every depth-0 record starts new sheet, titled sheet_title
+        (or, by default, with the root title).
+        """
+        for record in records:
+            depth, title = record[0], record[1]
+            properties = len(record) > 2 and record[2] or {}
+            if depth == 0:
+                self.start_sheet(sheet_title or title)
+            elif depth > len(self._topics):
+                raise ValueError(
+                    "Depth %d record follows depth %d" % (
+                        depth, len(self._topics) - 1))
+            while len(self._topics) > depth:
+                self.end_topic()
+            self.start_topic(title, **properties)
+        if self._sheet is not None:
+            self.end_sheet()
+
+    def close(self):
+        """
+        Finish the map: end open topics and sheets, write styles,
+        meta data and manifest and close the file.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        if self._sheet is not None:
+            self.end_sheet()
+        self._root.__exit__(None, None, None)
+        self._xmlfile.__exit__(None, None, None)
+        self._stream.close()
+        try:
+            with self._zipf.open(STYLES_MEMBER, "w",
+                                 force_zip64 = True) as target:
+                etree.ElementTree(self.styles_tag).write(
+                    target, encoding = "utf-8", xml_declaration = True,
+                    pretty_print = True)
+            self._zipf.writestr(META_MEMBER, META_FILE_BODY.encode("utf-8"))
+            self._zipf.writestr(MANIFEST_MEMBER,
+                                manifest_body([]).encode("utf-8"))
+        finally:
+            self._zipf.close()
+
+    def abort(self):
+        """
+        Stop writing without finishing the map (used when writing
+        fails). The partially written file is removed. If the map was
+        written to a file-like object, it is left incomplete.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            # reported as a failure, so unclosed elements are not checked
+            self._xmlfile.__exit__(ValueError, None, None)
+        except Exception:
+            pass
+        for release in (self._stream.close, self._zipf.close):
+            try:
+                release()
+            except Exception:
+                pass
+        if self._output_path is not None:
+            try:
+                os.remove(self._output_path)
+            except OSError:
+                pass
+
+    def _open_subtopics(self, parent, mode):
+        """
+        Make sure subtopics block of given mode is open in parent.
+        """
+        if parent.mode == mode:
+            return
+        if parent.mode == "detached":
+            raise ValueError("Attached subtopics must precede detached ones")
+        if parent.children is None:
+            parent.children = self._xf.element(_TAGS["children"])
+            parent.children.__enter__()
+        else:
+            parent.topics.__exit__(None, None, None)
+        parent.topics = self._xf.element(_TAGS["topics"], type = mode)
+        parent.topics.__enter__()
+        parent.mode = mode
+
+    def _write_text(self, tag, text):
+        """
+        Write element with given text content.
+        """
+        with self._xf.element(tag):
+            if text is not None:
+                self._xf.write(text)
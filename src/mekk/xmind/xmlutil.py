@@ -15,6 +15,8 @@ XMind XML.
 # TODO: think about    //*[local-name()='bar']
 
 from lxml import etree
+import functools
+import re
 
 class InternalStructureException(Exception):
     """
@@ -27,6 +29,16 @@ class InternalStructureException(Exception):
     def __str__(self):
         return "Internal map processing error (%s)" % self.text
 
+class ReadOnlyMapException(Exception):
+    """
+    Exception thrown on attempt to modify map opened in read-only mode.
+    """
+    def __init__(self, text):
+        Exception.__init__(self)
+        self.text = text
+    def __str__(self):
+        return "Map is read-only (%s)" % self.text
+
 NS_CONTENT = "urn:xmind:xmap:xmlns:content:2.0"
 NS_STYLE = "urn:xmind:xmap:xmlns:style:2.0"
 NS_FO = "http://www.w3.org/1999/XSL/Format"
@@ -55,6 +67,11 @@ SEARCH_NSMAP = {
     "xlink" : NS_XLINK,
 }
 
+XPATH_CACHE_SIZE = 256
+
+# names which can be looked up without XPath (tag or prefix:tag)
+_PLAIN_NAME = re.compile(r"^[\w.-]+(:[\w.-]+)?$", re.UNICODE)
+
 ########################################################################
 # Ogólne
 ########################################################################
@@ -68,18 +85,20 @@ def ns_name(ns_shortcut, what):
     """
     return "{%s}%s" % (SEARCH_NSMAP[ns_shortcut], what)
 
-def find_xpath(parent, expression, single = False, required = False):
+@functools.lru_cache(maxsize = XPATH_CACHE_SIZE)
+def compiled_xpath(expression):
     """
-    Look inside parent for elements satisfying XPath expression, returns
-    the results. Handles namespace shortcuts (xm:topic, svg:color etc)
-
-    If single is set, expects no more than one result (otherwise raises
-    InternalStructureException), and returns scalar value (or None if nothing is found).
-    With single not set, returns list.
+    Returns compiled (etree.XPath) evaluator for given expression
+    (handling namespace shortcuts). Evaluators of XPATH_CACHE_SIZE
+    most recently used expressions are cached.
+    """
+    return etree.XPath(expression, namespaces = SEARCH_NSMAP)
 
-    If required is set, raises InternalStructureException if nothing is found.
+def _check_found(parent, expression, found_items, single, required):
+    """
+    Common part of find_xpath and XmlHelper lookups: verifies
+    and formats the results.
     """
-    found_items = parent.xpath(expression, namespaces = SEARCH_NSMAP)
     if required and (not found_items):
         raise InternalStructureException(
             "Bad structure. Element %s not found under %s" % (
@@ -95,6 +114,25 @@ def find_xpath(parent, expression, single = False, required = False):
             found_items = None
     return found_items
 
+def find_xpath(parent, expression, single = False, required = False,
+               stats = None):
+    """
+    Look inside parent for elements satisfying XPath expression, returns
+    the results. Handles namespace shortcuts (xm:topic, svg:color etc)
+
+    If single is set, expects no more than one result (otherwise raises
+    InternalStructureException), and returns scalar value (or None if nothing is found).
+    With single not set, returns list.
+
+    If required is set, raises InternalStructureException if nothing is found.
+
+    If stats (XMindStats) is given, the evaluation is counted there.
+    """
+    if stats is not None:
+        stats.count("xpath")
+    found_items = compiled_xpath(expression)(parent)
+    return _check_found(parent, expression, found_items, single, required)
+
 ############################################################################3
 # Kontekstowe
 ############################################################################3
@@ -128,14 +166,6 @@ def _forced_ns_fullname(name, default = "xm"):
     else:
         return ns_name(default, name)
 
-def _forced_prefix(name, ns_shortcut = "xm"):
-    """
-    Adds short (colon) prefix if missing.
-    """
-    if not name.find(":") >= 0:
-        name = "%s:%s" % (ns_shortcut, name)
-    return name
-
 
 class XmlHelper(object):
     """
@@ -144,9 +174,35 @@ class XmlHelper(object):
     are represented a bit differently by lxml, thanks to
     namespace prefixes)
     """
-    def __init__(self, is_creating, default = "xm"):
+    def __init__(self, is_creating, default = "xm", read_only = False):
         self.is_creating = is_creating
         self.default = default
+        self.read_only = read_only
+        self.stats = None
+        self._tag_names = {}
+
+    def ensure_writable(self, action = "modification", element = None):
+        """
+        Raises ReadOnlyMapException if the map is read-only.
+        element (if given) is the element about to be modified.
+        """
+        if self.read_only:
+            raise ReadOnlyMapException(action)
+
+    def full_name(self, tag_name):
+        """
+        Returns tag name as used by lxml for elements of given name
+        (non-namespaced for created maps, fully namespaced for
+        parsed maps).
+        """
+        full = self._tag_names.get(tag_name)
+        if full is None:
+            if self.is_creating:
+                full = _optional_ns_fullname(tag_name)
+            else:
+                full = _forced_ns_fullname(tag_name, self.default)
+            self._tag_names[tag_name] = full
+        return full
 
     def xpath_name(self, name):
         """
@@ -162,30 +218,56 @@ class XmlHelper(object):
         Create child of given XML element. tag_name can be simple
         ("subtag") or colon-prefixed ("svg:color").
         """
-        if self.is_creating:
-            return etree.SubElement(
-                parent, _optional_ns_fullname(tag_name), **kwargs)
-        else:
-            return etree.SubElement(
-                parent, _forced_ns_fullname(tag_name), **kwargs)
+        self.ensure_writable("creating %s" % tag_name, parent)
+        if self.stats is not None:
+            self.stats.count("create_child")
+        return etree.SubElement(parent, self.full_name(tag_name), **kwargs)
 
-    ## TODO: ./ belo is probably not necessary
+    def _find(self, parent, tag_name, single, required):
+        """
+        Common part of find_only_child and find_children. Plain
+        names are looked up directly among the children, anything
+        else is handled as (cached) XPath.
+        """
+        if _PLAIN_NAME.match(tag_name):
+            if self.stats is not None:
+                self.stats.count("lookups")
+            found_items = list(parent.iterchildren(
+                tag = self.full_name(tag_name)))
+        else:
+            if self.stats is not None:
+                self.stats.count("xpath")
+            found_items = compiled_xpath(
+                "./" + self.xpath_name(tag_name))(parent)
+        return _check_found(parent, tag_name, found_items, single, required)
 
     def find_only_child(self, parent, tag_name, required = True):
         """
         Find child of given name, expecting it will be unique
         """
-        if not self.is_creating:
-            tag_name = "%s:%s" % (self.default, tag_name)
-        return find_xpath(parent, "./" + tag_name, True, required)
+        return self._find(parent, tag_name, True, required)
 
     def find_children(self, parent, tag_name, require_non_empty = False):
         """
         Find all children of given name
         """
-        if not self.is_creating:
-            tag_name = "%s:%s" % (self.default, tag_name)
-        return find_xpath(parent, "./" + tag_name, False, require_non_empty)
+        return self._find(parent, tag_name, False, require_non_empty)
+
+    def find_child_with_attribute(self, parent, tag_name,
+                                  attr_name, attr_value):
+        """
+        Find child of given name having given attribute value,
+        expecting it will be unique. Returns None if not found.
+        """
+        if self.stats is not None:
+            self.stats.count("lookups")
+        found_items = [
+            child
+            for child in parent.iterchildren(tag = self.full_name(tag_name))
+            if child.get(attr_name) == attr_value]
+        return _check_found(
+            parent, "%s[@%s='%s']" % (tag_name, attr_name, attr_value),
+            found_items, True, False)
 
     def find_or_create_child(self, parent, tag_name):
         """
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+# (c) 2008-2010, Marcin Kasperski
+
+"""
+Benchmarks of the hot paths: building map with add_subtopic, save,
+XMindDocument.open and full get_subtopics traversal, on synthetic
+maps of various sizes and shapes. Results (timings in seconds, peak
+RSS in KB) are printed as JSON:
+
+    PYTHONPATH=../src python benchmark.py                  # all cases
+    PYTHONPATH=../src python benchmark.py -c 1k -c 100k -r 3 -o out.json
+
+Every case is measured in fresh subprocesses (one building and saving
+the map, another opening and traversing it), so peak RSS of each
+phase is not affected by other cases.
+
+Not collected by the test runner (name doesn't start with test_).
+"""
+from __future__ import print_function, unicode_literals
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from mekk.xmind import XMindDocument, XMIND_MARKS
+
+try:
+    import resource
+except ImportError:        # windows
+    resource = None
+
+# name -> (topics, depth, every n-th topic gets marker, every n-th attachment)
+# 100k topics are measured in three shapes: shallow and wide (hundreds
+# of children per topic), balanced, and deep and narrow (chains)
+CASES = {
+    "1k": (1000, 3, 5, 50),
+    "100k-wide": (100000, 2, 5, 1000),
+    "100k": (100000, 5, 5, 1000),
+    "100k-deep": (100000, 80, 5, 1000),
+    "1M": (1000000, 6, 5, 10000),
+}
+CASE_ORDER = ["1k", "100k-wide", "100k", "100k-deep", "1M"]
+ATTACHMENT_DATA = b"x" * 4096
+
+def peak_rss_kb():
+    """
+    Peak resident set size of the current process (KB), or None
+    if it can't be measured on this platform.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        peak //= 1024          # bytes there
+    return peak
+
+def _fanouts(topics, depth):
+    """
+    Number of children of every topic on each level. If binary tree
+    of given depth would have more topics than needed, the root gets
+    many children, each starting a chain reaching the full depth.
+    """
+    if 2 ** depth > topics:
+        width = -(-(topics - 1) // depth)
+        return [width] + [1] * (depth - 1)
+    fanout = 2
+    while sum(fanout ** level for level in range(depth + 1)) < topics:
+        fanout += 1
+    return [fanout] * depth
+
+def build_map(topics, depth, marker_every, attachment_every):
+    """
+    Build map of (about) given number of topics, filled level by level
+    (breadth-first) up to given depth, using add_subtopic.
+    """
+    doc = XMindDocument.create("Benchmark", "Root")
+    root = doc.get_first_sheet().get_root_topic()
+    fanouts = _fanouts(topics, depth)
+    level = [root]
+    count = 1
+    for fanout in fanouts:
+        if count >= topics:
+            break
+        next_level = []
+        for parent in level:
+            for i in range(fanout):
+                if count >= topics:
+                    break
+                topic = parent.add_subtopic("Topic %d" % count)
+                if count % marker_every == 0:
+                    topic.add_marker(XMIND_MARKS[count % len(XMIND_MARKS)])
+                if count % attachment_every == 0:
+                    topic.set_attachment(ATTACHMENT_DATA, ".txt")
+                next_level.append(topic)
+                count += 1
+        level = next_level
+    return doc, count
+
+def traverse(doc):
+    """
+    Visit every topic using get_subtopics, returns topic count.
+    """
+    count = 0
+    stack = [sheet.get_root_topic() for sheet in doc.get_all_sheets()]
+    while stack:
+        topic = stack.pop()
+        count += 1
+        stack.extend(topic.get_subtopics())
+        stack.extend(topic.get_subtopics(detached = True))
+    return count
+
+def _timed(func, *args):
+    start = time.time()
+    result = func(*args)
+    return result, time.time() - start
+
+def run_phase(phase, case, path):
+    """
+    Executed in subprocess, returns measurements of single phase.
+    """
+    if phase == "build":
+        (doc, topics), build_time = _timed(build_map, *CASES[case])
+        _, save_time = _timed(doc.save, path)
+        return {"topics": topics, "build": build_time, "save": save_time,
+                "file_size": os.path.getsize(path),
+                "build_peak_rss_kb": peak_rss_kb()}
+    else:
+        doc, open_time = _timed(XMindDocument.open, path)
+        topics, traverse_time = _timed(traverse, doc)
+        return {"traversed": topics, "open": open_time,
+                "traverse": traverse_time, "open_peak_rss_kb": peak_rss_kb()}
+
+def _spawn(phase, case, path):
+    output = subprocess.check_output(
+        [sys.executable, os.path.abspath(__file__),
+         "--phase", phase, case, path])
+    return json.loads(output.decode("utf-8"))
+
+def run_case(case, repeat, workdir):
+    """
+    Measure case (repeat times), returns best timings and largest RSS.
+    """
+    path = os.path.join(workdir, "%s.xmind" % case)
+    result = {"case": case, "depth": CASES[case][1]}
+    for i in range(repeat):
+        for phase in ("build", "read"):
+            for key, value in _spawn(phase, case, path).items():
+                if key not in result or value is None:
+                    result.setdefault(key, value)
+                elif key.endswith("_rss_kb"):
+                    result[key] = max(result[key], value)
+                else:
+                    result[key] = min(result[key], value)
+    return result
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = __doc__.split("\n\n")[0])
+    parser.add_argument("-c", "--case", action = "append",
+                        choices = CASE_ORDER,
+                        help = "case to run (repeatable, default: all)")
+    parser.add_argument("-r", "--repeat", type = int, default = 1,
+                        help = "repetitions (best time is reported)")
+    parser.add_argument("-o", "--output", help = "write JSON to this file")
+    parser.add_argument("--phase", nargs = 3, help = argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.phase:
+        print(json.dumps(run_phase(*args.phase)))
+        return 0
+
+    workdir = tempfile.mkdtemp()
+    try:
+        results = [run_case(case, args.repeat, workdir)
+                   for case in (args.case or CASE_ORDER)]
+    finally:
+        shutil.rmtree(workdir)
+    report = json.dumps({"python": platform.python_version(),
+                         "platform": platform.platform(),
+                         "results": results}, indent = 2)
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(report + "\n")
+    print(report)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import unittest
+import os
+import shutil
+import tempfile
+from mekk.xmind.batch import map_files, map_paths
+from sample_maps import generate_simple
+
+def count_topics(doc, path):
+    return sum(1 for element in doc.doc_tag.iter(doc.full_name("topic")))
+
+def retitle_and_save(doc, path):
+    doc.get_first_sheet().get_root_topic().set_title("Changed")
+    doc.save(path + ".out")
+    return path + ".out"
+
+def unpicklable_result(path):
+    return lambda: path
+
+def crash_on_broken(path):
+    if path.endswith("broken.xmind"):
+        os._exit(1)
+    return os.path.basename(path)
+
+class MapFilesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.paths = []
+        data = generate_simple().to_bytes()
+        for i in range(5):
+            path = os.path.join(self.tmpdir, "map%d.xmind" % i)
+            with open(path, "wb") as output:
+                output.write(data)
+            self.paths.append(path)
+        self.broken = os.path.join(self.tmpdir, "broken.xmind")
+        with open(self.broken, "wb") as output:
+            output.write(b"not a zip")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_ordered_parallel(self):
+        paths = self.paths[:2] + [self.broken] + self.paths[2:]
+        results = list(map_files(count_topics, paths, workers = 2,
+                                 chunksize = 2))
+        self.assertEqual([r.path for r in results], paths)
+        self.assertEqual([r.value for r in results], [13, 13, None, 13, 13, 13])
+        self.assertTrue("BadZipFile" in results[2].error)
+        self.assertEqual([r.error for r in results if r.path != self.broken],
+                         [None] * 5)
+
+    def test_unordered_inline(self):
+        for workers in (1, 2):
+            results = list(map_files(retitle_and_save, self.paths,
+                                     workers = workers, ordered = False))
+            self.assertEqual(sorted(r.path for r in results), sorted(self.paths))
+            for result in results:
+                self.assertTrue(os.path.isfile(result.value))
+
+    def test_open_options(self):
+        results = list(map_files(retitle_and_save, self.paths[:1],
+                                 workers = 1, read_only = True))
+        self.assertTrue("ReadOnlyMapException" in results[0].error)
+
+    def test_unknown_open_option(self):
+        self.assertRaises(TypeError, map_files, count_topics, self.paths,
+                          workers = 2, raed_only = True)
+
+    def test_failed_task(self):
+        results = list(map_paths(unpicklable_result, self.paths,
+                                 workers = 2, chunksize = 2))
+        self.assertEqual([r.path for r in results], self.paths)
+        for result in results:
+            self.assertEqual(result.value, None)
+            self.assertTrue("pickle" in result.error.lower())
+
+    def test_crashed_worker(self):
+        paths = [self.broken] + self.paths * 3
+        results = list(map_paths(crash_on_broken, paths, workers = 2))
+        self.assertEqual([r.path for r in results], paths)
+        self.assertTrue("BrokenProcessPool" in results[0].error)
+        # pool was replaced, later files are processed
+        self.assertEqual(results[-1].value, "map4.xmind")
+        self.assertEqual(results[-1].error, None)
+
+    def test_bounded_and_abandoned(self):
+        paths = (self.paths[i % len(self.paths)] for i in range(40))
+        consumed = []
+        def counted():
+            for path in paths:
+                consumed.append(path)
+                yield path
+        results = map_files(count_topics, counted(), workers = 2)
+        first = next(results)
+        self.assertEqual(first.value, 13)
+        # only a few tasks (two per worker) were queued
+        self.assertTrue(len(consumed) <= 6)
+        results.close()
+        self.assertTrue(len(consumed) <= 6)
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import unittest
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+from mekk.xmind import XMindDocument
+from mekk.xmind.cli import main, document_to_data
+from sample_maps import generate_simple
+
+class CliTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.map_file = os.path.join(self.tmpdir, "simple.xmind")
+        generate_simple().save(self.map_file)
+        self.stdout = sys.stdout
+        sys.stdout = self.output = io.StringIO()
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+        shutil.rmtree(self.tmpdir)
+
+    def test_dump_and_build_json(self):
+        outdir = os.path.join(self.tmpdir, "out")
+        os.mkdir(outdir)
+        self.assertEqual(main(["dump", "-f", "json", "-o", outdir,
+                               self.map_file]), 0)
+        json_file = os.path.join(outdir, "simple.json")
+        with io.open(json_file, encoding = "utf-8") as source:
+            data = json.load(source)
+        self.assertEqual(data[0]["title"], "Główny")
+        self.assertEqual(data[0]["topic"]["children"][0]["label"], "1")
+
+        self.assertEqual(main(["build", "-f", "json", json_file]), 0)
+        rebuilt = XMindDocument.open(os.path.join(outdir, "simple.xmind"))
+        self.assertEqual(document_to_data(rebuilt), data)
+        rebuilt.close()
+
+    def test_dump_text_formats(self):
+        self.assertEqual(main(["dump", "-f", "markdown", self.map_file]), 0)
+        self.assertEqual(main(["dump", "-f", "opml", self.map_file]), 0)
+        text = self.output.getvalue()
+        self.assertTrue("# Główny" in text)
+        self.assertTrue("  - [Elemiątko 1 [1]](http://info.onet.pl)" in text)
+        self.assertTrue('<outline text="Projekty"' in text)
+
+    def test_build_csv(self):
+        csv_file = os.path.join(self.tmpdir, "tree.csv")
+        with io.open(csv_file, "w", encoding = "utf-8") as output:
+            output.write("depth,title,note,label,link,markers\n"
+                         "0,Root,,,,\n"
+                         "1,Child,Some note,,,task-start;flag-red\n"
+                         "2,Grandchild,,lbl,,\n")
+        self.assertEqual(main(["build", "-f", "csv", csv_file]), 0)
+        doc = XMindDocument.open(os.path.join(self.tmpdir, "tree.xmind"))
+        child = list(doc.get_first_sheet().get_root_topic().get_subtopics())[0]
+        self.assertEqual(child.get_note(), "Some note")
+        self.assertEqual(list(child.get_markers()), ["task-start", "flag-red"])
+        doc.close()
+
+    def test_build_rejects_empty_and_clashing(self):
+        outdir = os.path.join(self.tmpdir, "out")
+        os.mkdir(outdir)
+        names = []
+        for subdir, content in [("a", "[]"), ("b", '{"title": "Root"}')]:
+            os.mkdir(os.path.join(self.tmpdir, subdir))
+            names.append(os.path.join(self.tmpdir, subdir, "x.json"))
+            with io.open(names[-1], "w", encoding = "utf-8") as output:
+                output.write(content)
+        stderr = sys.stderr
+        sys.stderr = errors = io.StringIO()
+        try:
+            self.assertEqual(main(["build", "-o", outdir] + names), 2)
+            self.assertTrue("would both be written" in errors.getvalue())
+            self.assertEqual(os.listdir(outdir), [])
+            self.assertEqual(main(["build", names[0]]), 1)
+            self.assertTrue("No sheets in" in errors.getvalue())
+        finally:
+            sys.stderr = stderr
+        self.assertEqual(main(["build", names[1]]), 0)
+
+    def test_stats_and_bench(self):
+        missing = os.path.join(self.tmpdir, "missing.xmind")
+        self.assertEqual(main(["stats", "-j", "2", self.map_file]), 0)
+        self.assertEqual(main(["bench", self.map_file]), 0)
+        stderr = sys.stderr
+        sys.stderr = io.StringIO()
+        try:
+            self.assertEqual(main(["stats", missing]), 1)
+        finally:
+            sys.stderr = stderr
+        text = self.output.getvalue()
+        self.assertTrue(
+            "sheets=1 topics=13 attachments=0 max_depth=2" in text)
+        self.assertTrue("open=" in text and "save=" in text)
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import unittest
+from mekk.xmind import XMindDocument, diff
+from mekk.xmind.compare import TopicChange, \
+    ADDED, REMOVED, MOVED, RETITLED, REMARKED
+from sample_maps import generate_simple
+
+class DiffTestCase(unittest.TestCase):
+    def setUp(self):
+        self.old = generate_simple()
+        self.new = XMindDocument.from_bytes(self.old.to_bytes())
+
+    def test_identical(self):
+        self.assertEqual(list(diff(self.old, self.new)), [])
+        self.assertEqual(list(diff(self.new, self.new)), [])
+
+    def test_changes(self):
+        new = self.new
+        moved = new.get_topic_by_embedded_id("a1a1")
+        target = new.get_topic_by_embedded_id("b2")
+        target._subtopics_tag().append(moved.topic_tag)
+        new.get_topic_by_embedded_id("b3").set_title("Renamed")
+        new.get_topic_by_embedded_id("a2a2").add_marker("priority-1")
+        new.get_topic_by_embedded_id("a3a1").add_marker("custom-hash")
+        added = new.get_topic_by_embedded_id("b1").add_subtopic("New", "n1")
+        new.get_topic_by_embedded_id("b4").remove()
+
+        changes = list(diff(self.old, new))
+        self.assertTrue(all(isinstance(change, TopicChange)
+                            for change in changes))
+        self.assertEqual(
+            [(change.kind, change.key, change.old, change.new)
+             for change in changes],
+            [(ADDED, "n1", None, "New"),
+             (REMARKED, "a2a2", ("task-start",),
+              ("priority-1", "task-start")),
+             (MOVED, "a1a1", ("b1", False), ("b2", False)),
+             (RETITLED, "b3", "Elemiątko 3", "Renamed"),
+             (REMARKED, "a3a1", ("other-people", "task-start"),
+              ("other-people", "task-start", "custom-hash")),
+             (REMOVED, "b4", "Elemiątko 4", None),
+             (REMOVED, "a4a1", "Subelemiątko 4/1", None),
+             (REMOVED, "a4a2", "Subelemiątko 4/2", None)])
+        self.assertEqual(changes[0].topic_id, added.topic_tag.get("id"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,11 @@
 # -*- coding: utf-8 -*-
 
-import unittest, sets
+import unittest
+import threading
+import time
 
-from mekk.xmind.id_gen import IdGen, qualify_id
+from mekk.xmind.id_gen import IdGen, qualify_id, unique_prefix
+from mekk.xmind import XMindDocument
 import six
 
 class EmbIdTestCase(unittest.TestCase):
@@ -38,16 +41,105 @@ class EmbIdTestCase(unittest.TestCase):
             self.failIf(qualify_id(r))
 
     def testDifferentNonPfx(self):
-        s = sets.Set()
+        s = set()
         for x in range(0, 10000):
             d = six.advance_iterator(self.id_gen)
             self.failIf(d in s)
             s.add(d)
 
     def testDifferentEmb(self):
-        s = sets.Set()
+        s = set()
         for emb in ["WiCkqHbUtLpLxZkF", "J9nZh0Q7JdMxHTOF", "Ala"]:
             for x in range(0, 2000):
                 d = six.advance_iterator(self.id_gen)
                 self.failIf(d in s)
                 s.add(d)
+
+class ConcurrencyTestCase(unittest.TestCase):
+
+    def testThreads(self):
+        id_gen = IdGen()
+        results = []
+        def generate():
+            results.append([six.advance_iterator(id_gen) for x in range(2000)])
+        threads = [threading.Thread(target = generate) for x in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        all_ids = [d for ids in results for d in ids]
+        self.assertEqual(len(set(all_ids)), 8 * 2000)
+
+    def testPrefix(self):
+        first, second = IdGen(prefix = unique_prefix()), \
+            IdGen(prefix = unique_prefix())
+        a, b = six.advance_iterator(first), six.advance_iterator(second)
+        self.assertNotEqual(a, b)
+        self.assertEqual(len(a), 26)
+        self.assertFalse(qualify_id(a))
+        self.assertEqual(qualify_id(first.next("Abc")), "Abc")
+        self.assertRaises(ValueError, IdGen, 26, "a-b")
+
+    def testDocumentsIndependent(self):
+        docs = [XMindDocument.create("S", "R") for x in range(2)]
+        ids = [doc.get_first_sheet().get_root_topic().get_correlation_id()
+               for doc in docs]
+        self.assertEqual(ids[0], ids[1])
+
+class ReopenTestCase(unittest.TestCase):
+
+    def testReserve(self):
+        id_gen = IdGen()
+        id_gen.reserve(["bfbf0000000000000000000041", "afaf0300010000000000000abc",
+                        "bfbf00000000000000000000x1", "other"])
+        self.assertEqual(id_gen.counter_of(six.advance_iterator(id_gen)), 42)
+        self.assertEqual(IdGen(prefix = "p").counter_of(
+            "bfbf0000000000000000000041"), None)
+
+    def testReopenThenAdd(self):
+        doc = XMindDocument.create("S", "R")
+        root = doc.get_first_sheet().get_root_topic()
+        root.add_subtopic("A").set_attachment(b"first", ".txt")
+        data = doc.to_bytes()
+        parsed = XMindDocument.from_bytes(data)
+        old_ids = set(element.get("id") for element in parsed.doc_tag.iter(
+            parsed.full_name("topic"), parsed.full_name("sheet")))
+        for lazy_sheets in (False, True):
+            reopened = XMindDocument.from_bytes(data, id_prefix = "",
+                                                lazy_sheets = lazy_sheets)
+            old_attachments = reopened.attachment_names()
+            new_root = reopened.get_first_sheet().get_root_topic()
+            added = [new_root.add_subtopic("New %d" % i) for i in range(2)]
+            added[0].set_attachment(b"second", ".txt")
+            new_ids = set(topic.topic_tag.get("id") for topic in added)
+            self.assertEqual(new_ids & old_ids, set())
+            self.assertEqual(
+                reopened.get_topic_by_id(root.topic_tag.get("id")).get_title(),
+                "R")
+            self.assertEqual(len(reopened.attachment_names()), 2)
+            self.assertEqual(reopened.attachment_body(old_attachments[0]),
+                             b"first")
+
+    def testReserveLaterThreads(self):
+        id_gen = IdGen()
+        calls = []
+        def used():
+            calls.append(1)
+            time.sleep(0.05)
+            return ["bfbf0000000000000000000041"]
+        id_gen.reserve_later(used)
+        results = []
+        def generate():
+            results.append(id_gen.counter_of(six.advance_iterator(id_gen)))
+        threads = [threading.Thread(target = generate) for x in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(results), [42, 43, 44, 45])
+        self.assertEqual(len(calls), 1)
+
+    def testDuplicateAttachment(self):
+        doc = XMindDocument.create("S", "R")
+        doc._create_attachment("a.txt", b"x")
+        self.assertRaises(ValueError, doc._create_attachment, "a.txt", b"y")
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import unittest
+from mekk.xmind import XMindDocument, merge, diff
+from mekk.xmind.merge import MergeConflict, \
+    TITLE, NOTE, MARKERS, LINK, PARENT, REMOVED
+from sample_maps import generate_simple
+
+def topic(doc, key):
+    return doc.get_topic_by_embedded_id(key)
+
+def move(doc, key, parent_key):
+    topic(doc, parent_key)._subtopics_tag().append(topic(doc, key).topic_tag)
+
+class MergeTestCase(unittest.TestCase):
+    def setUp(self):
+        self.base = generate_simple()
+        data = self.base.to_bytes()
+        self.ours = XMindDocument.from_bytes(data)
+        self.theirs = XMindDocument.from_bytes(data)
+
+    def test_unchanged(self):
+        merged, conflicts = merge(self.base, self.ours, self.theirs)
+        self.assertEqual(conflicts, [])
+        self.assertEqual(list(diff(self.ours, merged)), [])
+
+    def test_independent_changes(self):
+        ours, theirs = self.ours, self.theirs
+        topic(ours, "b1").set_title("Ours title")
+        topic(ours, "a1a2").add_subtopic("Ours new", "o1")
+        topic(theirs, "b2").set_title("Theirs title")
+        topic(theirs, "a1a2").set_note("Theirs note")
+        topic(theirs, "a2a2").add_marker("priority-1")
+        topic(theirs, "b3").set_link("http://example.com")
+        topic(theirs, "b3").set_attachment(b"data", ".txt")
+        added = topic(theirs, "b2").add_subtopic("Theirs new", "t1")
+        added.add_subtopic("Theirs grandchild", "t2")
+        move(theirs, "a3a1", "b1")
+        topic(theirs, "b4").remove()
+        topic(theirs, "a1a1").remove()
+
+        merged, conflicts = merge(self.base, ours, theirs)
+        self.assertEqual(conflicts, [])
+        self.assertEqual(topic(merged, "b1").get_title(), "Ours title")
+        self.assertEqual(topic(merged, "b2").get_title(), "Theirs title")
+        self.assertEqual(topic(merged, "a1a2").get_note(), "Theirs note")
+        self.assertEqual(sorted(topic(merged, "a2a2").get_markers()),
+                         ["priority-1", "task-start"])
+        link = topic(merged, "b3").get_link()
+        self.assertTrue(link.startswith("xap:attachments/"))
+        self.assertEqual(
+            merged.attachment_body(link[len("xap:attachments/"):]), b"data")
+        self.assertEqual(
+            [t.get_title() for t in topic(merged, "b2").get_subtopics()],
+            ["Subelemiątko 2/1", "Subelemiątko 2/2", "Theirs new"])
+        self.assertEqual(
+            [t.get_title() for t in topic(merged, "t1").get_subtopics()],
+            ["Theirs grandchild"])
+        self.assertEqual(
+            [t.get_embedded_id() for t in topic(merged, "b1").get_subtopics()],
+            ["a1a2", "a3a1"])
+        self.assertEqual(topic(merged, "b4"), None)
+        self.assertEqual(topic(merged, "a4a1"), None)
+        self.assertEqual(topic(merged, "a1a1"), None)
+        self.assertEqual(topic(merged, "o1").get_title(), "Ours new")
+
+        reread = XMindDocument.from_bytes(merged.to_bytes())
+        self.assertEqual(list(diff(merged, reread)), [])
+
+    def test_both_add(self):
+        ours, theirs = self.ours, self.theirs
+        ours_new = topic(ours, "b1").add_subtopic("Ours new")
+        ours_new.set_attachment(b"ours", ".txt")
+        theirs_new = topic(theirs, "b2").add_subtopic("Theirs new")
+        theirs_new.set_attachment(b"theirs", ".txt")
+
+        merged, conflicts = merge(self.base, ours, theirs)
+        self.assertEqual(conflicts, [])
+        bodies = []
+        for parent_key, title in (("b1", "Ours new"), ("b2", "Theirs new")):
+            added = [t for t in topic(merged, parent_key).get_subtopics()
+                     if t.get_title() == title]
+            self.assertEqual(len(added), 1)
+            bodies.append(merged.attachment_body(
+                added[0].get_link()[len("xap:attachments/"):]))
+        self.assertEqual(bodies, [b"ours", b"theirs"])
+
+    def test_attachment_name_clash(self):
+        ours, theirs = self.ours, self.theirs
+        ours._create_attachment("same.txt", b"ours")
+        topic(ours, "b1").set_link("xap:attachments/same.txt")
+        theirs._create_attachment("same.txt", b"theirs")
+        topic(theirs, "b2").set_link("xap:attachments/same.txt")
+
+        merged, conflicts = merge(self.base, ours, theirs)
+        self.assertEqual(conflicts, [])
+        for key, body in (("b1", b"ours"), ("b2", b"theirs")):
+            link = topic(merged, key).get_link()
+            self.assertEqual(
+                merged.attachment_body(link[len("xap:attachments/"):]), body)
+
+    def test_conflicts(self):
+        ours, theirs = self.ours, self.theirs
+        topic(ours, "b1").set_title("Ours")
+        topic(theirs, "b1").set_title("Theirs")
+        topic(ours, "a1a1").add_marker("priority-1")
+        topic(theirs, "a1a1").add_marker("priority-1")   # the same change
+        move(ours, "a2a1", "b1")
+        move(theirs, "a2a1", "a1a2")
+        topic(ours, "b3").remove()
+        topic(theirs, "a3a2").set_title("Theirs")
+        topic(theirs, "a3a1").add_subtopic("Orphan", "t1")
+        move(ours, "b2", "a1a2")
+        move(theirs, "b1", "a2a2")              # cycle once merged
+        topic(ours, "a4a2").add_subtopic("Ours new", "o1")
+        topic(theirs, "b4").remove()
+
+        merged, conflicts = merge(self.base, ours, theirs)
+        self.assertTrue(all(isinstance(c, MergeConflict) for c in conflicts))
+        self.assertEqual(
+            sorted((c.key, c.field) for c in conflicts),
+            [("a2a1", PARENT), ("a3a2", REMOVED), ("b1", PARENT),
+             ("b1", TITLE), ("b4", REMOVED),
+             ("t1", PARENT)])
+        found = dict(((c.key, c.field), c) for c in conflicts)
+        self.assertEqual(found["b1", TITLE][1:],
+                         (TITLE, "Elemiątko 1", "Ours", "Theirs"))
+        self.assertEqual(found["a3a2", REMOVED].theirs, (TITLE,))
+        self.assertEqual(found["b4", REMOVED].ours, ("o1",))
+        self.assertEqual(topic(merged, "b1").get_title(), "Ours")
+        self.assertEqual(topic(merged, "b3"), None)
+        self.assertEqual(
+            [t.get_embedded_id() for t in topic(merged, "b4").get_subtopics()],
+            ["a4a1", "a4a2"])
+        self.assertEqual(
+            [t.get_embedded_id() for t in topic(merged, "a1a2").get_subtopics()],
+            ["b2"])
+
+    def test_created_maps(self):
+        ours = generate_simple()
+        topic(ours, "b1").set_title("Ours")
+        merged, conflicts = merge(self.base, ours, self.theirs)
+        self.assertEqual(conflicts, [])
+        self.assertEqual(topic(merged, "b1").get_title(), "Ours")
+
+if __name__ == "__main__":
+    unittest.main()
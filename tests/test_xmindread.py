@@ -6,14 +6,20 @@ Testy odczytu struktury mapy
 """
 from __future__ import unicode_literals
 
-import unittest, os
-from mekk.xmind import XMindDocument
+import unittest, io, os, shutil, tempfile, zipfile
+from mekk.xmind import XMindDocument, XMindStats
+from mekk.xmind.cache import TopicCache
+from mekk.xmind.lazy import LazyContent
+from mekk.xmind import columns as columns_module
+from mekk.xmind import streaming as streaming_module
+from mekk.xmind.xmlutil import ReadOnlyMapException
+from lxml import etree
 import six
 
-def open_doc(name):
+def open_doc(name, **kwargs):
     if not os.path.isfile(name):
         name = os.path.join("tests", name)
-    return XMindDocument.open(name)
+    return XMindDocument.open(name, **kwargs)
 
 class ReadTestCase(unittest.TestCase):
     def test_simple(self):
@@ -66,3 +72,518 @@ class ReadTestCase(unittest.TestCase):
         # TODO: test czytania legendy
         legend.add_marker("task-start", "Dzień dobry")
         #legend.add_marker("other-people", u"Do widzenia")
+
+class ReadOnlyTestCase(unittest.TestCase):
+    def _visit(self, topic):
+        topic.get_title()
+        topic.get_note()
+        topic.get_label()
+        list(topic.get_markers())
+        for detached in (False, True):
+            for subtopic in topic.get_subtopics(detached):
+                self._visit(subtopic)
+
+    def test_getters_do_not_modify(self):
+        doc = open_doc("simple.xmind")
+        before = etree.tostring(doc.doc_tag)
+        self._visit(doc.get_first_sheet().get_root_topic())
+        self.assertEqual(etree.tostring(doc.doc_tag), before)
+
+        topic = list(doc.get_first_sheet().get_root_topic().get_subtopics())[0]
+        self.assertEqual(topic.get_note(), None)
+        sub = list(topic.get_subtopics())[0]
+        self.assertEqual(sub.get_label(), None)
+        self.assertEqual(list(sub.get_subtopics()), [])
+
+    def test_read_only(self):
+        doc = open_doc("simple.xmind", read_only = True)
+        root = doc.get_first_sheet().get_root_topic()
+        self._visit(root)
+        self.assertRaises(ReadOnlyMapException, root.set_title, "X")
+        self.assertRaises(ReadOnlyMapException, root.add_subtopic, "X")
+        self.assertRaises(ReadOnlyMapException, root.set_link, "http://x")
+        self.assertRaises(ReadOnlyMapException,
+                          doc.create_topic_style, "#FFFFFF")
+        self.assertRaises(ReadOnlyMapException,
+                          doc.embed_markers, "markers.xmp")
+        self.assertEqual(doc.embed_xmp, None)
+        self.assertFalse(doc.is_dirty())
+        self.assertEqual(root.get_title(), "Projekty")
+
+class StreamingReadTestCase(unittest.TestCase):
+    def test_iter_topics(self):
+        name = "simple.xmind"
+        if not os.path.isfile(name):
+            name = os.path.join("tests", name)
+        records = list(XMindDocument.iter_topics(name))
+        self.assertEqual(len(records), 1 + 4 + 4 * 2)
+
+        root = records[-1]
+        self.assertEqual(root.title, "Projekty")
+        self.assertEqual(root.depth, 0)
+        self.assertEqual(root.parent_id, None)
+
+        by_id = dict((rec.id, rec) for rec in records)
+        first = records[2]
+        self.assertEqual(first.title, "Elemiątko 1")
+        self.assertEqual(first.depth, 1)
+        self.assertEqual(first.parent_id, root.id)
+        self.assertEqual(first.label, "1")
+        self.assertEqual(first.link, "http://info.onet.pl")
+        self.assertEqual(first.markers, [])
+        sub = records[0]
+        self.assertEqual(sub.title, "Subelemiątko 1/1")
+        self.assertEqual(sub.depth, 2)
+        self.assertEqual(by_id[sub.parent_id].title, "Elemiątko 1")
+        self.assertEqual(sub.markers, ["task-start", "other-people"])
+        self.assertEqual(sub.label, None)
+
+    def test_cache(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            cache_dir = os.path.join(tmpdir, "cache")
+            name = os.path.join(tmpdir, "map.xmind")
+            open_doc("simple.xmind").save(name)
+            expected = list(XMindDocument.iter_topics(name))
+
+            self.assertEqual(
+                list(XMindDocument.iter_topics(name, cache_dir)), expected)
+            entries = os.listdir(cache_dir)
+            self.assertEqual(len(entries), 1)
+            cache = TopicCache(cache_dir)
+            entry = cache.entry_path(cache.key(name))
+            self.assertEqual(os.path.basename(entry), entries[0])
+            with open(entry, "rb") as stream:
+                self.assertEqual(list(cache._read(stream, entry)), expected)
+
+            # served from cache (map content is not read)
+            def fail(path):
+                raise AssertionError("map parsed despite cache entry")
+            saved = streaming_module.iter_topics
+            streaming_module.iter_topics = fail
+            try:
+                self.assertEqual(
+                    list(XMindDocument.iter_topics(name, cache_dir)),
+                    expected)
+            finally:
+                streaming_module.iter_topics = saved
+            self.assertEqual(os.listdir(cache_dir), entries)
+
+            # modified map gets new entry, old one is evicted when
+            # the cache is too small
+            doc = XMindDocument.open(name)
+            doc.get_first_sheet().get_root_topic().set_title("Changed")
+            doc.save(name)
+            records = list(XMindDocument.iter_topics(
+                name, cache_dir, cache_size = os.path.getsize(
+                    os.path.join(cache_dir, entries[0])) + 100))
+            self.assertEqual(records[-1].title, "Changed")
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+            self.assertNotEqual(os.listdir(cache_dir), entries)
+
+            # interrupted scans leave no entries
+            TopicCache(cache_dir).clear()
+            records = XMindDocument.iter_topics(name, cache_dir)
+            six.advance_iterator(records)
+            records.close()
+            self.assertEqual(os.listdir(cache_dir), [])
+        finally:
+            shutil.rmtree(tmpdir)
+
+class AttachmentReadTestCase(unittest.TestCase):
+    def setUp(self):
+        doc = XMindDocument.create("Sheet", "Root")
+        root = doc.get_first_sheet().get_root_topic()
+        root.add_subtopic("Text").set_attachment(b"Some text", ".txt")
+        root.add_subtopic("Binary").set_attachment(b"\x00\x01" * 1000, ".bin")
+        fd, self.tfname = tempfile.mkstemp(".xmind")
+        os.close(fd)
+        doc.save(self.tfname)
+
+    def tearDown(self):
+        os.remove(self.tfname)
+
+    def test_lazy_attachments(self):
+        doc = XMindDocument.open(self.tfname)
+        names = sorted(doc.attachment_names(),
+                       key = lambda name: os.path.splitext(name)[1])
+        self.assertEqual(len(names), 2)
+        self.assertTrue(names[0].endswith(".bin"))
+        self.assertFalse(doc.attachments.is_loaded(names[0]))
+
+        stream = doc.open_attachment(names[0])
+        self.assertEqual(stream.read(), b"\x00\x01" * 1000)
+        stream.close()
+        self.assertFalse(doc.attachments.is_loaded(names[0]))
+
+        self.assertEqual(doc.attachment_body(names[1]), b"Some text")
+        self.assertTrue(doc.attachments.is_loaded(names[1]))
+        doc.close()
+
+    def test_resave(self):
+        doc = XMindDocument.open(self.tfname)
+        doc.save(self.tfname)
+        doc.close()
+        doc = XMindDocument.open(self.tfname)
+        bodies = sorted(doc.attachment_body(name)
+                        for name in doc.attachment_names())
+        self.assertEqual(bodies, [b"\x00\x01" * 1000, b"Some text"])
+        doc.close()
+
+    def test_use_after_resave(self):
+        doc = XMindDocument.open(self.tfname)
+        doc.get_first_sheet().get_root_topic().add_subtopic("Added")
+        doc.build_search_index()
+        doc.save(self.tfname)
+        self.assertEqual(doc.attachments.archive.filename, self.tfname)
+        self.assertTrue(doc._load_search_index() is not None)
+        output = io.BytesIO()
+        doc.save_incremental(output)
+        doc.close()
+        reread = XMindDocument.from_bytes(output.getvalue())
+        self.assertEqual(sorted(reread.attachment_body(name)
+                                for name in reread.attachment_names()),
+                         [b"\x00\x01" * 1000, b"Some text"])
+        self.assertEqual(len(reread.search("added")), 1)
+
+class StatsTestCase(unittest.TestCase):
+    def test_open_traverse_save(self):
+        events = []
+        stats = XMindStats(lambda name, seconds: events.append(name),
+                           count_elements = True)
+        doc = open_doc("simple.xmind", stats = stats)
+        counters = stats.counters
+        self.assertTrue(counters["bytes_inflated"] > 0)
+        self.assertTrue(counters["elements_parsed"] > 13)
+        self.assertEqual(events, ["inflate", "parse"] * 2)
+
+        for topic in doc.get_first_sheet().get_root_topic().get_subtopics():
+            topic.get_title()
+        self.assertTrue(counters["lookups"] > 4)
+        self.assertEqual(counters["create_child"], 0)
+
+        root = doc.get_first_sheet().get_root_topic()
+        root.add_subtopic("New")
+        self.assertEqual(counters["create_child"], 2)
+        self.assertEqual(counters["xpath"], 2)     # used ids reserved
+        root.add_subtree(("Tree", ["A", {"title": "B", "label": "x"}]))
+        self.assertEqual(counters["create_child"], 12)
+        doc.to_bytes()
+        self.assertTrue(counters["bytes_written"] > 0)
+        self.assertEqual(events[-3:], ["serialize", "serialize", "save"])
+        self.assertEqual(set(stats.as_dict()["timings"]),
+                         set(["inflate", "parse", "serialize", "save"]))
+
+    def test_attachments_and_reset(self):
+        doc = XMindDocument.create("Sheet", "Root")
+        doc.get_first_sheet().get_root_topic().set_attachment(b"abc", ".txt")
+        doc = XMindDocument.from_bytes(doc.to_bytes())
+        plain = XMindStats()
+        XMindDocument.from_bytes(doc.to_bytes(), stats = plain)
+        self.assertEqual(plain.counters["elements_parsed"], 0)
+        self.assertTrue(plain.counters["bytes_inflated"] > 0)
+        doc.stats = stats = XMindStats()
+        doc.attachment_body(doc.attachment_names()[0])
+        self.assertEqual(stats.counters["bytes_inflated"], 3)
+        self.assertTrue("attachments" in stats.timings)
+        stats.reset()
+        self.assertEqual(stats.as_dict(), {"counters": {}, "timings": {}})
+
+    def test_disabled(self):
+        doc = open_doc("simple.xmind")
+        self.assertTrue(doc.stats is None)
+        doc.to_bytes()
+
+class WrapperTestCase(unittest.TestCase):
+    def test_equality(self):
+        doc = open_doc("simple.xmind")
+        first = list(doc.get_first_sheet().get_root_topic().get_subtopics())
+        second = list(doc.get_first_sheet().get_root_topic().get_subtopics())
+        self.assertFalse(first[0] is second[0])
+        self.assertEqual(first, second)
+        self.assertNotEqual(first[0], first[1])
+        self.assertEqual(len(set(first + second)), 4)
+        self.assertEqual(doc.get_first_sheet(), doc.get_first_sheet())
+        self.assertNotEqual(first[0], doc.get_first_sheet())
+
+    def test_slots(self):
+        doc = open_doc("simple.xmind")
+        topic = doc.get_first_sheet().get_root_topic()
+        self.assertFalse(hasattr(topic, "__dict__"))
+        self.assertRaises(AttributeError, setattr, topic, "other", 1)
+
+    def test_cache(self):
+        doc = open_doc("simple.xmind", cache_wrappers = True)
+        root = doc.get_first_sheet().get_root_topic()
+        first = list(root.get_subtopics())
+        second = list(root.get_subtopics())
+        for a, b in zip(first, second):
+            self.assertTrue(a is b)
+        self.assertTrue(doc.get_topic_by_embedded_id("b1") is first[0])
+        self.assertTrue(doc.get_first_sheet().get_root_topic() is root)
+        new = root.add_subtopic("New")
+        self.assertTrue(list(root.get_subtopics())[-1] is new)
+
+class WalkTestCase(unittest.TestCase):
+    TREE = ("R", [("A", ["A1", ("A2", ["A21"])]),
+                  {"title": "D", "detached": True, "children": ["D1"]},
+                  "B"])
+
+    def _docs(self):
+        doc = XMindDocument.create("S", "S")
+        doc.get_first_sheet().get_root_topic().add_subtree(self.TREE)
+        return [doc, XMindDocument.from_bytes(doc.to_bytes())]
+
+    def _titles(self, items):
+        return [(topic.get_title(), depth, parent and parent.get_title())
+                for topic, depth, parent in items]
+
+    def test_orders(self):
+        for doc in self._docs():
+            sheet = doc.get_first_sheet()
+            root = list(sheet.get_root_topic().get_subtopics())[0]
+            self.assertEqual(self._titles(root.walk()), [
+                ("R", 0, None), ("A", 1, "R"), ("A1", 2, "A"),
+                ("A2", 2, "A"), ("A21", 3, "A2"), ("B", 1, "R"),
+                ("D", 1, "R"), ("D1", 2, "D")])
+            self.assertEqual(
+                [item[0] for item in self._titles(root.walk("post"))],
+                ["A1", "A21", "A2", "A", "B", "D1", "D", "R"])
+            self.assertEqual(
+                [item[0] for item in self._titles(root.walk("bfs"))],
+                ["R", "A", "B", "D", "A1", "A2", "D1", "A21"])
+            self.assertEqual(
+                [topic.get_title() for topic in root.iter_descendants()],
+                ["A", "A1", "A2", "A21", "B", "D", "D1"])
+            self.assertEqual(len(list(sheet.iter_all_topics())), 9)
+
+    def test_options(self):
+        for doc in self._docs():
+            root = doc.get_first_sheet().get_root_topic()
+            for order in ("pre", "post", "bfs"):
+                titles = sorted(item[0] for item in self._titles(
+                    root.walk(order, include_detached = False,
+                              max_depth = 2)))
+                self.assertEqual(titles, ["A", "B", "R", "S"])
+            self.assertRaises(ValueError, root.walk, "random")
+
+class SearchTestCase(unittest.TestCase):
+    def _titles(self, topics):
+        return [topic.get_title() for topic in topics]
+
+    def test_queries(self):
+        doc = open_doc("simple.xmind")
+        self.assertEqual(self._titles(doc.search("subelemiątko")), [
+            "Subelemiątko %d/%d" % (i, j)
+            for i in range(1, 5) for j in range(1, 3)])
+        self.assertEqual(self._titles(doc.search("SUBELEMIĄTKO 2/1")),
+                         ["Subelemiątko 1/2", "Subelemiątko 2/1"])
+        self.assertEqual(self._titles(doc.search("elem* 3")),
+                         ["Elemiątko 3"])
+        self.assertEqual(self._titles(doc.search("3 sub*")),
+                         ["Subelemiątko 3/1", "Subelemiątko 3/2"])
+        self.assertEqual(self._titles(doc.search("help info")), ["Projekty"])
+        self.assertEqual(self._titles(doc.search("elemiątko 4")),
+                         ["Elemiątko 4"])  # label
+        self.assertEqual(doc.search("nothing"), [])
+        self.assertEqual(doc.search(""), [])
+
+    def test_persisted(self):
+        doc = open_doc("simple.xmind")
+        self.assertEqual(len(doc.search("projekty")), 1)
+        data = doc.to_bytes()
+
+        reopened = XMindDocument.from_bytes(data)
+        index = reopened._load_search_index()
+        self.assertTrue(index is not None)
+        self.assertEqual(len(reopened.search("subel*")), 8)
+
+        # saved again without searching, index is kept
+        self.assertTrue(XMindDocument.from_bytes(reopened.to_bytes())
+                        ._load_search_index() is not None)
+
+        fd, name = tempfile.mkstemp(".xmind")
+        os.close(fd)
+        try:
+            XMindDocument.from_bytes(data).save_incremental(name)
+            self.assertTrue(XMindDocument.open(name)._load_search_index()
+                            is not None)
+        finally:
+            os.remove(name)
+
+    def test_modified(self):
+        doc = XMindDocument.from_bytes(open_doc("simple.xmind").to_bytes())
+        doc.build_search_index()
+        doc.get_first_sheet().get_root_topic().add_subtopic("Zupełnie nowy")
+        self.assertEqual(self._titles(doc.search("nowy")), ["Zupełnie nowy"])
+        doc.get_first_sheet().get_root_topic().set_title("Inny")
+        self.assertEqual(doc.search("projekty"), [])
+
+        data = doc.to_bytes()
+        reopened = XMindDocument.from_bytes(data)
+        self.assertEqual(len(reopened.search("inny")), 1)
+        reopened.get_first_sheet().get_root_topic().set_title("Trzeci")
+        self.assertTrue(reopened._load_search_index() is None)
+        self.assertEqual(reopened.search("inny"), [])
+
+class LazySheetsTestCase(unittest.TestCase):
+    def setUp(self):
+        doc = XMindDocument.create("First & one", "Root 0")
+        for i in range(1, 4):
+            sheet = doc.create_sheet("Sheet %d" % i, "Root %d" % i)
+            sheet.get_root_topic().add_subtree(
+                ("Child %d" % i, ["Grandchild"]))
+        self.data = {
+            "pretty": doc.to_bytes(),
+            "compact": doc.to_bytes(pretty_print = False),
+        }
+
+    def _root_titles(self, doc):
+        return [sheet.get_root_topic().get_title()
+                for sheet in doc.get_all_sheets()]
+
+    def test_get_sheet(self):
+        for data in self.data.values():
+            doc = XMindDocument.from_bytes(data, lazy_sheets = True)
+            self.assertEqual(len(doc._doc_tag), 0)
+            sheet = doc.get_sheet(title = "Sheet 2")
+            self.assertEqual(sheet.get_root_topic().get_title(), "Root 2")
+            self.assertEqual(len(doc._doc_tag), 1)
+            self.assertEqual(doc.get_sheet(title = "First & one")
+                             .get_root_topic().get_title(), "Root 0")
+            self.assertEqual(doc.get_sheet(index = -1).get_title(),
+                             "Sheet 3")
+            self.assertEqual(len(doc._doc_tag), 3)
+            self.assertEqual(doc.get_sheet(title = "Missing"), None)
+            self.assertEqual(doc.get_sheet(index = 4), None)
+            self.assertRaises(ValueError, doc.get_sheet)
+            # loaded sheets are kept in document order
+            self.assertEqual(self._root_titles(doc),
+                             ["Root %d" % i for i in range(4)])
+
+    def test_eager_get_sheet(self):
+        doc = XMindDocument.from_bytes(self.data["pretty"])
+        self.assertEqual(doc.get_sheet(title = "Sheet 1").get_root_topic()
+                         .get_title(), "Root 1")
+        self.assertEqual(doc.get_sheet(index = -4).get_title(),
+                         "First & one")
+        self.assertEqual(doc.get_sheet(index = 4), None)
+
+    def test_full_load(self):
+        for data in self.data.values():
+            doc = XMindDocument.from_bytes(data, lazy_sheets = True)
+            doc.get_sheet(index = 2).set_title("Changed")
+            self.assertEqual(doc.get_topic_by_id(
+                doc.get_sheet(index = 3).get_root_topic().topic_tag.get("id"))
+                .get_title(), "Root 3")
+            self.assertEqual(len(doc.doc_tag), 4)
+            reopened = XMindDocument.from_bytes(doc.to_bytes())
+            self.assertEqual([sheet.get_title()
+                              for sheet in reopened.get_all_sheets()],
+                             ["First & one", "Sheet 1", "Changed", "Sheet 3"])
+
+    def test_incremental_save(self):
+        doc = XMindDocument.from_bytes(self.data["pretty"], lazy_sheets = True)
+        doc.get_first_sheet().get_title()
+        output = io.BytesIO()
+        doc.save_incremental(output)
+        self.assertTrue(doc._lazy_content is not None)
+        self.assertEqual(self._root_titles(
+            XMindDocument.from_bytes(output.getvalue())),
+            ["Root %d" % i for i in range(4)])
+
+    def test_fallback(self):
+        self.assertEqual(LazyContent.scan(b"<other/>"), None)
+        self.assertEqual(LazyContent.scan(
+            b"<xmap-content><sheet><sheet></sheet></xmap-content>"), None)
+        sheets = b"<sheet><title>S1</title></sheet><sheet></sheet>"
+        self.assertNotEqual(LazyContent.scan(
+            b"<?xml version='1.0'?>\n<xmap-content>\n" + sheets
+            + b"\n</xmap-content>\n"), None)
+        for inside in [
+                b"<!-- <sheet><title>Ghost</title></sheet> -->" + sheets,
+                b"<![CDATA[ <sheet></sheet> ]]>" + sheets,
+                b"<?pi <sheet></sheet>?>" + sheets,
+                b"<extra/>" + sheets,
+                sheets + b"<extra/>",
+                b"<sheet></sheet>text<sheet></sheet>"]:
+            self.assertEqual(LazyContent.scan(
+                b"<xmap-content>" + inside + b"</xmap-content>"), None)
+
+    def test_fallback_map(self):
+        data = self.data["compact"]
+        source = zipfile.ZipFile(io.BytesIO(data))
+        content = source.read("content.xml")
+        position = content.rindex(b"</xmap-content>")
+        content = content[:position] \
+            + b"<!-- <sheet><title>Ghost</title></sheet> --><extra/>" \
+            + content[position:]
+        output = io.BytesIO()
+        with zipfile.ZipFile(output, "w") as target:
+            for name in source.namelist():
+                target.writestr(name, content if name == "content.xml"
+                                else source.read(name))
+        doc = XMindDocument.from_bytes(output.getvalue(), lazy_sheets = True)
+        self.assertEqual([sheet.get_title() for sheet in doc.get_all_sheets()],
+                         ["First & one", "Sheet 1", "Sheet 2", "Sheet 3"])
+        saved = XMindDocument.from_bytes(doc.to_bytes())
+        self.assertEqual(len(saved.doc_tag.findall(saved.full_name("extra"))),
+                         1)
+
+class TopicIndexTestCase(unittest.TestCase):
+    def test_parsed(self):
+        doc = open_doc("simple.xmind")
+        topic = doc.get_topic_by_embedded_id("a2a1")
+        self.assertEqual(topic.get_title(), "Subelemiątko 2/1")
+        same = doc.get_topic_by_id(topic.topic_tag.get("id"))
+        self.assertTrue(same.topic_tag is topic.topic_tag)
+        self.assertEqual(doc.get_topic_by_embedded_id("nonexistent"), None)
+
+    def test_updates(self):
+        doc = XMindDocument.create("Sheet", "Root")
+        root = doc.get_first_sheet().get_root_topic()
+        first = root.add_subtopic("First", "e1")
+        self.assertEqual(doc.get_topic_by_embedded_id("e1").get_title(), "First")
+        child = first.add_subtopic("Child", "e2")
+        self.assertEqual(doc.get_topic_by_embedded_id("e2").get_title(), "Child")
+        self.assertEqual(
+            doc.get_topic_by_id(root.topic_tag.get("id")).get_title(), "Root")
+        first.remove()
+        self.assertEqual(doc.get_topic_by_embedded_id("e1"), None)
+        self.assertEqual(doc.get_topic_by_id(child.topic_tag.get("id")), None)
+        self.assertEqual(list(root.get_subtopics()), [])
+        self.assertRaises(ValueError, root.remove)
+
+class ColumnsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.columns = open_doc("simple.xmind").to_arrays()
+
+    def test_columns(self):
+        columns = self.columns
+        self.assertEqual(len(columns), 13)
+        self.assertEqual(list(columns.parent),
+                         [-1, 0, 1, 1, 0, 4, 4, 0, 7, 7, 0, 10, 10])
+        self.assertEqual(list(columns.depth),
+                         [0, 1, 2, 2, 1, 2, 2, 1, 2, 2, 1, 2, 2])
+        self.assertEqual(columns.titles[columns.title[0]], "Projekty")
+        self.assertEqual(columns.titles[columns.title[5]], "Subelemiątko 2/1")
+        self.assertEqual(len(columns.titles), 13)
+        self.assertEqual([columns.label[i] for i in (0, 1, 4)], [-1, 0, 1])
+        self.assertEqual(columns.labels, ["1", "2", "3", "4"])
+        self.assertEqual(columns.has_marker("task-start"),
+                         [0, 0, 1, 1, 0, 1, 1, 0, 1, 1, 0, 1, 1])
+        self.assertEqual(columns.has_marker("other-people"),
+                         [0, 0, 1, 0, 0, 1, 0, 0, 1, 0, 0, 1, 0])
+        self.assertEqual(sum(columns.detached), 0)
+        self.assertEqual(columns.other_markers, {})
+
+    def test_subtree_sizes(self):
+        expected = [13, 3, 1, 1, 3, 1, 1, 3, 1, 1, 3, 1, 1]
+        self.assertEqual(list(self.columns.subtree_sizes()), expected)
+        if columns_module.numpy is None:
+            self.assertRaises(ImportError, self.columns.to_numpy)
+            return
+        arrays = self.columns.to_numpy()
+        self.assertEqual(arrays["subtree_size"].tolist(), expected)
+        self.assertEqual(arrays["title_length"][0], len("Projekty"))
+        self.assertEqual(int((arrays["depth"] == 2).sum()), 8)
@@ -4,12 +4,15 @@
 from __future__ import unicode_literals
 
 import unittest
+import io
 import zipfile
 import tempfile
 import os
 import re
 from lxml import objectify, etree
 from sample_maps import generate_simple
+from mekk.xmind import XMindDocument, StreamingXMindWriter
+from mekk.xmind import document
 import six
 
 def linewiseEnsureEqual(testcase, expected, obtained,
@@ -38,7 +41,7 @@ def linewiseEnsureEqual(testcase, expected, obtained,
         #    self.fail("File %s mismatch.\nOriginal:\n%s\nCreated:\n%s" % (name, pat, got))
 
     if ignoreInternalId:
-        re_patch_id = re.compile('id="bfbf\d+"')
+        re_patch_id = re.compile(r'id="bfbf\d+"')
 
     for i in range(0, min(obtainedsize, expectedsize)):
         obt = obtainedlines[i]
@@ -85,6 +88,14 @@ def linewiseEnsureEqual(testcase, expected, obtained,
             replines = expectedlines[obtainedsize:]
         testcase.fail("Missing %d line(s): %s" % (expectedsize-obtainedsize, "\n".join(expectedlines[obtainedsize:])))
 
+def _canonical_text(obj):
+    """
+    Pretty-printed text of obj with namespace declarations and attributes
+    in canonical (C14N) order.
+    """
+    canonical = etree.fromstring(etree.tostring(obj, method="c14n"))
+    return etree.tostring(canonical, pretty_print=True).decode("utf-8")
+
 class MapCompareBase(object):
     """
     Bazowa klasa dla testów porównujących wygenerowaną mapę z wzorcem.
@@ -103,6 +114,7 @@ class MapCompareBase(object):
             pf = os.path.join("tests", pf)
         self.pattern = zipfile.ZipFile(pf, "r")
         fd, self.tfname = tempfile.mkstemp(".zip")
+        os.close(fd)
         self.generate().save(self.tfname)
         self.generated = zipfile.ZipFile(self.tfname, "r")
     def tearDown(self):
@@ -128,8 +140,8 @@ class MapCompareBase(object):
         # if fails, another method may be needed
         patobj = objectify.fromstring(self.pattern.read(name))
         gotobj = objectify.fromstring(self.generated.read(name))
-        pat = etree.tostring(patobj, pretty_print=True)
-        got = etree.tostring(gotobj, pretty_print=True)
+        pat = _canonical_text(patobj)
+        got = _canonical_text(gotobj)
         linewiseEnsureEqual(self, pat, got,
                             ignoreInternalId = True,
                             showLongerPart = True)
@@ -139,3 +151,344 @@ class SimpleMapTestCase(MapCompareBase, unittest.TestCase):
     def generate(self):
         return generate_simple()
 
+
+class ManifestTestCase(unittest.TestCase):
+    def test_attachment_entries(self):
+        doc = XMindDocument.create("Sheet", "Root")
+        root = doc.get_first_sheet().get_root_topic()
+        root.add_subtopic("Text").set_attachment(b"Some text", ".txt")
+        root.add_subtopic("Image").set_attachment(b"\x89PNG", ".png")
+        root.add_subtopic("Other").set_attachment(b"???", ".unknownext")
+        fd, tfname = tempfile.mkstemp(".xmind")
+        os.close(fd)
+        try:
+            doc.save(tfname)
+            with zipfile.ZipFile(tfname, "r") as saved:
+                manifest = etree.fromstring(saved.read("META-INF/manifest.xml"))
+        finally:
+            os.remove(tfname)
+        entries = dict((entry.get("full-path"), entry.get("media-type"))
+                       for entry in manifest)
+        self.assertEqual(entries["content.xml"], "text/xml")
+        types = sorted(media_type for path, media_type in entries.items()
+                       if path.startswith("attachments/"))
+        self.assertEqual(types, ["", "image/png", "text/plain"])
+
+class SaveOptionsTestCase(unittest.TestCase):
+    def test_deflated_compact(self):
+        fd, tfname = tempfile.mkstemp(".xmind")
+        os.close(fd)
+        try:
+            generate_simple().save(tfname, compression = zipfile.ZIP_DEFLATED,
+                                   compresslevel = 9, pretty_print = False)
+            with zipfile.ZipFile(tfname, "r") as saved:
+                info = saved.getinfo("content.xml")
+                self.assertEqual(info.compress_type, zipfile.ZIP_DEFLATED)
+                self.assertTrue(info.compress_size < info.file_size)
+                content = saved.read("content.xml")
+            self.assertFalse(b"\n  <sheet" in content)
+            doc = XMindDocument.open(tfname)
+            self.assertEqual(
+                doc.get_first_sheet().get_root_topic().get_title(), "Projekty")
+            doc.close()
+        finally:
+            os.remove(tfname)
+
+class _UnseekableStream(object):
+    """
+    Write-only stream without seek/tell (like pipe or socket file).
+    """
+    def __init__(self):
+        self.buffer = io.BytesIO()
+    def write(self, data):
+        return self.buffer.write(data)
+    def flush(self):
+        pass
+
+class InMemoryTestCase(unittest.TestCase):
+    def test_bytes_roundtrip(self):
+        data = generate_simple().to_bytes()
+        self.assertTrue(zipfile.is_zipfile(io.BytesIO(data)))
+        doc = XMindDocument.from_bytes(data)
+        self.assertEqual(
+            doc.get_first_sheet().get_root_topic().get_title(), "Projekty")
+
+    def test_unseekable_streams(self):
+        stream = _UnseekableStream()
+        generate_simple().save(stream)
+        source = _UnseekableStream()
+        source.read = io.BytesIO(stream.buffer.getvalue()).read
+        doc = XMindDocument.open(source)
+        self.assertEqual(doc.get_first_sheet().get_title(), "Główny")
+
+class IncrementalSaveTestCase(unittest.TestCase):
+    def setUp(self):
+        doc = XMindDocument.create("Sheet", "Root")
+        root = doc.get_first_sheet().get_root_topic()
+        root.add_subtopic("Text").set_attachment(b"Some text " * 100, ".txt")
+        root.set_style(doc.create_topic_style(fill = "#37D02B"))
+        fd, self.source = tempfile.mkstemp(".xmind")
+        os.close(fd)
+        fd, self.output = tempfile.mkstemp(".xmind")
+        os.close(fd)
+        doc.save(self.source, compression = zipfile.ZIP_DEFLATED)
+
+    def tearDown(self):
+        os.remove(self.source)
+        os.remove(self.output)
+
+    def _infos(self, name):
+        with zipfile.ZipFile(name, "r") as archive:
+            self.assertEqual(archive.testzip(), None)
+            return dict((info.filename, info) for info in archive.infolist())
+
+    def test_dirty_tracking(self):
+        doc = XMindDocument.open(self.source)
+        self.assertFalse(doc.is_dirty())
+        doc.create_topic_style(fill = "#FFFFFF")
+        self.assertTrue(doc.is_dirty("styles.xml"))
+        self.assertFalse(doc.is_dirty("content.xml"))
+        doc.get_first_sheet().get_root_topic().set_title("Changed")
+        self.assertTrue(doc.is_dirty("content.xml"))
+        doc.close()
+
+    def test_changed_title(self):
+        doc = XMindDocument.open(self.source)
+        doc.get_first_sheet().get_root_topic().set_title("Changed")
+        doc.save_incremental(self.output)
+        doc.close()
+
+        before = self._infos(self.source)
+        after = self._infos(self.output)
+        self.assertEqual(sorted(before), sorted(after))
+        self.assertEqual(after["content.xml"].compress_type, zipfile.ZIP_STORED)
+        for name in before:
+            if name.startswith("attachments/") or name == "styles.xml":
+                self.assertEqual(after[name].compress_type,
+                                 zipfile.ZIP_DEFLATED)
+                self.assertEqual(after[name].CRC, before[name].CRC)
+
+        doc = XMindDocument.open(self.output)
+        root = doc.get_first_sheet().get_root_topic()
+        self.assertEqual(root.get_title(), "Changed")
+        topic = list(root.get_subtopics())[0]
+        name = topic.get_link()[len("xap:attachments/"):]
+        self.assertEqual(doc.attachment_body(name), b"Some text " * 100)
+        doc.close()
+
+    def test_new_attachment(self):
+        doc = XMindDocument.open(self.source)
+        root = doc.get_first_sheet().get_root_topic()
+        root.add_subtopic("Other").set_attachment(b"Other", ".txt")
+        doc.save_incremental(self.output)
+        self.assertRaises(ValueError, doc.save_incremental, self.source)
+        doc.close()
+        with zipfile.ZipFile(self.output, "r") as saved:
+            manifest = saved.read("META-INF/manifest.xml")
+        self.assertEqual(manifest.count(b"attachments/"), 2)
+
+    def test_attachment_without_zip64(self):
+        doc = XMindDocument.open(self.source)
+        doc.save(self.output)
+        doc.close()
+        for name, info in self._infos(self.output).items():
+            if name.startswith("attachments/"):
+                self.assertFalse(info.extra.startswith(b"\x01\x00"))
+                self.assertEqual(info.extract_version, zipfile.DEFAULT_VERSION)
+
+    def test_without_raw_copy(self):
+        saved = document.RAW_COPY_SUPPORTED
+        document.RAW_COPY_SUPPORTED = False
+        try:
+            doc = XMindDocument.open(self.source)
+            doc.get_first_sheet().get_root_topic().set_title("Changed")
+            doc.save_incremental(self.output)
+            doc.close()
+        finally:
+            document.RAW_COPY_SUPPORTED = saved
+
+        before = self._infos(self.source)
+        after = self._infos(self.output)
+        self.assertEqual(sorted(before), sorted(after))
+        for name in before:
+            if name.startswith("attachments/"):
+                self.assertEqual(after[name].compress_type,
+                                 zipfile.ZIP_DEFLATED)
+                self.assertEqual(after[name].CRC, before[name].CRC)
+
+class BulkBuildTestCase(unittest.TestCase):
+    TREE = {
+        "title": "Root",
+        "note": "Line 1\nLine 2",
+        "children": [
+            "Plain",
+            ("Tuple", ["Child 1", ("Child 2",)]),
+            {"title": "Dict", "label": "lbl", "markers": ["task-start"],
+             "link": "http://mekk.waw.pl", "embedded_id": "e1",
+             "children": [{"title": "Detached", "detached": True}]},
+        ]}
+
+    def _normalized(self, doc):
+        text = etree.tostring(doc.doc_tag).decode("utf-8")
+        return re.sub(r'id="[0-9a-f]+"', 'id=""', text)
+
+    def _manual(self):
+        doc = XMindDocument.create("Root", "Root")
+        root = doc.get_first_sheet().get_root_topic()
+        root.set_note("Line 1\nLine 2")
+        root.add_subtopic("Plain")
+        topic = root.add_subtopic("Tuple")
+        topic.add_subtopic("Child 1")
+        topic.add_subtopic("Child 2")
+        topic = root.add_subtopic("Dict", "e1")
+        topic.set_label("lbl")
+        topic.add_marker("task-start")
+        topic.set_link("http://mekk.waw.pl")
+        topic.add_subtopic("Detached", detached = True)
+        return doc
+
+    def test_create_sheet_from(self):
+        doc = XMindDocument.create()
+        self.assertEqual(len(doc.doc_tag), 0)
+        self.assertEqual(len(doc.styles_tag), 0)
+        doc.create_sheet_from(self.TREE)
+        self.assertEqual(self._normalized(doc), self._normalized(self._manual()))
+        self.assertEqual(doc.get_topic_by_embedded_id("e1").get_label(), "lbl")
+
+    def test_add_subtree_parsed(self):
+        doc = XMindDocument.from_bytes(generate_simple().to_bytes())
+        root = doc.get_first_sheet().get_root_topic()
+        topic = root.add_subtree(self.TREE)
+        self.assertEqual(topic.get_note(), "Line 1\nLine 2")
+        self.assertEqual(
+            [t.get_title() for t in topic.get_subtopics()],
+            ["Plain", "Tuple", "Dict"])
+        dict_topic = list(topic.get_subtopics())[2]
+        self.assertEqual(list(dict_topic.get_markers()), ["task-start"])
+        self.assertEqual(
+            [t.get_title() for t in dict_topic.get_subtopics(detached = True)],
+            ["Detached"])
+        self.assertEqual(len(list(root.get_subtopics())), 5)
+        self.assertRaises(ValueError, root.add_subtree, 12)
+        self.assertRaises(ValueError, root.add_subtree,
+                          {"title": "A", "children": ["B", None, "C"]})
+
+class StreamingWriterTestCase(unittest.TestCase):
+    def _records(self, data):
+        return [(rec.title, rec.depth, rec.markers, rec.link, rec.label)
+                for rec in XMindDocument.iter_topics(io.BytesIO(data))]
+
+    def test_same_as_document(self):
+        doc = XMindDocument.create("Sheet", "Root")
+        root = doc.get_first_sheet().get_root_topic()
+        root.add_subtree(BulkBuildTestCase.TREE)
+        expected = doc.to_bytes()
+
+        output = io.BytesIO()
+        with StreamingXMindWriter(output) as writer:
+            writer.start_sheet("Sheet")
+            writer.start_topic("Root")
+            writer.start_topic("Root", note = "Line 1\nLine 2")
+            writer.start_topic("Plain")
+            writer.end_topic()
+            writer.start_topic("Tuple")
+            writer.start_topic("Child 1")
+            writer.end_topic()
+            writer.start_topic("Child 2")
+            writer.end_topic()
+            writer.end_topic()
+            writer.start_topic("Dict", embedded_id = "e1", label = "lbl",
+                               markers = ["task-start"],
+                               link = "http://mekk.waw.pl")
+            writer.start_topic("Detached", detached = True)
+        data = output.getvalue()
+
+        self.assertEqual(self._records(data), self._records(expected))
+        with zipfile.ZipFile(io.BytesIO(data)) as saved:
+            self.assertEqual(sorted(saved.namelist()),
+                             ["META-INF/manifest.xml", "content.xml",
+                              "meta.xml", "styles.xml"])
+        parsed = XMindDocument.from_bytes(data)
+        topic = parsed.get_topic_by_embedded_id("e1")
+        self.assertEqual(
+            [t.get_title() for t in topic.get_subtopics(detached = True)],
+            ["Detached"])
+        self.assertEqual(topic.get_note(), None)
+        self.assertEqual(parsed.get_first_sheet().get_title(), "Sheet")
+
+    def test_records(self):
+        output = io.BytesIO()
+        with StreamingXMindWriter(output) as writer:
+            style = writer.create_topic_style(fill = "#37D02B")
+            writer.write_records([
+                (0, "Root"),
+                (1, "A", {"style": style}),
+                (2, "A1"),
+                (1, "B"),
+                (0, "Second"),
+                (1, "C"),
+            ])
+        parsed = XMindDocument.from_bytes(output.getvalue())
+        sheets = list(parsed.get_all_sheets())
+        self.assertEqual([s.get_title() for s in sheets], ["Root", "Second"])
+        root = sheets[0].get_root_topic()
+        a_topic, b_topic = list(root.get_subtopics())
+        self.assertEqual(a_topic.topic_tag.get("style-id"), style.get_id())
+        self.assertEqual([t.get_title() for t in a_topic.get_subtopics()],
+                         ["A1"])
+        self.assertEqual(b_topic.get_title(), "B")
+
+    def test_bad_order(self):
+        writer = StreamingXMindWriter(io.BytesIO())
+        self.assertRaises(ValueError, writer.write_records, [(1, "X")])
+        writer.start_sheet("S")
+        writer.start_topic("R")
+        writer.start_topic("D", detached = True)
+        writer.end_topic()
+        self.assertRaises(ValueError, writer.start_topic, "A")
+        writer.close()
+
+    def test_failure_removes_output(self):
+        tmpdir = tempfile.mkdtemp()
+        name = os.path.join(tmpdir, "partial.xmind")
+        try:
+            def write():
+                with StreamingXMindWriter(name) as writer:
+                    writer.start_sheet("S")
+                    writer.start_topic("Root")
+                    raise KeyError("source failed")
+            self.assertRaises(KeyError, write)
+            self.assertFalse(os.path.exists(name))
+        finally:
+            os.rmdir(tmpdir)
+
+class StyleInterningTestCase(unittest.TestCase):
+    def _style_count(self, doc):
+        return len(list(doc.styles_tag.iter(
+            "style", "{urn:xmind:xmap:xmlns:style:2.0}style")))
+
+    def test_created(self):
+        doc = XMindDocument.create("Sheet", "Root")
+        first = doc.create_topic_style(fill = "#37D02B")
+        self.assertTrue(doc.create_topic_style("#37D02B") is first)
+        other = doc.create_topic_style(fill = "#37D02B", line_width = "2pt")
+        self.assertNotEqual(first.get_id(), other.get_id())
+        self.assertEqual(self._style_count(doc), 2)
+
+    def test_parsed(self):
+        doc = XMindDocument.from_bytes(generate_simple().to_bytes())
+        existing = doc.get_first_sheet().get_root_topic()
+        existing = list(existing.get_subtopics())[0].topic_tag.get("style-id")
+        self.assertEqual(doc.create_topic_style(fill = "#37D02B").get_id(),
+                         existing)
+        self.assertEqual(self._style_count(doc), 1)
+        self.assertFalse(doc.is_dirty())
+
+    def test_streaming(self):
+        output = io.BytesIO()
+        with StreamingXMindWriter(output) as writer:
+            style = writer.create_topic_style(fill = "#37D02B")
+            self.assertTrue(writer.create_topic_style(fill = "#37D02B")
+                            is style)
+        parsed = XMindDocument.from_bytes(output.getvalue())
+        self.assertEqual(self._style_count(parsed), 1)
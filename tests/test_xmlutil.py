@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import unittest
+from lxml import etree
+from mekk.xmind import xmlutil
+from mekk.xmind.xmlutil import XmlHelper, InternalStructureException, \
+    NS_CONTENT, CONTENT_NSMAP
+
+PARSED = """<xmap-content xmlns="%s" version="2.0">
+  <topic id="1"><title>A</title>
+    <children>
+      <topics type="attached"><topic id="2"/><topic id="3"/></topics>
+      <topics type="detached"><topic id="4"/></topics>
+    </children>
+  </topic>
+</xmap-content>""" % NS_CONTENT
+
+class LookupTestCase(unittest.TestCase):
+    def setUp(self):
+        self.parsed = XmlHelper(False)
+        self.root = etree.XML(PARSED)
+
+    def test_parsed_lookups(self):
+        topic = self.parsed.find_only_child(self.root, "topic")
+        self.assertEqual(topic.get("id"), "1")
+        self.assertEqual(self.parsed.find_only_child(topic, "title").text, "A")
+        self.assertEqual(
+            self.parsed.find_only_child(topic, "notes", required = False),
+            None)
+        self.assertRaises(InternalStructureException,
+                          self.parsed.find_only_child, topic, "notes")
+        children = self.parsed.find_only_child(topic, "children")
+        detached = self.parsed.find_child_with_attribute(
+            children, "topics", "type", "detached")
+        self.assertEqual(
+            [t.get("id") for t in self.parsed.find_children(detached, "topic")],
+            ["4"])
+
+    def test_xpath_fallback(self):
+        topic = self.parsed.find_only_child(self.root, "topic")
+        found = self.parsed.find_children(
+            topic, "children/xm:topics[@type='attached']/xm:topic")
+        self.assertEqual([t.get("id") for t in found], ["2", "3"])
+
+    def test_created_lookups(self):
+        creating = XmlHelper(True)
+        root = etree.Element("xmap-content", nsmap = CONTENT_NSMAP)
+        topic = creating.create_child(root, "topic")
+        creating.create_child(topic, "xhtml:p")
+        self.assertTrue(creating.find_only_child(root, "topic") is topic)
+        self.assertEqual(len(creating.find_children(topic, "xhtml:p")), 1)
+        self.assertEqual(creating.find_or_create_child(topic, "title").tag,
+                         "title")
+
+    def test_xpath_cache(self):
+        xmlutil.compiled_xpath.cache_clear()
+        first = xmlutil.compiled_xpath("./xm:topic")
+        self.assertTrue(xmlutil.compiled_xpath("./xm:topic") is first)
+        for i in range(xmlutil.XPATH_CACHE_SIZE + 1):
+            xmlutil.compiled_xpath("./xm:topic[%d]" % i)
+            # recently used expression stays cached
+            self.assertTrue(xmlutil.compiled_xpath("./xm:topic") is first)
+        self.assertEqual(xmlutil.compiled_xpath.cache_info().currsize,
+                         xmlutil.XPATH_CACHE_SIZE)